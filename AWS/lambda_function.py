@@ -1,10 +1,15 @@
 import json
 import logging
 import os
+import time
 import uuid
 from datetime import datetime
+from decimal import Decimal
+from urllib.parse import unquote_plus
 import boto3
 
+from media_probe import probe_object
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -12,37 +17,83 @@ logger.setLevel(logging.INFO)
 
 dynamo = boto3.resource("dynamodb")
 table  = dynamo.Table(os.environ["JOBS_TABLE"])
+s3     = boto3.client("s3")
+
+
+def probe(bucket, key):
+    """Media metadata and keyframe index for the job record; empty if probing fails."""
+    try:
+        meta, keyframes = probe_object(s3, bucket, key)
+    except Exception as e:
+        logger.warning("Could not probe s3://%s/%s: %s", bucket, key, e)
+        return {}
+    if keyframes:
+        meta["KeyframeIndex"] = keyframes
+    # DynamoDB wants Decimal, not float
+    return json.loads(json.dumps(meta), parse_float=Decimal)
+
+
+def log_span(trace_id, span_id, name, start, **attrs):
+    """
+    Log a finished span as JSON in the format workers write to their trace
+    files, so CloudWatch exports can be rendered with tracing.py.
+    """
+    end = time.time()
+    logger.info(json.dumps({
+        "trace_id": trace_id, "span_id": span_id, "parent_id": None,
+        "name": name, "start": start, "end": end, "duration": end - start,
+        "service": "ingest-lambda", "status": "ok", "attrs": attrs,
+    }))
+
+
+def build_job(rec):
+    start     = time.time()
+    # W3C trace context; workers continue this trace for every stage of the job
+    trace_id  = os.urandom(16).hex()
+    span_id   = os.urandom(8).hex()
+
+    bucket    = rec["s3"]["bucket"]["name"]
+    # keys in S3 event notifications are URL-encoded
+    input_key = unquote_plus(rec["s3"]["object"]["key"])
+
+    filename = os.path.basename(input_key) 
+    
+    if "_" in filename:
+        name_after_underscore = filename.split("_", 1)[1]
+    else:
+        name_after_underscore = filename
+
+    job_id  = str(uuid.uuid4())
+    now_iso = datetime.utcnow().isoformat()
+
+    logger.info(
+        "Processing S3 key %s → job_id %s (Name: %s)",
+        input_key, job_id, name_after_underscore
+    )
+
+    item = {
+        "JobId":        job_id,
+        "InputKey":     input_key,
+        "Name":         name_after_underscore,  
+        # No OutputFormat / Resolution / VideoCodec: uploads don't choose a target,
+        # so the workers' command-line target applies
+        "Status":       "PENDING",
+        "CreatedAt":    now_iso,
+        "TraceParent":  f"00-{trace_id}-{span_id}-01"
+    }
+    # SizeBytes, Container, Probe{...} and KeyframeIndex for planning downstream
+    item.update(probe(bucket, input_key))
+    log_span(trace_id, span_id, "ingest", start, job_id=job_id, key=input_key, probed="Probe" in item)
+    return item
+
 
 def lambda_handler(event, context):
     logger.info("Received event: %s", json.dumps(event))
 
-    for rec in event.get("Records", []):
-        input_key = rec["s3"]["object"]["key"]
-
-        filename = os.path.basename(input_key) 
-        
-        if "_" in filename:
-            name_after_underscore = filename.split("_", 1)[1]
-        else:
-            name_after_underscore = filename
-
-        job_id  = str(uuid.uuid4())
-        now_iso = datetime.utcnow().isoformat()
-
-        logger.info(
-            "Processing S3 key %s → job_id %s (Name: %s)",
-            input_key, job_id, name_after_underscore
-        )
-
-        table.put_item(Item={
-            "JobId":        job_id,
-            "InputKey":     input_key,
-            "Name":         name_after_underscore,  
-            "OutputFormat": "mp4",                  
-            "Resolution":   "1280x720",             
-            "VideoCodec":   "libx264",              
-            "Status":       "PENDING",
-            "CreatedAt":    now_iso
-        })
+    records = event.get("Records", [])
+    # batch_writer groups puts into BatchWriteItem calls of up to 25 items
+    with table.batch_writer() as batch:
+        for rec in records:
+            batch.put_item(Item=build_job(rec))
 
     return {"status": "OK"}
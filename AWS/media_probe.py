@@ -0,0 +1,246 @@
+"""
+Probe a video in S3 from ranged reads of its header/index.
+
+For MP4/MOV the `moov` box is located with a few small range requests
+(skipping `mdat` without reading it) and parsed for duration, resolution,
+codecs, frame rate and the keyframe (sync sample) table. Other containers
+fall back to ffprobe over a presigned URL when an ffprobe binary is
+available (e.g. from a Lambda layer), which also reads by range.
+"""
+import os
+import json
+import struct
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+HEAD_BYTES     = 64 * 1024
+MAX_MOOV_BYTES = 32 * 1024 * 1024
+MAX_KEYFRAMES  = 5000
+FFPROBE_PATH   = os.getenv("FFPROBE_PATH", "/opt/bin/ffprobe")
+
+MP4_EXTENSIONS = {".mp4", ".mov", ".m4v", ".3gp"}
+
+FOURCC_CODECS = {
+    "avc1": "h264", "avc3": "h264",
+    "hvc1": "hevc", "hev1": "hevc",
+    "vp09": "vp9",  "av01": "av1",
+    "mp4v": "mpeg4",
+    "mp4a": "aac",  "ac-3": "ac3", "ec-3": "eac3", "Opus": "opus",
+}
+
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts"}
+
+
+def _read_range(s3, bucket, key, start, end):
+    resp = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    return resp["Body"].read()
+
+
+def _iter_boxes(data, offset=0, end=None):
+    """Yield (type, payload_start, box_end) for boxes in data[offset:end]."""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _find_moov(s3, bucket, key, file_size):
+    """Return the raw moov box payload, walking top-level boxes by range reads."""
+    if file_size < 8:
+        return None
+    head = _read_range(s3, bucket, key, 0, min(HEAD_BYTES, file_size) - 1)
+    offset = 0
+    while offset + 8 <= file_size:
+        if offset + 16 <= len(head):
+            chunk, base = head, 0
+        else:
+            chunk, base = _read_range(s3, bucket, key, offset, min(offset + 15, file_size - 1)), offset
+        size, kind = struct.unpack(">I4s", chunk[offset - base:offset - base + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", chunk[offset - base + 8:offset - base + 16])[0]
+            header = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header:
+            return None
+
+        if kind == b"moov":
+            if size > MAX_MOOV_BYTES:
+                logger.warning("moov box of %s is %d bytes; skipping index", key, size)
+                return None
+            if offset + size <= len(head):
+                return head[offset + header:offset + size]
+            return _read_range(s3, bucket, key, offset + header, offset + size - 1)
+        offset += size
+    return None
+
+
+def _full_box(payload):
+    """Split a FullBox payload into (version, body)."""
+    return payload[0], payload[4:]
+
+
+def _parse_trak(moov, start, end):
+    trak = {}
+    stack = [(start, end)]
+    while stack:
+        s, e = stack.pop()
+        for kind, ps, pe in _iter_boxes(moov, s, e):
+            body = moov[ps:pe]
+            if kind in CONTAINER_BOXES:
+                stack.append((ps, pe))
+            elif kind == b"mdhd":
+                version, b = _full_box(body)
+                if version == 1:
+                    trak["timescale"], trak["duration"] = struct.unpack(">IQ", b[16:28])
+                else:
+                    trak["timescale"], trak["duration"] = struct.unpack(">II", b[8:16])
+            elif kind == b"hdlr":
+                trak["handler"] = body[8:12].decode("latin-1")
+            elif kind == b"stsd":
+                # first sample entry: size(4) + format(4)
+                trak["fourcc"] = body[12:16].decode("latin-1")
+                # a visual sample entry holds the coded width/height 24 bytes into its body
+                # (tkhd has the display size, after pixel aspect ratio and without rotation)
+                if len(body) >= 44:
+                    trak["width"], trak["height"] = struct.unpack(">HH", body[40:44])
+            elif kind == b"stts":
+                count = struct.unpack(">I", body[4:8])[0]
+                trak["stts"] = [struct.unpack(">II", body[8 + i * 8:16 + i * 8]) for i in range(count)]
+            elif kind == b"stss":
+                count = struct.unpack(">I", body[4:8])[0]
+                trak["stss"] = struct.unpack(f">{count}I", body[8:8 + count * 4])
+            elif kind == b"stsz":
+                trak["samples"] = struct.unpack(">I", body[8:12])[0]
+    return trak
+
+
+def _keyframe_times(trak):
+    """Decode times (seconds) of the sync samples in a video track."""
+    timescale = trak.get("timescale") or 1
+    stts = trak.get("stts", [])
+    sync = trak.get("stss")
+    if sync is None:
+        # no stss box means every sample is a sync sample; too many to be useful
+        return []
+    times, i = [], 0
+    sample, dts = 1, 0
+    for count, delta in stts:
+        while i < len(sync) and sync[i] < sample + count:
+            times.append((dts + (sync[i] - sample) * delta) / timescale)
+            i += 1
+        sample += count
+        dts += count * delta
+    return times
+
+
+def probe_mp4(s3, bucket, key, file_size):
+    moov = _find_moov(s3, bucket, key, file_size)
+    if moov is None:
+        return None
+
+    info, keyframes = {}, []
+    for kind, ps, pe in _iter_boxes(moov):
+        if kind == b"mvhd":
+            version, b = _full_box(moov[ps:pe])
+            if version == 1:
+                timescale, duration = struct.unpack(">IQ", b[16:28])
+            else:
+                timescale, duration = struct.unpack(">II", b[8:16])
+            if timescale:
+                info["DurationSeconds"] = duration / timescale
+        elif kind == b"trak":
+            trak = _parse_trak(moov, ps, pe)
+            codec = FOURCC_CODECS.get(trak.get("fourcc"), trak.get("fourcc"))
+            if trak.get("handler") == "vide" and "VideoCodec" not in info:
+                info["VideoCodec"] = codec
+                info["Width"], info["Height"] = trak.get("width"), trak.get("height")
+                frames = trak.get("samples") or sum(c for c, _ in trak.get("stts", []))
+                seconds = trak.get("duration", 0) / (trak.get("timescale") or 1)
+                info["FrameCount"] = frames
+                if frames and seconds:
+                    info["FrameRate"] = round(frames / seconds, 3)
+                keyframes = _keyframe_times(trak)
+            elif trak.get("handler") == "soun" and "AudioCodec" not in info:
+                info["AudioCodec"] = codec
+    return info, keyframes
+
+
+def probe_ffprobe(s3, bucket, key):
+    """Probe any container with ffprobe reading a presigned URL by range."""
+    if not os.path.exists(FFPROBE_PATH):
+        return None
+    url = s3.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=300)
+    out = subprocess.run(
+        [FFPROBE_PATH, "-v", "error", "-show_format", "-show_streams", "-of", "json", url],
+        capture_output=True, text=True, timeout=60, check=True
+    ).stdout
+    data = json.loads(out)
+    info = {"DurationSeconds": float(data.get("format", {}).get("duration", 0) or 0)}
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and "VideoCodec" not in info:
+            info["VideoCodec"] = stream.get("codec_name")
+            info["Width"], info["Height"] = stream.get("width"), stream.get("height")
+            # the workers' remux check needs these; the MP4 box parser leaves them out
+            info["PixFmt"], info["Profile"] = stream.get("pix_fmt"), stream.get("profile")
+            rotation = (stream.get("tags") or {}).get("rotate") or 0
+            for side_data in stream.get("side_data_list") or []:
+                rotation = side_data.get("rotation") or rotation
+            info["Rotation"] = int(float(rotation)) % 360
+            num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+            if float(den or 1):
+                info["FrameRate"] = round(float(num) / float(den or 1), 3)
+        elif stream.get("codec_type") == "audio" and "AudioCodec" not in info:
+            info["AudioCodec"] = stream.get("codec_name")
+    return info, []
+
+
+def encode_keyframes(times):
+    """Compact index: comma-separated millisecond deltas, capped at MAX_KEYFRAMES."""
+    if len(times) > MAX_KEYFRAMES:
+        step = len(times) / MAX_KEYFRAMES
+        times = [times[int(i * step)] for i in range(MAX_KEYFRAMES)]
+    out, prev = [], 0
+    for t in times:
+        ms = int(round(t * 1000))
+        out.append(str(ms - prev))
+        prev = ms
+    return ",".join(out)
+
+
+def probe_object(s3, bucket, key):
+    """
+    Return (metadata dict, keyframe index string) for an S3 video.
+    Only the container header/index is read, never the whole file.
+    """
+    head = s3.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    ext = os.path.splitext(key)[1].lower()
+    meta = {"SizeBytes": size, "Container": ext.lstrip(".") or "unknown"}
+
+    result = None
+    if ext in MP4_EXTENSIONS:
+        result = probe_mp4(s3, bucket, key, size)
+    if result is None:
+        result = probe_ffprobe(s3, bucket, key)
+    if result is None:
+        return meta, ""
+
+    info, keyframes = result
+    duration = info.get("DurationSeconds")
+    if duration:
+        info["BitRate"] = int(size * 8 / duration)
+    meta["Probe"] = {k: v for k, v in info.items() if v is not None}
+    return meta, encode_keyframes(keyframes)
@@ -0,0 +1,82 @@
+import struct
+import unittest
+
+import media_probe
+
+
+def box(kind, *payload):
+    body = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+def full_box(kind, body, version=0):
+    return box(kind, struct.pack(">B3x", version), body)
+
+
+def video_trak(coded=(1440, 1080), display=(1920, 1080), timescale=30, samples=90):
+    # display size in tkhd differs from the coded size (anamorphic source)
+    tkhd = full_box(b"tkhd", bytes(76) + struct.pack(">II", display[0] << 16, display[1] << 16))
+    mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, samples) + bytes(4))
+    hdlr = full_box(b"hdlr", bytes(4) + b"vide" + bytes(13))
+    entry = box(b"avc1", bytes(6), struct.pack(">H", 1), bytes(16), struct.pack(">HH", *coded), bytes(50))
+    stbl = box(
+        b"stbl",
+        full_box(b"stsd", struct.pack(">I", 1) + entry),
+        full_box(b"stts", struct.pack(">III", 1, samples, 1)),
+        full_box(b"stss", struct.pack(">IIII", 3, 1, 31, 61)),
+        full_box(b"stsz", struct.pack(">II", 0, samples)),
+    )
+    return box(b"trak", tkhd, box(b"mdia", mdhd, hdlr, box(b"minf", stbl)))
+
+
+def mp4(*traks, moov_first=True):
+    ftyp = box(b"ftyp", b"isom", bytes(4))
+    moov = box(b"moov", full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 3000)), *traks)
+    mdat = box(b"mdat", bytes(4096))
+    return ftyp + (moov + mdat if moov_first else mdat + moov)
+
+
+class FakeS3:
+    def __init__(self, data):
+        self.data = data
+        self.reads = 0
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data)}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        self.reads += end - start + 1
+        body = self.data[start:end + 1]
+        return {"Body": type("Body", (), {"read": lambda self: body})()}
+
+
+class ProbeMp4Test(unittest.TestCase):
+    def probe(self, data):
+        return media_probe.probe_object(FakeS3(data), "bucket", "video.mp4")
+
+    def test_reads_coded_size_from_sample_entry(self):
+        meta, _ = self.probe(mp4(video_trak()))
+        probe = meta["Probe"]
+        self.assertEqual((probe["Width"], probe["Height"]), (1440, 1080))
+        self.assertEqual(probe["VideoCodec"], "h264")
+
+    def test_duration_frames_and_keyframes(self):
+        meta, keyframes = self.probe(mp4(video_trak()))
+        probe = meta["Probe"]
+        self.assertEqual(probe["DurationSeconds"], 3.0)
+        self.assertEqual(probe["FrameCount"], 90)
+        self.assertEqual(probe["FrameRate"], 30.0)
+        # sync samples 1, 31 and 61 at 30 fps
+        self.assertEqual(keyframes, "0,1000,1000")
+
+    def test_moov_after_mdat_skips_media_data(self):
+        data = mp4(video_trak(), moov_first=False)
+        s3 = FakeS3(data)
+        meta, _ = media_probe.probe_object(s3, "bucket", "video.mp4")
+        self.assertEqual(meta["Probe"]["Width"], 1440)
+        self.assertEqual(meta["SizeBytes"], len(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
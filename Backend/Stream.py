@@ -3,11 +3,14 @@ import boto3
 from flask import Blueprint, request, Response, abort
 from botocore.exceptions import ClientError
 
+import http_cache
+
 stream_bp = Blueprint('stream', __name__)
 
 s3 = boto3.client(
     's3',
     region_name=os.getenv('AWS_REGION'),
+    endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
 )
@@ -16,49 +19,63 @@ BUCKET = os.getenv('S3_BUCKET')
 @stream_bp.route('/stream/<path:s3_key>')
 def stream_video(s3_key):
     """
-    Streams a video stored in S3, supporting HTTP Range requests.
+    Streams a video stored in S3, supporting HTTP Range requests and
+    conditional requests (If-None-Match, If-Modified-Since, If-Range).
 
     """
+    conditions = http_cache.conditional_args(request.headers)
     range_header = request.headers.get("Range", None)
-    if not range_header:
-        # No range: return the whole file
+    range_args = None
+    if range_header:
+        m = re.match(r"bytes=(\d+)-(\d*)", range_header)
+        if not m:
+            abort(400)
+        # None when If-Range can't match: ignore the range and send everything
+        range_args = http_cache.if_range_args(request.headers)
+        if range_args is not None:
+            range_args["Range"] = f"bytes={m.group(1)}-{m.group(2)}"
+
+    if range_args:
         try:
-            obj = s3.get_object(Bucket=BUCKET, Key=s3_key)
-        except ClientError:
-            abort(404)
-        data = obj["Body"].read()
-        return Response(
-            data,
-            mimetype=obj["ContentType"],
-            headers={
-                "Content-Length": str(obj["ContentLength"]),
-                "Accept-Ranges": "bytes"
-            }
-        )
+            obj = s3.get_object(Bucket=BUCKET, Key=s3_key, **conditions, **range_args)
+        except ClientError as e:
+            status = http_cache.status_of(e)
+            if status == 304:
+                return Response(status=304, headers=http_cache.not_modified_headers(s3_key, e))
+            if status != 412:
+                abort(416)
+            # If-Range validator is stale: fall through to a full 200
+            obj = None
+
+        if obj is not None:
+            data = obj["Body"].read()
+            resp = Response(
+                data,
+                status=206,
+                mimetype=obj["ContentType"],
+                direct_passthrough=True
+            )
 
-    m = re.match(r"bytes=(\d+)-(\d*)", range_header)
-    if not m:
-        abort(400)
-    start = int(m.group(1))
-    end   = m.group(2)
-    byte_range = f"bytes={start}-{end}"  
+            resp.headers["Content-Range"]    = obj["ContentRange"]
+            resp.headers["Accept-Ranges"]    = "bytes"
+            resp.headers["Content-Length"]   = str(obj["ContentLength"])
+            resp.headers.update(http_cache.validator_headers(s3_key, obj))
+            return resp
 
+    # No (usable) range: return the whole file
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=s3_key, Range=byte_range)
+        obj = s3.get_object(Bucket=BUCKET, Key=s3_key, **conditions)
     except ClientError as e:
-        abort(416)
-
+        if http_cache.status_of(e) == 304:
+            return Response(status=304, headers=http_cache.not_modified_headers(s3_key, e))
+        abort(404)
     data = obj["Body"].read()
-    resp = Response(
+    return Response(
         data,
-        status=206,
         mimetype=obj["ContentType"],
-        direct_passthrough=True
+        headers={
+            "Content-Length": str(obj["ContentLength"]),
+            "Accept-Ranges": "bytes",
+            **http_cache.validator_headers(s3_key, obj)
+        }
     )
-
-    
-    resp.headers["Content-Range"]    = obj["ContentRange"]
-    resp.headers["Accept-Ranges"]    = "bytes"
-    resp.headers["Content-Length"]   = str(obj["ContentLength"])
-    
-    return resp
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""
+Async (ASGI) serving mode for the streaming endpoints.
+
+Serves the same routes with the same HTTP semantics as the Flask app:
+
+  GET /stream/<key>   - the object, with Range support (Stream.py)
+  GET /videos         - transcoded keys (main.py)
+  GET /stream?key=... - a presigned URL (main.py)
+
+Each request is a coroutine rather than a worker thread, and S3 reads go
+through one pooled aiobotocore client. Bodies are streamed in chunks, and
+each chunk is only read from S3 once the client has taken the previous
+one, so a single process can hold thousands of in-flight range requests
+without buffering whole objects.
+
+Run with:
+    uvicorn async_stream:app --host 0.0.0.0 --port 8000
+"""
+import os
+import re
+import contextlib
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import http_cache
+
+BUCKET         = os.getenv('S3_BUCKET')
+CHUNK_SIZE     = int(os.getenv('STREAM_CHUNK_KB', '256')) * 1024
+MAX_POOL       = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '256'))
+
+_raw_region = os.getenv('AWS_REGION', '')
+AWS_REGION  = _raw_region.split('#', 1)[0].strip() or None
+
+s3 = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Open one pooled S3 client for the life of the process."""
+    global s3
+    config = AioConfig(max_pool_connections=MAX_POOL, retries={'max_attempts': 5, 'mode': 'adaptive'})
+    async with get_session().create_client(
+        's3',
+        region_name=AWS_REGION,
+        endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        config=config
+    ) as client:
+        s3 = client
+        yield
+        s3 = None
+
+
+async def _iter_body(body):
+    """Yield an S3 body in chunks; the next read waits until the client takes this one."""
+    try:
+        async for chunk in body.iter_chunks(CHUNK_SIZE):
+            yield chunk
+    finally:
+        # also runs when the client disconnects mid-stream
+        body.close()
+
+
+async def stream_video(request):
+    """
+    Streams a video stored in S3, supporting HTTP Range requests and
+    conditional requests (If-None-Match, If-Modified-Since, If-Range).
+    """
+    s3_key = request.path_params['s3_key']
+    conditions = http_cache.conditional_args(request.headers)
+    range_header = request.headers.get('Range')
+    range_args = None
+    if range_header:
+        m = re.match(r"bytes=(\d+)-(\d*)", range_header)
+        if not m:
+            raise HTTPException(400)
+        # None when If-Range can't match: ignore the range and send everything
+        range_args = http_cache.if_range_args(request.headers)
+        if range_args is not None:
+            range_args['Range'] = f"bytes={m.group(1)}-{m.group(2)}"
+
+    if range_args:
+        try:
+            obj = await s3.get_object(Bucket=BUCKET, Key=s3_key, **conditions, **range_args)
+        except ClientError as e:
+            status = http_cache.status_of(e)
+            if status == 304:
+                return Response(status_code=304, headers=http_cache.not_modified_headers(s3_key, e))
+            if status != 412:
+                raise HTTPException(416)
+            # If-Range validator is stale: fall through to a full 200
+            obj = None
+
+        if obj is not None:
+            return StreamingResponse(
+                _iter_body(obj['Body']),
+                status_code=206,
+                media_type=obj['ContentType'],
+                headers={
+                    'Content-Range': obj['ContentRange'],
+                    'Accept-Ranges': 'bytes',
+                    'Content-Length': str(obj['ContentLength']),
+                    **http_cache.validator_headers(s3_key, obj)
+                }
+            )
+
+    # No (usable) range: return the whole file
+    try:
+        obj = await s3.get_object(Bucket=BUCKET, Key=s3_key, **conditions)
+    except ClientError as e:
+        if http_cache.status_of(e) == 304:
+            return Response(status_code=304, headers=http_cache.not_modified_headers(s3_key, e))
+        raise HTTPException(404)
+    return StreamingResponse(
+        _iter_body(obj['Body']),
+        media_type=obj['ContentType'],
+        headers={
+            'Content-Length': str(obj['ContentLength']),
+            'Accept-Ranges': 'bytes',
+            **http_cache.validator_headers(s3_key, obj)
+        }
+    )
+
+
+async def list_videos(request):
+    resp = await s3.list_objects_v2(Bucket=BUCKET, Prefix='transcoded/')
+    keys = [obj['Key'] for obj in resp.get('Contents', [])]
+    return JSONResponse({'videos': keys})
+
+
+async def get_stream_url(request):
+    key = request.query_params.get('key')
+    url = await s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': BUCKET, 'Key': key},
+        ExpiresIn=3600
+    )
+    return JSONResponse({'url': url})
+
+
+app = Starlette(
+    routes=[
+        Route('/stream/{s3_key:path}', stream_video),
+        Route('/videos', list_videos),
+        Route('/stream', get_stream_url),
+    ],
+    lifespan=lifespan
+)
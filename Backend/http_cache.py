@@ -0,0 +1,91 @@
+"""
+HTTP caching for streamed media, shared by the Flask and ASGI stream routes.
+
+Validators (ETag, Last-Modified) come straight from the S3 object. Client
+conditionals are passed on to S3's get_object, so a revalidation that
+matches comes back as 304 from S3 without the body being read.
+
+  .ts/.m4s segments - immutable, cached for a year (SEGMENT_MAX_AGE)
+  .m3u8 playlists   - short TTL (PLAYLIST_MAX_AGE), since live/VOD
+                      playlists are rewritten in place
+  anything else     - MEDIA_MAX_AGE, revalidated by ETag afterwards
+"""
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+# === CONFIGURATION ===
+SEGMENT_MAX_AGE  = int(os.getenv('SEGMENT_MAX_AGE', str(365 * 24 * 3600)))
+PLAYLIST_MAX_AGE = int(os.getenv('PLAYLIST_MAX_AGE', '5'))
+MEDIA_MAX_AGE    = int(os.getenv('MEDIA_MAX_AGE', '3600'))
+
+SEGMENT_EXTENSIONS  = {'.ts', '.m4s'}
+PLAYLIST_EXTENSIONS = {'.m3u8'}
+
+
+def cache_control(key):
+    ext = os.path.splitext(key)[1].lower()
+    if ext in SEGMENT_EXTENSIONS:
+        return f"public, max-age={SEGMENT_MAX_AGE}, immutable"
+    if ext in PLAYLIST_EXTENSIONS:
+        return f"public, max-age={PLAYLIST_MAX_AGE}"
+    return f"public, max-age={MEDIA_MAX_AGE}"
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def conditional_args(headers):
+    """get_object kwargs for If-None-Match / If-Modified-Since."""
+    if headers.get('If-None-Match'):
+        # If-Modified-Since is ignored when If-None-Match is present (RFC 9110 13.1.3)
+        return {'IfNoneMatch': headers['If-None-Match']}
+    since = _http_date(headers.get('If-Modified-Since'))
+    return {'IfModifiedSince': since} if since else {}
+
+
+def if_range_args(headers):
+    """
+    get_object kwargs that make a ranged read conditional on If-Range.
+    Returns None when the range must be ignored and the full object sent
+    (a weak ETag or unparseable date never matches).
+    """
+    value = headers.get('If-Range')
+    if not value:
+        return {}
+    if value.startswith('"'):
+        return {'IfMatch': value}
+    date = _http_date(value)
+    if value.startswith('W/') or date is None:
+        return None
+    return {'IfUnmodifiedSince': date}
+
+
+def status_of(err):
+    """HTTP status S3 answered with for a botocore ClientError."""
+    return err.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+
+
+def validator_headers(key, obj):
+    """ETag, Last-Modified and Cache-Control for a get_object response."""
+    headers = {'Cache-Control': cache_control(key)}
+    if obj.get('ETag'):
+        headers['ETag'] = obj['ETag']
+    if obj.get('LastModified'):
+        headers['Last-Modified'] = format_datetime(obj['LastModified'].astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified_headers(key, err):
+    """Headers for a 304, taken from S3's own 304 response."""
+    s3_headers = err.response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    headers = {'Cache-Control': cache_control(key)}
+    if s3_headers.get('etag'):
+        headers['ETag'] = s3_headers['etag']
+    if s3_headers.get('last-modified'):
+        headers['Last-Modified'] = s3_headers['last-modified']
+    return headers
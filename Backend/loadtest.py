@@ -0,0 +1,287 @@
+"""
+Load test for the Flask upload and streaming endpoints.
+
+Starts a local S3 stand-in (moto server), seeds it with an HLS rendition
+and an MP4, runs the Flask app against it in a subprocess, and drives
+concurrent clients through three kinds of traffic:
+
+  hls    - fetch the playlist, then each segment in order, like a player
+  seek   - random-offset Range requests on the MP4, like a viewer scrubbing
+  upload - multipart POSTs to /upload
+
+Reports throughput, p50/p99 latency and error rate per endpoint, and the
+server's RSS sampled over the run.
+
+Usage:
+    python loadtest.py [--clients 50] [--duration 60] [--mix hls=6,seek=3,upload=1]
+                       [--segments 30] [--segment-kb 512] [--mp4-mb 64] [--upload-mb 8]
+                       [--server-cmd "gunicorn -w 1 --threads 16 -b 127.0.0.1:{port} main:app"]
+                       [--json results.json]
+
+Needs moto[server], requests and psutil.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import socket
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+import boto3
+import psutil
+import requests
+from moto.server import ThreadedMotoServer
+
+HERE   = os.path.dirname(os.path.abspath(__file__))
+BUCKET = 'loadtest-bucket'
+PREFIX = 'transcoded/loadtest'
+
+# Flask's threaded dev server; override with --server-cmd to test gunicorn etc.
+DEFAULT_SERVER_CMD = f"{shlex.quote(sys.executable)} -m flask --app main run --port {{port}} --with-threads"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed_bucket(endpoint, segments, segment_kb, mp4_mb):
+    """Create the bucket with an HLS playlist + segments and one MP4; return their keys."""
+    s3 = boto3.client('s3', endpoint_url=endpoint, region_name='us-east-1',
+                      aws_access_key_id='test', aws_secret_access_key='test')
+    s3.create_bucket(Bucket=BUCKET)
+
+    segment_keys = []
+    playlist = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:10', '#EXT-X-MEDIA-SEQUENCE:0']
+    for i in range(segments):
+        key = f"{PREFIX}/hls_loadtest_{i:03d}.ts"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=os.urandom(segment_kb * 1024), ContentType='video/mp2t')
+        playlist += ['#EXTINF:10.0,', os.path.basename(key)]
+        segment_keys.append(key)
+    playlist.append('#EXT-X-ENDLIST')
+    playlist_key = f"{PREFIX}/hls_loadtest.m3u8"
+    s3.put_object(Bucket=BUCKET, Key=playlist_key, Body='\n'.join(playlist).encode(),
+                  ContentType='application/vnd.apple.mpegurl')
+
+    mp4_key = f"{PREFIX}/transcoded_loadtest.mp4"
+    mp4_size = mp4_mb * 1024 * 1024
+    s3.put_object(Bucket=BUCKET, Key=mp4_key, Body=os.urandom(mp4_size), ContentType='video/mp4')
+    return playlist_key, segment_keys, mp4_key, mp4_size
+
+
+def start_server(cmd, port, s3_endpoint):
+    env = dict(
+        os.environ,
+        S3_BUCKET=BUCKET,
+        S3_ENDPOINT_URL=s3_endpoint,
+        AWS_REGION='us-east-1',
+        AWS_ACCESS_KEY_ID='test',
+        AWS_SECRET_ACCESS_KEY='test',
+        JOBS_TABLE=os.getenv('JOBS_TABLE', 'TranscodeJobs'),
+    )
+    proc = subprocess.Popen(shlex.split(cmd.format(port=port)), cwd=HERE, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            requests.get(f"{base}/videos", timeout=1)
+            return proc, base
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not start within 30s")
+
+
+class Results:
+    """Thread-safe latency/bytes/error samples per endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok, nbytes=0):
+        with self.lock:
+            self.latency[endpoint].append(seconds)
+            self.bytes[endpoint] += nbytes
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def timed(results, endpoint, session, method, url, expect, **kwargs):
+    start = time.perf_counter()
+    try:
+        resp = session.request(method, url, timeout=60, **kwargs)
+        body = resp.content
+        ok = resp.status_code == expect
+    except requests.RequestException:
+        body, ok = b'', False
+    results.record(endpoint, time.perf_counter() - start, ok, len(body))
+    return body if ok else None
+
+
+def hls_client(session, target, results):
+    """Play the whole HLS rendition once."""
+    base = target['base']
+    if timed(results, 'playlist', session, 'GET', f"{base}/stream/{target['playlist']}", 200) is None:
+        return
+    for key in target['segments']:
+        timed(results, 'segment', session, 'GET', f"{base}/stream/{key}", 200)
+
+
+def seek_client(session, target, results):
+    """Scrub to a few random positions, reading a player-sized range at each."""
+    size = target['mp4_size']
+    for _ in range(5):
+        start = random.randrange(0, size - 1)
+        end = min(size - 1, start + random.choice((64, 256, 1024)) * 1024 - 1)
+        timed(results, 'range', session, 'GET', f"{target['base']}/stream/{target['mp4']}", 206,
+              headers={'Range': f"bytes={start}-{end}"})
+
+
+def upload_client(session, target, results):
+    timed(results, 'upload', session, 'POST', f"{target['base']}/upload", 202,
+          files={'file': ('loadtest.mp4', target['upload_blob'], 'video/mp4')})
+
+
+SCENARIOS = {
+    'hls':    hls_client,
+    'seek':   seek_client,
+    'upload': upload_client,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; expected one of {sorted(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def sample_rss(pid, stop, samples, interval=1.0):
+    """Sample RSS of the server and its children (e.g. gunicorn workers)."""
+    start = time.time()
+    while not stop.is_set():
+        try:
+            proc = psutil.Process(pid)
+            rss = proc.memory_info().rss + sum(
+                c.memory_info().rss for c in proc.children(recursive=True)
+            )
+        except psutil.Error:
+            break
+        samples.append((round(time.time() - start, 1), rss))
+        stop.wait(interval)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(results, elapsed, rss):
+    print(f"\n{'endpoint':<10} {'requests':>9} {'req/s':>8} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    summary = {}
+    for endpoint in sorted(results.latency):
+        lat = results.latency[endpoint]
+        row = {
+            'requests':    len(lat),
+            'rps':         len(lat) / elapsed,
+            'mb_per_s':    results.bytes[endpoint] / elapsed / 1e6,
+            'p50_ms':      percentile(lat, 50) * 1000,
+            'p99_ms':      percentile(lat, 99) * 1000,
+            'error_rate':  results.errors[endpoint] / len(lat),
+        }
+        summary[endpoint] = row
+        print(f"{endpoint:<10} {row['requests']:>9} {row['rps']:>8.1f} {row['mb_per_s']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} {100 * row['error_rate']:>6.2f}%")
+
+    if rss:
+        print("\nServer RSS (MB) over time:")
+        step = max(1, len(rss) // 20)
+        for t, value in rss[::step]:
+            print(f"  {t:>6.1f}s {value / 2**20:8.1f}")
+        print(f"  peak   {max(v for _, v in rss) / 2**20:8.1f}")
+    return {'elapsed': elapsed, 'endpoints': summary, 'rss': rss}
+
+
+def run(args):
+    s3_port = free_port()
+    moto = ThreadedMotoServer(ip_address='127.0.0.1', port=s3_port)
+    moto.start()
+    s3_endpoint = f"http://127.0.0.1:{s3_port}"
+    server = None
+    try:
+        print(f"Seeding local S3 at {s3_endpoint}...")
+        playlist_key, segment_keys, mp4_key, mp4_size = seed_bucket(
+            s3_endpoint, args.segments, args.segment_kb, args.mp4_mb
+        )
+        server, base = start_server(args.server_cmd, free_port(), s3_endpoint)
+        print(f"Server up at {base} (pid {server.pid}); running {args.clients} clients for {args.duration}s")
+        target = {
+            'base': base, 'playlist': playlist_key, 'segments': segment_keys,
+            'mp4': mp4_key, 'mp4_size': mp4_size,
+            'upload_blob': os.urandom(args.upload_mb * 1024 * 1024),
+        }
+
+        weights = parse_mix(args.mix)
+        names, probs = list(weights), list(weights.values())
+        results = Results()
+        stop = threading.Event()
+        deadline = time.time() + args.duration
+
+        def client():
+            session = requests.Session()
+            while time.time() < deadline:
+                scenario = SCENARIOS[random.choices(names, probs)[0]]
+                scenario(session, target, results)
+
+        rss = []
+        sampler = threading.Thread(target=sample_rss, args=(server.pid, stop, rss), daemon=True)
+        sampler.start()
+        start = time.time()
+        clients = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.time() - start
+        stop.set()
+        sampler.join()
+
+        summary = report(results, elapsed, rss)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(dict(summary, args=vars(args)), f, indent=2)
+            print(f"\nWrote {args.json}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        moto.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the Flask upload and streaming endpoints")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=int, default=60, help="seconds")
+    parser.add_argument('--mix', default='hls=6,seek=3,upload=1', help="scenario weights")
+    parser.add_argument('--segments', type=int, default=30)
+    parser.add_argument('--segment-kb', type=int, default=512)
+    parser.add_argument('--mp4-mb', type=int, default=64)
+    parser.add_argument('--upload-mb', type=int, default=8)
+    parser.add_argument('--server-cmd', default=DEFAULT_SERVER_CMD, help="command to start the app; {port} is filled in")
+    parser.add_argument('--json', help="write the results here for comparing runs")
+    run(parser.parse_args())
@@ -1,22 +1,33 @@
 import os
+import sys
+import time
 import uuid
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
+# Before the imports below: Stream.py and metrics read their settings at import time
 load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'VideoTranscoderJetstream'))
+import metrics
+from Stream import stream_bp
+
 app = Flask(__name__)
+app.register_blueprint(stream_bp)
+metrics.start_metrics_server("flask-app", port=0)  # served on /metrics below
 
 
 _raw_region = os.getenv("AWS_REGION", "")
 AWS_REGION = _raw_region.split("#", 1)[0].strip() 
 
-# S3
+# S3 (S3_ENDPOINT_URL points at a local stand-in, e.g. for loadtest.py)
 s3 = boto3.client(
     "s3",
     region_name=AWS_REGION,
+    endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
 )
@@ -32,6 +43,26 @@ dynamo = boto3.resource(
 jobs_table = dynamo.Table(os.getenv("JOBS_TABLE"))
 
 
+@app.before_request
+def _start_timer():
+    request.start_time = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.endpoint or "unknown"
+    metrics.HTTP_REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    metrics.HTTP_SECONDS.labels(endpoint).observe(time.perf_counter() - request.start_time)
+    return response
+
+
+# Prometheus scrape endpoint
+@app.route("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.metrics_response()
+    return Response(body, content_type=content_type)
+
+
 # Upload Function.
 @app.route("/upload", methods=["POST"])
 def upload_video():
@@ -47,12 +78,14 @@ def upload_video():
     s3_key = f"videos/{job_id}_{filename}"
 
     try:
+        start = time.perf_counter()
         s3.upload_fileobj(
             Fileobj=file.stream,
             Bucket=BUCKET,
             Key=s3_key,
             ExtraArgs={"ContentType": file.mimetype}
         )
+        metrics.record_transfer("upload", file.stream.tell(), time.perf_counter() - start)
     except (BotoCoreError, ClientError) as e:
         return jsonify({"error": str(e)}), 500
 
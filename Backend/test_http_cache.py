@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+import http_cache
+
+MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+MODIFIED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class ConditionalArgsTest(unittest.TestCase):
+    def test_if_none_match_wins(self):
+        headers = {'If-None-Match': '"abc"', 'If-Modified-Since': MODIFIED}
+        self.assertEqual(http_cache.conditional_args(headers), {'IfNoneMatch': '"abc"'})
+
+    def test_if_modified_since(self):
+        self.assertEqual(http_cache.conditional_args({'If-Modified-Since': MODIFIED}),
+                         {'IfModifiedSince': MODIFIED_AT})
+
+    def test_unconditional_or_bad_date(self):
+        self.assertEqual(http_cache.conditional_args({}), {})
+        self.assertEqual(http_cache.conditional_args({'If-Modified-Since': 'yesterday'}), {})
+
+
+class IfRangeArgsTest(unittest.TestCase):
+    def test_no_if_range(self):
+        self.assertEqual(http_cache.if_range_args({}), {})
+
+    def test_strong_etag(self):
+        self.assertEqual(http_cache.if_range_args({'If-Range': '"abc"'}), {'IfMatch': '"abc"'})
+
+    def test_date(self):
+        self.assertEqual(http_cache.if_range_args({'If-Range': MODIFIED}), {'IfUnmodifiedSince': MODIFIED_AT})
+
+    def test_weak_etag_or_bad_date_sends_the_whole_object(self):
+        self.assertIsNone(http_cache.if_range_args({'If-Range': 'W/"abc"'}))
+        self.assertIsNone(http_cache.if_range_args({'If-Range': 'yesterday'}))
+
+
+class HeadersTest(unittest.TestCase):
+    def test_cache_control_by_extension(self):
+        self.assertEqual(http_cache.cache_control('hls/job/segment_001.TS'),
+                         f"public, max-age={http_cache.SEGMENT_MAX_AGE}, immutable")
+        self.assertEqual(http_cache.cache_control('hls/job/index.m3u8'),
+                         f"public, max-age={http_cache.PLAYLIST_MAX_AGE}")
+        self.assertEqual(http_cache.cache_control('transcoded/movie.mp4'),
+                         f"public, max-age={http_cache.MEDIA_MAX_AGE}")
+
+    def test_validators_from_object(self):
+        headers = http_cache.validator_headers('movie.mp4', {'ETag': '"abc"', 'LastModified': MODIFIED_AT})
+        self.assertEqual(headers['ETag'], '"abc"')
+        self.assertEqual(headers['Last-Modified'], MODIFIED)
+
+    def test_not_modified_from_s3_304(self):
+        err = ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'},
+                           'ResponseMetadata': {'HTTPStatusCode': 304,
+                                                'HTTPHeaders': {'etag': '"abc"', 'last-modified': MODIFIED}}},
+                          'GetObject')
+        self.assertEqual(http_cache.status_of(err), 304)
+        self.assertEqual(http_cache.not_modified_headers('index.m3u8', err), {
+            'Cache-Control': http_cache.cache_control('index.m3u8'), 'ETag': '"abc"', 'Last-Modified': MODIFIED,
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
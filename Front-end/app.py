@@ -2,12 +2,21 @@ import streamlit as st
 import os
 import base64
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 
 load_dotenv()
 FLASK_URL = os.getenv("FLASK_URL", "http://localhost:5000")
 
+# How long cached backend data stays fresh (seconds)
+CATALOGUE_TTL = int(os.getenv("CATALOGUE_TTL", "30"))
+RESULTS_TTL   = int(os.getenv("RESULTS_TTL", "30"))
+# Connections kept open to the Flask backend, shared by all sessions
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+# Presigned URLs from /stream are valid for an hour; refresh well before that
+PRESIGNED_TTL = 3000
+
 st.set_page_config(page_title="Transcodify", layout="wide")
 PAGES = ["Home", "Upload", "Stream", "Results"]
 
@@ -21,17 +30,79 @@ if sel != st.session_state.page:
     st.session_state.page = sel
 
 
-def set_background(image_path: str):
+# Shared clients, created once per server process and used from every
+# session's script thread: boto3 clients are thread-safe, and the HTTP
+# session's connection pool is sized for concurrent reruns
+@st.cache_resource
+def http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_resource
+def dynamodb():
+    import boto3
+    return boto3.client(
+        "dynamodb",
+        region_name=os.getenv("AWS_REGION"),
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+    )
+
+
+@st.cache_data
+def background_css(image_path: str):
     if not os.path.exists(image_path):
-        return
-    data = base64.b64encode(open(image_path, "rb").read()).decode()
-    st.markdown(f"""
+        return ""
+    with open(image_path, "rb") as f:
+        data = base64.b64encode(f.read()).decode()
+    return f"""
         <style>
           .stApp {{
             background: url("data:image/png;base64,{data}") center/cover no-repeat;
           }}
         </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+@st.cache_data(ttl=CATALOGUE_TTL, show_spinner=False)
+def list_videos():
+    resp = http_session().get(f"{FLASK_URL}/videos")
+    resp.raise_for_status()
+    return resp.json().get("videos", [])
+
+
+@st.cache_data(ttl=PRESIGNED_TTL, show_spinner=False)
+def stream_url(key: str):
+    resp = http_session().get(f"{FLASK_URL}/stream", params={"key": key})
+    resp.raise_for_status()
+    return resp.json()["url"]
+
+
+@st.cache_data(ttl=RESULTS_TTL, show_spinner=False)
+def fetch_results():
+    # Fetch all records with Name, Mode, DurationSeconds
+    from boto3.dynamodb.types import TypeDeserializer
+    resp = dynamodb().scan(
+        TableName=os.getenv("JOBS_TABLE"),
+        ProjectionExpression="#n, #m, #d",
+        ExpressionAttributeNames={
+            "#n": "Name",
+            "#m": "Mode",
+            "#d": "DurationSeconds"
+        }
+    )
+    deserializer = TypeDeserializer()
+    return [{k: deserializer.deserialize(v) for k, v in item.items()} for item in resp.get("Items", [])]
+
+
+def set_background(image_path: str):
+    css = background_css(image_path)
+    if css:
+        st.markdown(css, unsafe_allow_html=True)
 
 set_background("hero.png")
 
@@ -118,7 +189,7 @@ elif st.session_state.page == "Upload":
         }
 
         try:
-            resp = requests.post(f"{FLASK_URL}/upload", files=files, data=data)
+            resp = http_session().post(f"{FLASK_URL}/upload", files=files, data=data)
             if resp.status_code == 202:
                 st.success(f"Upload successful! S3 key: `{resp.json()['s3_key']}`")
             else:
@@ -132,17 +203,13 @@ elif st.session_state.page == "Upload":
 elif st.session_state.page == "Stream":
     st.title("Stream Your Video")
     try:
-        resp = requests.get(f"{FLASK_URL}/videos")
-        resp.raise_for_status()
-        videos = resp.json().get("videos", [])
+        videos = list_videos()
         if not videos:
             st.info("No transcoded videos found. Please upload one first.")
         else:
             choice = st.selectbox("Select a transcoded video", videos)
             if choice:
-                r2 = requests.get(f"{FLASK_URL}/stream", params={"key": choice})
-                r2.raise_for_status()
-                st.video(r2.json()["url"])
+                st.video(stream_url(choice))
     except Exception as e:
         st.error(f"⚠️ Error: {e}")
 
@@ -151,30 +218,12 @@ elif st.session_state.page == "Stream":
 elif st.session_state.page == "Results":
     st.title("Compare Single vs. Parallel Transcoding")
 
-    import boto3
+    # pandas and botocore are only needed on this page
     import pandas as pd
     from botocore.exceptions import ClientError
 
-    # Init DynamoDB
-    ddb = boto3.resource(
-        "dynamodb",
-        region_name=os.getenv("AWS_REGION"),
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
-    table = ddb.Table(os.getenv("JOBS_TABLE"))
-
-    # Fetch all records with Name, Mode, DurationSeconds
     try:
-        resp = table.scan(
-            ProjectionExpression="#n, #m, #d",
-            ExpressionAttributeNames={
-                "#n": "Name",
-                "#m": "Mode",
-                "#d": "DurationSeconds"
-            }
-        )
-        items = resp.get("Items", [])
+        items = fetch_results()
     except ClientError as e:
         st.error(f"Error fetching results: {e}")
         st.stop()
@@ -0,0 +1,276 @@
+"""
+Execution engines for the chunk-transcode stage of multi-node mode.
+
+Every engine runs `func(item, *args)` for each item and returns the results
+in order, so the plan (segment), transcode and merge stages are the same
+whichever engine runs the chunks:
+
+  spark   - a Spark job, one partition per chunk (the original behaviour)
+  process - a local process pool; no JVM, for a single big node
+  socket  - long-running workers started with `python engines.py serve`
+  ssh     - one `ssh <host> python engines.py run-task ...` per chunk
+
+Pick one with TRANSCODE_ENGINE. socket/ssh take their hosts from
+TRANSCODE_WORKERS ("host:port,host:port" or "host,host").
+
+Socket workers bind to TRANSCODE_WORKER_BIND (localhost unless set) and
+only run requests carrying TRANSCODE_WORKER_TOKEN. Each allowed task has
+a checker that rejects arguments outside what the driver would send
+(keys outside the segment prefix, paths outside scratch, filter injection).
+
+Usage:
+    python engines.py serve [port]
+    python engines.py bench <video> <resolution> <codec> <engine> [<engine> ...]
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import shutil
+import socket
+import logging
+import importlib
+import itertools
+import subprocess
+import socketserver
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from resources import available_cores
+
+# === CONFIGURATION ===
+ENGINE_KIND     = os.getenv('TRANSCODE_ENGINE', 'spark')
+POOL_SIZE       = int(os.getenv('TRANSCODE_POOL_SIZE', '0'))
+WORKER_HOSTS    = [h for h in os.getenv('TRANSCODE_WORKERS', '').split(',') if h]
+WORKER_PORT     = int(os.getenv('TRANSCODE_WORKER_PORT', '7070'))
+WORKER_BIND     = os.getenv('TRANSCODE_WORKER_BIND', '127.0.0.1')
+WORKER_TOKEN    = os.getenv('TRANSCODE_WORKER_TOKEN', '')
+WORKER_SLOTS    = int(os.getenv('TRANSCODE_WORKER_SLOTS', '1'))
+REMOTE_DIR      = os.getenv('TRANSCODE_REMOTE_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Only these functions may be invoked by socket/ssh workers, each with its argument checker
+ALLOWED_TASKS = {
+    'multiNodeTranscoder:transcode_segment': 'multiNodeTranscoder:check_segment_task',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def task_name(func):
+    """'module:function' name a remote worker can import."""
+    module = func.__module__
+    if module == '__main__':
+        module = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+    return f"{module}:{func.__name__}"
+
+
+def _resolve(name):
+    module, func = name.split(':')
+    return getattr(importlib.import_module(module), func)
+
+
+def run_task(name, item, args):
+    """Check and call an allowed task; used on the remote side."""
+    if name not in ALLOWED_TASKS:
+        raise ValueError(f"Task {name} is not allowed")
+    # raises ValueError for arguments the driver would never send
+    _resolve(ALLOWED_TASKS[name])(item, *args)
+    return _resolve(name)(item, *args)
+
+
+class SparkEngine:
+    name = 'spark'
+
+    def __init__(self, spark):
+        self.spark = spark
+
+    def task_slots(self):
+        """Number of tasks Spark will run at once on one executor."""
+        conf = self.spark.sparkContext.getConf()
+        task_cpus = int(conf.get("spark.task.cpus", "1"))
+        executor_cores = conf.get("spark.executor.cores")
+        if executor_cores is None:
+            # standalone/local mode: executors take every core on the node
+            executor_cores = len(available_cores())
+        return max(1, int(executor_cores) // task_cpus)
+
+    def task_threads(self):
+        """ffmpeg threads each task gets on its executor."""
+        conf = self.spark.sparkContext.getConf()
+        executor_cores = int(conf.get("spark.executor.cores", len(available_cores())))
+        return max(1, executor_cores // self.task_slots())
+
+    def total_slots(self):
+        """Tasks Spark runs at once across the whole cluster."""
+        return max(1, self.spark.sparkContext.defaultParallelism)
+
+    def map(self, func, items, *args):
+        rdd = self.spark.sparkContext.parallelize(items, max(1, len(items)))
+        return rdd.map(lambda item: func(item, *args)).collect()
+
+    def close(self):
+        self.spark.stop()
+
+
+class ProcessPoolEngine:
+    name = 'process'
+
+    def __init__(self, workers=None):
+        self.workers = workers or POOL_SIZE or max(1, len(available_cores()) // 4)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def task_slots(self):
+        return self.workers
+
+    def task_threads(self):
+        return max(1, len(available_cores()) // self.workers)
+
+    def total_slots(self):
+        return self.workers
+
+    def map(self, func, items, *args):
+        return list(self.pool.map(func, items, *[itertools.repeat(a) for a in args]))
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class _RemoteEngine:
+    """Round-robins chunks over remote hosts, WORKER_SLOTS at a time per host."""
+
+    def __init__(self, hosts=None, slots=WORKER_SLOTS):
+        self.hosts = hosts or WORKER_HOSTS
+        if not self.hosts:
+            raise ValueError(f"TRANSCODE_WORKERS must list hosts for the {self.name} engine")
+        self.slots = slots
+        self.pool = ThreadPoolExecutor(max_workers=len(self.hosts) * slots)
+
+    def task_slots(self):
+        """Concurrent tasks per host."""
+        return self.slots
+
+    def task_threads(self):
+        """ffmpeg threads per task, assuming worker hosts the size of this node."""
+        return max(1, len(available_cores()) // self.slots)
+
+    def total_slots(self):
+        return len(self.hosts) * self.slots
+
+    def map(self, func, items, *args):
+        name = task_name(func)
+        hosts = itertools.cycle(self.hosts)
+        futures = [
+            self.pool.submit(self._call, next(hosts), name, item, list(args))
+            for item in items
+        ]
+        return [f.result() for f in futures]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class SocketEngine(_RemoteEngine):
+    name = 'socket'
+
+    def _call(self, host, name, item, args):
+        addr, _, port = host.partition(':')
+        request = json.dumps({'task': name, 'item': item, 'args': args, 'token': WORKER_TOKEN}).encode() + b'\n'
+        with socket.create_connection((addr, int(port or WORKER_PORT))) as conn:
+            conn.sendall(request)
+            reply = json.loads(conn.makefile('rb').readline())
+        if not reply.get('ok'):
+            raise RuntimeError(f"Task {name}({item}) failed on {host}: {reply.get('error')}")
+        return reply['result']
+
+
+class SSHEngine(_RemoteEngine):
+    name = 'ssh'
+
+    def _call(self, host, name, item, args):
+        cmd = [
+            'ssh', '-o', 'BatchMode=yes', host.partition(':')[0],
+            f"cd {REMOTE_DIR} && python3 engines.py run-task",
+        ]
+        request = json.dumps({'task': name, 'item': item, 'args': args})
+        proc = subprocess.run(cmd, input=request, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Task {name}({item}) failed on {host}: {proc.stderr.strip()}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])['result']
+
+
+def create_engine(kind=None, spark_factory=None):
+    """Build the engine named by `kind` or TRANSCODE_ENGINE."""
+    kind = kind or ENGINE_KIND
+    if kind == 'spark':
+        return SparkEngine(spark_factory())
+    if kind == 'process':
+        return ProcessPoolEngine()
+    if kind == 'socket':
+        return SocketEngine()
+    if kind == 'ssh':
+        return SSHEngine()
+    raise ValueError(f"Unknown TRANSCODE_ENGINE {kind!r}")
+
+
+class _TaskHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            if not hmac.compare_digest(str(request.get('token', '')), WORKER_TOKEN):
+                raise PermissionError("bad worker token")
+            result = run_task(request['task'], request['item'], request['args'])
+            reply = {'ok': True, 'result': result}
+        except Exception as e:
+            logger.error(f"Task failed: {e}", exc_info=True)
+            reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+class _TaskServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(port=WORKER_PORT, bind=WORKER_BIND):
+    """Run a socket worker that executes allowed tasks for the driver."""
+    if not WORKER_TOKEN:
+        raise SystemExit("Set TRANSCODE_WORKER_TOKEN (shared with the driver) before serving")
+    with _TaskServer((bind, port), _TaskHandler) as server:
+        logger.info(f"Transcode worker listening on {bind}:{port}")
+        server.serve_forever()
+
+
+def bench(video, resolution, codec, kinds):
+    """Time the chunk-transcode stage of one local video on each engine."""
+    import tempfile
+    import multiNodeTranscoder as mnt
+
+    for kind in kinds:
+        engine = create_engine(kind, spark_factory=mnt.create_spark_session)
+        work = tempfile.mkdtemp(prefix='transcode_bench_')
+        try:
+            keys = mnt.segment_video(video, work, f"bench-{kind}")
+            start = time.time()
+            engine.map(mnt.transcode_segment, keys, work, 'mp4', resolution, codec, engine.task_slots())
+            elapsed = time.time() - start
+            print(f"{kind:<8} {len(keys)} chunks in {elapsed:.2f}s")
+            mnt.cleanup_segments(f"bench-{kind}")
+        finally:
+            engine.close()
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'serve':
+        serve(int(sys.argv[2]) if len(sys.argv) > 2 else WORKER_PORT)
+    elif command == 'run-task':
+        request = json.loads(sys.stdin.read())
+        print(json.dumps({'result': run_task(request['task'], request['item'], request['args'])}))
+    elif command == 'bench' and len(sys.argv) >= 6:
+        bench(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:])
+    else:
+        print("Usage: python engines.py serve [port]\n"
+              "       python engines.py bench <video> <resolution> <codec> <engine> [<engine> ...]")
+        sys.exit(1)
@@ -0,0 +1,83 @@
+"""
+Fan-out: one download and one decode of a source feeding several jobs.
+
+Jobs asking for different outputs of the same InputKey (720p and 1080p,
+several formats, ...) are claimed together by the worker that reaches the
+first of them. ffmpeg then decodes the source once and a split filter hands
+every decoded frame to one scale + encode chain per job, so the cost per
+source is one download and decode plus one encode per output instead of a
+full pipeline per output. Each job is still leased, completed and failed on
+its own record.
+
+Each job in a group gets its own target (presets.job_target), exactly as
+it would if it were run alone.
+"""
+import os
+import logging
+
+import presets
+import scratch
+from resources import decoder_thread_args, encoder_thread_args
+
+# === CONFIGURATION ===
+# most jobs sharing one decode (1 disables fan-out)
+FANOUT_MAX = int(os.getenv('TRANSCODE_FANOUT_MAX', '4'))
+
+logger = logging.getLogger(__name__)
+
+
+def siblings(job, jobs_behind):
+    """Queued jobs for the same source as `job`, at most FANOUT_MAX - 1 of them."""
+    same = [j for j in jobs_behind if j['InputKey'] == job['InputKey'] and j['JobId'] != job['JobId']]
+    return same[:max(0, FANOUT_MAX - 1)]
+
+
+def footprint(input_bytes, outputs):
+    """Peak scratch bytes for one download shared by `outputs` encodes."""
+    single = scratch.estimate_footprint(input_bytes, 'single')
+    return single + (outputs - 1) * max(0, single - input_bytes)
+
+
+def split_cmd(local_in, outputs, threads):
+    """
+    One ffmpeg command that decodes `local_in` once and encodes every entry
+    of `outputs` (per-job dicts with local_out, resolution, codec and preset).
+    """
+    n = len(outputs)
+    graph = [f"[0:v]split={n}" + ''.join(f"[v{i}]" for i in range(n))]
+    graph += [f"[v{i}]scale={o['resolution']}[out{i}]" for i, o in enumerate(outputs)]
+    # the encoders share the slot's cores
+    encoder_threads = max(1, threads // n)
+
+    cmd = [
+        'ffmpeg', '-y',
+        '-analyzeduration', '10M', '-probesize', '20M',
+        *decoder_thread_args(threads),
+        '-i', local_in,
+        '-filter_complex', ';'.join(graph),
+    ]
+    for i, o in enumerate(outputs):
+        cmd += [
+            '-map', f'[out{i}]', '-map', '0:a:0?',
+            '-c:v', o['codec'],
+            *encoder_thread_args(o['codec'], encoder_threads),
+            *presets.preset_args(o['codec'], o['preset']),
+            o['local_out'],
+        ]
+    return cmd
+
+
+def choose_presets(outputs, threads, backlog=0.0):
+    """
+    Pick each output's preset. The encoders split the node's `threads`, so
+    each one is planned at 1/n of the speed measured for a lone encode.
+    Sets preset and predicted on every output; returns the reasons.
+    """
+    share = 1 / len(outputs)
+    reasons = []
+    for o in outputs:
+        o['preset'], o['predicted'], why = presets.choose_preset(
+            o['job'], o['codec'], o['resolution'], threads, parallelism=share, backlog=backlog
+        )
+        reasons.append(why)
+    return reasons
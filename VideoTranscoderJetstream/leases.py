@@ -0,0 +1,295 @@
+"""
+Lease-based job claims for the transcode workers.
+
+A claim records the owning worker and a lease expiry on the job item. While
+a job runs, a heartbeat thread keeps extending the lease; if the worker (or
+the Spark driver) dies, the lease runs out and any other worker can reclaim
+the job. Each claim bumps an attempt counter so a job that keeps killing its
+workers is failed after TRANSCODE_MAX_ATTEMPTS instead of looping forever.
+
+PROCESSING jobs claimed before leases existed have no LeaseExpiresAt; they
+are reclaimable once their ClaimedAt (or, lacking that, CreatedAt) is older
+than TRANSCODE_LEGACY_LEASE_SECONDS.
+"""
+import os
+import uuid
+import time
+import socket
+import logging
+import threading
+import subprocess
+from datetime import datetime, timedelta
+
+import boto3
+from botocore.exceptions import (
+    BotoCoreError, ClientError, EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError
+)
+
+from scratch import InsufficientScratchError
+
+# === CONFIGURATION ===
+LEASE_SECONDS     = int(os.getenv('TRANSCODE_LEASE_SECONDS', '120'))
+HEARTBEAT_SECONDS = max(1, LEASE_SECONDS // 3)
+MAX_ATTEMPTS      = int(os.getenv('TRANSCODE_MAX_ATTEMPTS', '3'))
+# age after which a PROCESSING job without a lease counts as abandoned
+LEGACY_LEASE_SECONDS = int(os.getenv('TRANSCODE_LEGACY_LEASE_SECONDS', str(LEASE_SECONDS)))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+TRANSIENT_AWS_CODES = {
+    'ProvisionedThroughputExceededException', 'ThrottlingException',
+    'RequestLimitExceeded', 'InternalServerError', 'ServiceUnavailable',
+    'SlowDown', 'RequestTimeout', '500', '503',
+}
+
+# PROCESSING with an expired lease, or with no lease at all and claimed/created long ago
+ABANDONED = (
+    "(#s = :processing AND (LeaseExpiresAt < :now OR (attribute_not_exists(LeaseExpiresAt) AND "
+    "(ClaimedAt < :stale OR (attribute_not_exists(ClaimedAt) AND CreatedAt < :stale)))))"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _stale_before():
+    """ISO timestamp (UTC, like ClaimedAt/CreatedAt) before which a lease-less claim is abandoned."""
+    return (datetime.utcnow() - timedelta(seconds=LEGACY_LEASE_SECONDS)).isoformat()
+
+
+def is_transient(error):
+    """True if the error is worth retrying on another attempt."""
+    if isinstance(error, ClientError):
+        return error.response['Error']['Code'] in TRANSIENT_AWS_CODES
+    if isinstance(error, (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError,
+                          ConnectionError, TimeoutError, InsufficientScratchError)):
+        return True
+    if isinstance(error, subprocess.CalledProcessError):
+        # ffmpeg killed by a signal (OOM killer, node shutdown) rather than bad input
+        return error.returncode < 0
+    return False
+
+
+def list_claimable_jobs(table):
+    """Return PENDING jobs plus abandoned PROCESSING jobs (expired or missing lease)."""
+    now = int(time.time())
+    try:
+        resp = table.scan(
+            FilterExpression=f"#s = :pending OR {ABANDONED}",
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={
+                ":pending":    "PENDING",
+                ":processing": "PROCESSING",
+                ":now":        now,
+                ":stale":      _stale_before()
+            }
+        )
+    except (ClientError, BotoCoreError) as e:
+        logger.error(f"Error listing claimable jobs: {e}")
+        return []
+
+    jobs = []
+    for job in resp.get('Items', []):
+        if job['Status'] == 'PROCESSING' and int(job.get('Attempts', 0)) >= MAX_ATTEMPTS:
+            _fail_exhausted(table, job)
+        else:
+            jobs.append(job)
+    return jobs
+
+
+def _fail_exhausted(table, job):
+    """Mark an abandoned job FAILED once it has used up its attempts."""
+    try:
+        table.update_item(
+            Key={'JobId': job['JobId']},
+            ConditionExpression="#s = :processing AND LeaseExpiresAt < :now",
+            UpdateExpression="SET #s = :failed REMOVE LeaseOwner, LeaseExpiresAt",
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={
+                ":processing": "PROCESSING",
+                ":failed":     "FAILED",
+                ":now":        int(time.time())
+            }
+        )
+        logger.warning(f"Job {job['JobId']} failed after {job.get('Attempts')} abandoned attempts")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.error(f"Error failing exhausted job {job['JobId']}: {e}")
+    except BotoCoreError as e:
+        logger.error(f"Error failing exhausted job {job['JobId']}: {e}")
+
+
+def claim_job(table, job_id, owner=WORKER_ID):
+    """
+    Atomically claim a PENDING job, or reclaim an abandoned one (lease
+    expired, or a lease-less claim older than LEGACY_LEASE_SECONDS).
+    Returns True if this worker now owns the job.
+    """
+    now = int(time.time())
+    try:
+        table.update_item(
+            Key={'JobId': job_id},
+            ConditionExpression=(
+                f"(#s = :pending OR {ABANDONED}) "
+                "AND (attribute_not_exists(Attempts) OR Attempts < :max)"
+            ),
+            UpdateExpression=(
+                "SET #s = :processing, LeaseOwner = :owner, LeaseExpiresAt = :exp, "
+                "ClaimedAt = :claimed ADD Attempts :one"
+            ),
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={
+                ":pending":    "PENDING",
+                ":processing": "PROCESSING",
+                ":now":        now,
+                ":stale":      _stale_before(),
+                ":max":        MAX_ATTEMPTS,
+                ":owner":      owner,
+                ":exp":        now + LEASE_SECONDS,
+                ":claimed":    datetime.utcnow().isoformat(),
+                ":one":        1
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        logger.error(f"Error claiming job {job_id}: {e}")
+        return False
+    except BotoCoreError as e:
+        logger.error(f"Error claiming job {job_id}: {e}")
+        return False
+
+
+def renew_lease(table, job_id, owner=WORKER_ID):
+    """Extend this worker's lease on a job. Returns False if the lease was lost."""
+    try:
+        table.update_item(
+            Key={'JobId': job_id},
+            ConditionExpression="#s = :processing AND LeaseOwner = :owner",
+            UpdateExpression="SET LeaseExpiresAt = :exp",
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={
+                ":processing": "PROCESSING",
+                ":owner":      owner,
+                ":exp":        int(time.time()) + LEASE_SECONDS
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        # a failed renewal is not fatal; the next beat tries again
+        logger.warning(f"Error renewing lease on job {job_id}: {e}")
+        return True
+    except BotoCoreError as e:
+        logger.warning(f"Error renewing lease on job {job_id}: {e}")
+        return True
+
+
+def release_job(table, job_id, error=None, owner=WORKER_ID):
+    """
+    Give up a claimed job after an error. Transient errors put the job back
+    to PENDING for another attempt (until MAX_ATTEMPTS); anything else, or
+    an exhausted job, is marked FAILED. Both writes require this worker to
+    still hold the lease; if another worker has taken the job over it is
+    left alone and "LOST" is returned. Returns the new status.
+    """
+    retry = error is not None and is_transient(error)
+    if retry:
+        try:
+            table.update_item(
+                Key={'JobId': job_id},
+                ConditionExpression="LeaseOwner = :owner AND Attempts < :max",
+                UpdateExpression="SET #s = :pending REMOVE LeaseOwner, LeaseExpiresAt",
+                ExpressionAttributeNames={"#s": "Status"},
+                ExpressionAttributeValues={
+                    ":owner":   owner,
+                    ":max":     MAX_ATTEMPTS,
+                    ":pending": "PENDING"
+                }
+            )
+            logger.info(f"Job {job_id} returned to PENDING after transient error: {error}")
+            return "PENDING"
+        except ClientError as e:
+            # condition failure: attempts used up (fail below) or lease lost (the fail is refused too)
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                logger.error(f"Error releasing job {job_id}: {e}")
+        except BotoCoreError as e:
+            logger.error(f"Error releasing job {job_id}: {e}")
+
+    try:
+        table.update_item(
+            Key={'JobId': job_id},
+            ConditionExpression="LeaseOwner = :owner",
+            UpdateExpression="SET #s = :failed REMOVE LeaseOwner, LeaseExpiresAt",
+            ExpressionAttributeNames={"#s": "Status"},
+            ExpressionAttributeValues={":owner": owner, ":failed": "FAILED"}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            logger.warning(f"Job {job_id} is owned by another worker; not failing it")
+            return "LOST"
+        logger.error(f"Error failing job {job_id}: {e}")
+    except BotoCoreError as e:
+        # the lease runs out and the job is reclaimed
+        logger.error(f"Error failing job {job_id}: {e}")
+    return "FAILED"
+
+
+class ThreadLocalTable:
+    """
+    DynamoDB Table handle with one boto3 resource per thread. boto3
+    resources aren't thread-safe, and the pipeline and lease heartbeat
+    threads all write to the jobs table.
+    """
+
+    def __init__(self, name):
+        self.name   = name
+        self._local = threading.local()
+
+    def _table(self):
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            table = self._local.table = boto3.session.Session().resource('dynamodb').Table(self.name)
+        return table
+
+    def __getattr__(self, attr):
+        return getattr(self._table(), attr)
+
+
+class LeaseHeartbeat:
+    """
+    Context manager that renews a job's lease in a background thread.
+    `lost` is set if another worker took the job over.
+    """
+
+    def __init__(self, table, job_id, owner=WORKER_ID, interval=HEARTBEAT_SECONDS):
+        self.table    = table
+        self.job_id   = job_id
+        self.owner    = owner
+        self.interval = interval
+        self.lost     = threading.Event()
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not renew_lease(self.table, self.job_id, self.owner):
+                logger.warning(f"Lost lease on job {self.job_id}")
+                self.lost.set()
+                return
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
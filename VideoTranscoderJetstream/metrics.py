@@ -0,0 +1,174 @@
+"""
+Prometheus metrics shared by the transcode workers and the Flask app.
+
+Each worker calls start_metrics_server() once; the Flask app mounts
+metrics_response() on /metrics instead. Recording a sample is a label lookup
+and an in-process increment, so instrumenting the hot path is cheap.
+"""
+import os
+import time
+import logging
+import resource
+from datetime import datetime
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, multiprocess,
+    start_http_server, generate_latest, CONTENT_TYPE_LATEST
+)
+
+import tracing
+
+# === CONFIGURATION ===
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS    = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+TRANSFER_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+JOBS = Counter(
+    'transcode_jobs_total', 'Jobs finished by this worker', ['worker', 'status']
+)
+JOB_FAILURES = Counter(
+    'transcode_job_failures_total', 'Job failures by stage and error type', ['worker', 'stage', 'error']
+)
+IN_FLIGHT = Gauge(
+    'transcode_jobs_in_flight', 'Jobs currently claimed by this worker', ['worker']
+)
+QUEUE_DEPTH = Gauge(
+    'transcode_queue_depth', 'Claimable jobs seen on the last poll', ['worker']
+)
+QUEUE_WAIT = Histogram(
+    'transcode_queue_wait_seconds', 'Time from job creation to claim', ['worker'], buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    'transcode_stage_seconds', 'Wall time per job stage', ['worker', 'stage'], buckets=STAGE_BUCKETS
+)
+ENCODE_FPS = Histogram(
+    'transcode_encode_fps', 'Frames encoded per second by each ffmpeg run', ['worker', 'codec'],
+    buckets=(1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)
+)
+FFMPEG_CPU_SECONDS = Counter(
+    'transcode_ffmpeg_cpu_seconds_total', 'CPU time used by ffmpeg child processes', ['worker', 'mode']
+)
+FFMPEG_MAX_RSS = Gauge(
+    'transcode_ffmpeg_max_rss_bytes', 'Peak resident memory of ffmpeg children so far', ['worker']
+)
+PRESET_SPEED_RATIO = Histogram(
+    'transcode_preset_speed_ratio', 'Achieved / predicted encode fps for the chosen preset',
+    ['worker', 'codec', 'preset'], buckets=(0.25, 0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2, 4)
+)
+SOURCE_CACHE = Counter(
+    'transcode_source_cache_total', 'Source downloads served from / missed by the node cache', ['worker', 'result']
+)
+SOURCE_CACHE_BYTES_SAVED = Counter(
+    'transcode_source_cache_saved_bytes_total', 'Source bytes not downloaded thanks to the node cache', ['worker']
+)
+S3_BYTES = Counter(
+    's3_transfer_bytes_total', 'Bytes moved to or from S3', ['worker', 'direction']
+)
+S3_SECONDS = Histogram(
+    's3_transfer_seconds', 'S3 transfer latency', ['worker', 'direction'], buckets=TRANSFER_BUCKETS
+)
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests served', ['endpoint', 'status']
+)
+HTTP_SECONDS = Histogram(
+    'http_request_seconds', 'HTTP request latency', ['endpoint'], buckets=TRANSFER_BUCKETS
+)
+
+# Label value identifying the process; set by each entry point
+WORKER = os.getenv('TRANSCODE_WORKER_NAME', 'worker')
+
+
+def start_metrics_server(worker, port=None):
+    """Label this process's metrics and serve them on /metrics if a port is configured."""
+    global WORKER
+    WORKER = worker
+    port = METRICS_PORT if port is None else port
+    if port:
+        start_http_server(port)
+        logger.info(f"Serving metrics for {worker} on :{port}/metrics")
+
+
+def metrics_response():
+    """(body, content_type) for mounting /metrics in a web app."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # several server processes (e.g. gunicorn workers) share one scrape
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+@contextmanager
+def stage(name):
+    """Time a job stage (as a metric and a trace span) and count failures raised inside it."""
+    start = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    except Exception as e:
+        JOB_FAILURES.labels(WORKER, name, type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(WORKER, name).observe(time.perf_counter() - start)
+
+
+def record_transfer(direction, nbytes, seconds):
+    S3_BYTES.labels(WORKER, direction).inc(nbytes)
+    S3_SECONDS.labels(WORKER, direction).observe(seconds)
+
+
+def download_file(client, bucket, key, path):
+    """s3.download_file with byte and latency metrics."""
+    with tracing.span('s3.download', bucket=bucket, key=key) as attrs:
+        start = time.perf_counter()
+        client.download_file(bucket, key, path)
+        attrs['bytes'] = os.path.getsize(path)
+        record_transfer('download', attrs['bytes'], time.perf_counter() - start)
+
+
+def upload_file(client, path, bucket, key, **kwargs):
+    """s3.upload_file with byte and latency metrics."""
+    with tracing.span('s3.upload', bucket=bucket, key=key) as attrs:
+        start = time.perf_counter()
+        client.upload_file(path, bucket, key, **kwargs)
+        attrs['bytes'] = os.path.getsize(path)
+        record_transfer('upload', attrs['bytes'], time.perf_counter() - start)
+
+
+def record_ffmpeg_usage(before, after):
+    """Record child CPU time and peak RSS between two getrusage(RUSAGE_CHILDREN) snapshots."""
+    FFMPEG_CPU_SECONDS.labels(WORKER, 'user').inc(max(0.0, after.ru_utime - before.ru_utime))
+    FFMPEG_CPU_SECONDS.labels(WORKER, 'system').inc(max(0.0, after.ru_stime - before.ru_stime))
+    # ru_maxrss is in kilobytes on Linux
+    FFMPEG_MAX_RSS.labels(WORKER).set(after.ru_maxrss * 1024)
+
+
+def children_usage():
+    return resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def job_claimed(job):
+    """Count a newly claimed job as in flight and record how long it queued."""
+    IN_FLIGHT.labels(WORKER).inc()
+    record_queue_wait(job)
+
+
+def job_finished(status):
+    IN_FLIGHT.labels(WORKER).dec()
+    JOBS.labels(WORKER, status).inc()
+
+
+def record_queue_wait(job):
+    """Observe time since the job's CreatedAt timestamp (set by the ingest Lambda)."""
+    created = job.get('CreatedAt')
+    if not created:
+        return
+    try:
+        waited = (datetime.utcnow() - datetime.fromisoformat(created)).total_seconds()
+    except ValueError:
+        return
+    QUEUE_WAIT.labels(WORKER).observe(max(0.0, waited))
@@ -1,45 +1,46 @@
-import boto3
 import subprocess
 import os
+import re
 import sys
-import uuid
 import time
 from decimal import Decimal  
-from pyspark.sql import SparkSession
 from botocore.exceptions import ClientError
-import shutil
 import logging
-import psutil 
+
+import engines
+import leases
+import metrics
+import presets
+import remux
+import scratch
+import source_cache
+import storage
+import tracing
+from resources import plan_resources, acquire_slot, slot_cpus, decoder_thread_args, encoder_thread_args, run_ffmpeg
 
 # AWS Configuration
 DYNAMODB_TABLE   = 'TranscodeJobs'
-S3_BUCKET        = 'video-transcoder-input1'
+S3_BUCKET        = storage.S3_BUCKET
 S3_INPUT_PREFIX  = 'videos/'       
 S3_OUTPUT_PREFIX = 'transcoded/'   
 
+# Target chunk length for parallel transcoding (seconds)
+SEGMENT_SECONDS  = 120
+
+# Local modules needed by executor-side code
+SPARK_PY_FILES   = ['resources.py', 'metrics.py', 'scratch.py', 'storage.py', 'tracing.py', 'presets.py']
+
 # Initialize AWS clients/resources
-dynamodb = boto3.resource('dynamodb')
-table    = dynamodb.Table(DYNAMODB_TABLE)
+# one boto3 resource per thread: the lease heartbeat shares the table
+table    = leases.ThreadLocalTable(DYNAMODB_TABLE)
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def check_disk_space(path):
-    """Check available disk space at the given path."""
-    try:
-        disk = psutil.disk_usage(path)
-        free_gb = disk.free / (1024 ** 3)
-        if free_gb < 1:
-            logger.warning(f"Low disk space at {path}: {free_gb:.2f} GB free")
-        return free_gb
-    except Exception as e:
-        logger.error(f"Error checking disk space at {path}: {e}")
-        return 0
-
-
 def create_spark_session():
+    from pyspark.sql import SparkSession
     spark = SparkSession.builder \
         .appName("S3VideoTranscoder") \
         .config("spark.hadoop.fs.s3a.access.key", os.environ['AWS_ACCESS_KEY_ID']) \
@@ -48,49 +49,37 @@ def create_spark_session():
         .config("spark.hadoop.fs.s3a.aws.credentials.provider", "org.apache.hadoop.fs.s3a.SimpleAWSCredentialsProvider") \
         .config("spark.executorEnv.AWS_ACCESS_KEY_ID", os.environ['AWS_ACCESS_KEY_ID']) \
         .config("spark.executorEnv.AWS_SECRET_ACCESS_KEY", os.environ['AWS_SECRET_ACCESS_KEY']) \
+        .config("spark.executorEnv.S3_BUCKET", storage.S3_BUCKET) \
+        .config("spark.executorEnv.INTERMEDIATE_STORE", storage.STORE_KIND) \
+        .config("spark.executorEnv.INTERMEDIATE_ROOT", storage.STORE_ROOT) \
+        .config("spark.executorEnv.TRACE_FILE", tracing.TRACE_FILE) \
+        .config("spark.executorEnv.TRANSCODE_PRESET_FILE", presets.PRESET_FILE) \
         .getOrCreate()
 
     hadoop_conf = spark.sparkContext._jsc.hadoopConfiguration()
     hadoop_conf.set("fs.s3a.access.key", os.environ['AWS_ACCESS_KEY_ID'])
     hadoop_conf.set("fs.s3a.secret.key", os.environ['AWS_SECRET_ACCESS_KEY'])
+
+    # ship helper modules to the executors
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in SPARK_PY_FILES:
+        spark.sparkContext.addPyFile(os.path.join(here, module))
     return spark
 
 
 def list_pending_jobs():
-    """List all pending jobs from DynamoDB"""
-    try:
-        resp = table.scan(
-            FilterExpression="#s = :pending",
-            ExpressionAttributeNames={"#s": "Status"},
-            ExpressionAttributeValues={":pending": "PENDING"}
-        )
-        return resp.get('Items', [])
-    except ClientError as e:
-        logger.error(f"Error listing pending jobs: {e}")
-        return []
+    """List pending jobs, plus jobs whose worker's lease has expired"""
+    return leases.list_claimable_jobs(table)
 
 
 def lock_job(job_id):
-    """Atomically lock a job to prevent duplicate processing"""
-    try:
-        table.update_item(
-            Key={'JobId': job_id},
-            ConditionExpression="#s = :pending",
-            UpdateExpression="SET #s = :processing",
-            ExpressionAttributeNames={"#s": "Status"},
-            ExpressionAttributeValues={":pending": "PENDING", ":processing": "PROCESSING"}
-        )
-        return True
-    except ClientError as e:
-        
-        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-            return False
-        logger.error(f"Error locking job {job_id}: {e}")
-        return False
+    """Atomically claim a job with a lease owned by this driver"""
+    return leases.claim_job(table, job_id)
 
 
-def update_job_status(job_id, status, output_key=None, hls_output_key=None, duration=None, mode=None):
-    """Update job status in DynamoDB with optional output keys, duration, and mode"""
+def update_job_status(job_id, status, output_key=None, hls_output_key=None, duration=None, mode=None, engine=None,
+                      path=None, encode=None):
+    """Update job status in DynamoDB with optional output keys, duration, mode, engine, transcode path and encode preset"""
     expr_parts = ["#s = :status"]
     names      = {"#s": "Status"}
     vals       = {":status": status}
@@ -113,6 +102,18 @@ def update_job_status(job_id, status, output_key=None, hls_output_key=None, dura
         names["#m"] = "Mode"
         vals[":m"]  = mode
 
+    if engine is not None:
+        expr_parts.append("Engine = :e")
+        vals[":e"] = engine
+
+    if path is not None:
+        expr_parts.append("TranscodePath = :p")
+        vals[":p"] = path
+
+    if encode:
+        expr_parts.append("Encode = :enc")
+        vals[":enc"] = encode
+
     update_expr = "SET " + ", ".join(expr_parts)
 
     try:
@@ -126,19 +127,50 @@ def update_job_status(job_id, status, output_key=None, hls_output_key=None, dura
         logger.error(f"Error updating job {job_id}: {e}")
 
 
-def segment_video(input_file, temp_dir, job_id):
+def keyframe_times(job):
+    """Keyframe timestamps (seconds) from the job's ingest-time KeyframeIndex."""
+    index = job.get('KeyframeIndex')
+    if not index:
+        return []
+    times, ms = [], 0
+    for delta in index.split(','):
+        ms += int(delta)
+        times.append(ms / 1000)
+    return times
+
+
+def plan_segment_times(job, target=SEGMENT_SECONDS):
     """
-    Segment video into 2-minute chunks using FFmpeg,
-    upload segments to S3, and return their S3 keys.
+    Chunk cut points taken from the keyframe index, one at the first
+    keyframe past each `target` seconds. None if the job has no index.
+    """
+    keyframes = keyframe_times(job)
+    if not keyframes:
+        return None
+    cuts, next_cut = [], target
+    for t in keyframes:
+        if t >= next_cut:
+            cuts.append(t)
+            next_cut = t + target
+    return cuts
+
+
+def segment_video(input_file, temp_dir, job_id, segment_times=None):
+    """
+    Segment video into 2-minute chunks using FFmpeg (at the planned
+    keyframe cut points when known), put segments in the intermediate
+    store, and return their keys.
     """
-    if check_disk_space(temp_dir) < 1:
-        raise RuntimeError(f"Insufficient disk space in {temp_dir}")
-
     seg_pattern = os.path.join(temp_dir, 'segment%03d.ts')
+    if segment_times:
+        # nudge back so rounding in the index never skips the intended keyframe
+        split = ['-segment_times', ','.join(f"{max(0.0, t - 0.01):.3f}" for t in segment_times)]
+    else:
+        split = ['-segment_time', str(SEGMENT_SECONDS)]
     cmd = [
         'ffmpeg', '-y', '-i', input_file,
         '-c', 'copy',
-        '-segment_time', '120',
+        *split,
         '-f', 'segment',
         '-reset_timestamps', '1',
         seg_pattern
@@ -149,70 +181,118 @@ def segment_video(input_file, temp_dir, job_id):
     if not files:
         raise FileNotFoundError("No segments generated; check FFmpeg logs.")
 
-    s3 = boto3.client('s3')
-    s3_prefix = f"{S3_OUTPUT_PREFIX}segments/{job_id}/"
+    store = storage.get_store()
+    prefix = segment_prefix(job_id)
     segment_keys = []
     for seg in files:
         local_path = os.path.join(temp_dir, seg)
-        key = s3_prefix + seg
-        s3.upload_file(local_path, S3_BUCKET, key)
+        key = store.put(local_path, prefix + seg)
         segment_keys.append(key)
-        logger.info(f"Uploaded segment {seg} to s3://{S3_BUCKET}/{key}")
+        logger.info(f"Stored segment {seg} as {store.kind}:{key}")
 
     return segment_keys
 
 
-def transcode_segment(s3_key, output_dir, output_format, output_resolution, output_codec):
-    os.makedirs(output_dir, exist_ok=True)
-    session = boto3.Session(
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
-    s3 = session.client('s3')
-    name = os.path.basename(s3_key)
-    local_in = os.path.join(output_dir, name)
-
-    try:
-        s3.download_file(S3_BUCKET, s3_key, local_in)
-    except ClientError as e:
-        raise RuntimeError(f"Failed to download {s3_key}: {e}")
-
-    out_name = f"transcoded_{name}"
-    local_out = os.path.join(output_dir, out_name)
-    cmd = [
-        'ffmpeg', '-y',
-        '-analyzeduration', '10M',
-        '-probesize', '20M',
-        '-i', local_in,
-        '-vf', f'scale={output_resolution}',
-        '-c:v', output_codec,
-        '-c:a', 'aac',
-        '-f', 'mpegts',
-        local_out
-    ]
-    subprocess.run(cmd, check=True)
-
-    transcoded_key = f"{S3_OUTPUT_PREFIX}{out_name}"
-    try:
-        s3.upload_file(local_out, S3_BUCKET, transcoded_key)
-    except ClientError as e:
-        raise RuntimeError(f"Failed to upload {local_out}: {e}")
+def segment_prefix(job_id):
+    """Key prefix holding a job's source and transcoded segments."""
+    return f"{S3_OUTPUT_PREFIX}segments/{job_id}/"
+
+
+def check_segment_task(segment_key, output_dir, output_format, output_resolution, output_codec, task_slots=1,
+                       preset=None, traceparent=None):
+    """Reject transcode_segment arguments a remote caller could abuse; raises ValueError."""
+    root = f"{S3_OUTPUT_PREFIX}segments/"
+    if not isinstance(segment_key, str) or not segment_key.startswith(root) \
+            or os.path.normpath(segment_key) != segment_key or '..' in segment_key.split('/'):
+        raise ValueError(f"Segment key {segment_key!r} is outside {root}")
+    roots = [os.path.realpath(r) for r in (scratch.SCRATCH_ROOT, scratch.TMPFS_ROOT)]
+    if not isinstance(output_dir, str) or not any(
+            os.path.commonpath([os.path.realpath(output_dir), r]) == r for r in roots):
+        raise ValueError(f"Output directory {output_dir!r} is outside the scratch roots")
+    if not re.fullmatch(r'\d{1,5}[x:]-?\d{1,5}', str(output_resolution)):
+        raise ValueError(f"Bad resolution {output_resolution!r}")
+    for value in (output_format, output_codec, preset or 'default'):
+        if not re.fullmatch(r'[\w-]{1,32}', str(value)):
+            raise ValueError(f"Bad format/codec/preset {value!r}")
+    if not isinstance(task_slots, int) or not 1 <= task_slots <= 1024:
+        raise ValueError(f"Bad task_slots {task_slots!r}")
+    if traceparent is not None and tracing.parse_traceparent(traceparent) is None:
+        raise ValueError(f"Bad traceparent {traceparent!r}")
+
+
+def transcode_segment(segment_key, output_dir, output_format, output_resolution, output_codec, task_slots=1,
+                      preset=None, traceparent=None):
+    # continue the driver's trace so executor work shows up under the job
+    with tracing.continue_trace(traceparent), tracing.span('transcode_segment', key=segment_key):
+        os.makedirs(output_dir, exist_ok=True)
+        plan = plan_resources(concurrent_tasks=task_slots, codec=output_codec, resolution=output_resolution)
+        threads = plan['threads']
+        store = storage.get_store()
+        name = os.path.basename(segment_key)
 
-    return transcoded_key
+        try:
+            local_in = store.fetch(segment_key, os.path.join(output_dir, name))
+        except (ClientError, OSError) as e:
+            raise RuntimeError(f"Failed to fetch {segment_key}: {e}")
+
+        out_name = f"transcoded_{name}"
+        local_out = os.path.join(output_dir, out_name)
+        cmd = [
+            'ffmpeg', '-y',
+            '-analyzeduration', '10M',
+            '-probesize', '20M',
+            *decoder_thread_args(threads),
+            '-i', local_in,
+            '-vf', f'scale={output_resolution}',
+            '-c:v', output_codec,
+            *encoder_thread_args(output_codec, threads),
+            *presets.preset_args(output_codec, preset),
+            '-c:a', 'aac',
+            '-f', 'mpegts',
+            local_out
+        ]
+        # a slot index no concurrent task on this node holds, so pinned encodes never share cores
+        with acquire_slot(plan) as slot:
+            result = run_ffmpeg(cmd, cpus=slot_cpus(plan, slot))
+
+        # keep transcoded chunks next to their sources so concurrent jobs never collide
+        transcoded_key = os.path.dirname(segment_key) + '/' + out_name
+        try:
+            store.put(local_out, transcoded_key)
+        except (ClientError, OSError) as e:
+            raise RuntimeError(f"Failed to store {local_out}: {e}")
+        finally:
+            # remote workers don't share the driver's scratch cleanup
+            for path in (local_in, local_out):
+                if os.path.dirname(path) == output_dir and os.path.exists(path):
+                    os.remove(path)
+
+        # the driver learns the preset speed; executors' preset files are never read
+        return {'key': transcoded_key, 'fps': result.fps, 'threads': threads}
+
+
+def learn_chunk_speeds(output_codec, output_resolution, preset, predicted, parallelism, chunks):
+    """Fold the executors' per-chunk speeds into this node's preset file, per thread budget."""
+    by_threads = {}
+    for chunk in chunks:
+        if chunk.get('fps'):
+            by_threads.setdefault(chunk['threads'], []).append(chunk['fps'])
+    for threads, speeds in by_threads.items():
+        presets.record_speed(output_codec, output_resolution, threads, preset, predicted,
+                             sum(speeds) / len(speeds), parallelism=parallelism)
 
 
 def merge_segments(temp_dir, output_format, output_resolution, base_name, transcoded_keys):
     """
-    Download all transcoded segments from S3, concatenate them,
-    create HLS, and return local paths for upload.
+    Fetch all transcoded segments from the intermediate store, concatenate
+    them, create HLS, and return local paths for upload.
     """
-    s3 = boto3.client('s3')
-
-    for key in transcoded_keys:
-        local_path = os.path.join(temp_dir, os.path.basename(key))
-        s3.download_file(S3_BUCKET, key, local_path)
+    store = storage.get_store()
+    segments = [
+        store.fetch(key, os.path.join(temp_dir, os.path.basename(key)))
+        for key in transcoded_keys
+    ]
 
-    segments = sorted(f for f in os.listdir(temp_dir) if f.startswith('transcoded_') and f.endswith('.ts'))
     list_txt = os.path.join(temp_dir, 'files_list.txt')
     with open(list_txt, 'w') as lf:
         for seg in segments:
@@ -227,6 +307,21 @@ def merge_segments(temp_dir, output_format, output_resolution, base_name, transc
     ]
     subprocess.run(concat_cmd, check=True)
 
+    return output_file, create_hls(output_file, temp_dir, base_name)
+
+
+def remux_source(local_in, temp_dir, output_format, output_resolution, base_name, copy_audio):
+    """
+    Stream-copy a source that already matches the target into the final
+    output file and HLS, without decoding it. Returns local paths for upload.
+    """
+    output_file = os.path.join(temp_dir, f"transcoded_{base_name}_{output_resolution}.{output_format}")
+    run_ffmpeg(remux.remux_cmd(local_in, output_file, output_format, copy_audio))
+    return output_file, create_hls(output_file, temp_dir, base_name)
+
+
+def create_hls(output_file, temp_dir, base_name):
+    """Segment a finished output file into an HLS playlist without re-encoding."""
     hls_playlist = os.path.join(temp_dir, f"hls_{base_name}.m3u8")
     hls_cmd = [
         'ffmpeg', '-y',
@@ -241,68 +336,88 @@ def merge_segments(temp_dir, output_format, output_resolution, base_name, transc
     ]
     subprocess.run(hls_cmd, check=True)
 
-    return output_file, hls_playlist
+    return hls_playlist
 
 
 def upload_and_update(job_id, output_file, hls_playlist, base_name):
     """
     Upload final video and HLS files to S3, update DynamoDB, and return status
     """
-    s3 = boto3.client('s3')
+    s3 = storage.get_s3_client()
 
     video_key     = f"{S3_OUTPUT_PREFIX}{os.path.basename(output_file)}"
-    s3.upload_file(output_file, S3_BUCKET, video_key)
+    metrics.upload_file(s3, output_file, S3_BUCKET, video_key)
 
     playlist_key = f"{S3_OUTPUT_PREFIX}{os.path.basename(hls_playlist)}"
     for fname in os.listdir(os.path.dirname(hls_playlist)):
         if fname.startswith(f"hls_{base_name}"):
             local = os.path.join(os.path.dirname(hls_playlist), fname)
             key   = f"{S3_OUTPUT_PREFIX}{fname}"
-            s3.upload_file(local, S3_BUCKET, key)
+            metrics.upload_file(s3, local, S3_BUCKET, key)
 
     # record video and playlist keys
     update_job_status(job_id, "COMPLETED", output_key=video_key, hls_output_key=playlist_key)
     return f"Job {job_id} completed successfully."
 
 
-def cleanup_s3_segments(job_id, transcoded_keys):
+def cleanup_segments(job_id):
     """
-    Delete all .ts files (original and transcoded segments) from S3 for a given job.
+    Delete a job's original and transcoded segments from the intermediate store.
     """
-    s3 = boto3.client('s3')
     try:
-        segment_prefix = f"{S3_OUTPUT_PREFIX}segments/{job_id}/"
-        response = s3.list_objects_v2(Bucket=S3_BUCKET, Prefix=segment_prefix)
-        objects_to_delete = [{'Key': obj['Key']} for obj in response.get('Contents', []) if obj['Key'].endswith('.ts')]
-
-        if objects_to_delete:
-            s3.delete_objects(Bucket=S3_BUCKET, Delete={'Objects': objects_to_delete})
-            logger.info(f"Deleted {len(objects_to_delete)} original .ts segments for job {job_id}")
+        deleted = storage.get_store().delete_prefix(segment_prefix(job_id))
+        logger.info(f"Deleted {deleted} intermediate segments for job {job_id}")
+    except (ClientError, OSError) as e:
+        logger.error(f"Error deleting segments for job {job_id}: {e}")
 
-        objects_to_delete = [{'Key': key} for key in transcoded_keys if key.endswith('.ts')]
-        if objects_to_delete:
-            s3.delete_objects(Bucket=S3_BUCKET, Delete={'Objects': objects_to_delete})
-            logger.info(f"Deleted {len(objects_to_delete)} transcoded .ts segments for job {job_id}")
 
+def input_size(job):
+    """Size of the job's source object in bytes, or None if it can't be read."""
+    if 'SizeBytes' in job:
+        return int(job['SizeBytes'])
+    try:
+        return storage.get_s3_client().head_object(Bucket=S3_BUCKET, Key=job['InputKey'])['ContentLength']
     except ClientError as e:
-        logger.error(f"Error deleting .ts files for job {job_id}: {e}")
+        logger.error(f"Error reading size of {job['InputKey']}: {e}")
+        return None
 
 
-def process_job(job, spark, output_format, output_resolution, output_codec):
+def claim_job(job):
+    """
+    Reserve scratch space for a job and then lock it.
+    Returns the job's scratch directory, or None if it was not claimed.
+    """
+    job_id = job['JobId']
+    size = input_size(job)
+    if size is None:
+        return None
+
+    temp_dir = scratch.reserve(job_id, scratch.estimate_footprint(size, 'parallel'))
+    if temp_dir is None:
+        return None
+    if not lock_job(job_id):
+        scratch.release(job_id)
+        return None
+    metrics.job_claimed(job)
+    return temp_dir
+
+
+def process_job(job, engine, output_format, output_resolution, output_codec, temp_dir, backlog=0.0):
     job_id    = job['JobId']
     input_key = job['InputKey']
 
-    temp_dir = f"/tmp/transcode_{job_id}_{uuid.uuid4().hex}"
-    os.makedirs(temp_dir, exist_ok=True)
-
     # start timer for entire job
     job_start = time.time()
 
+    status = "COMPLETED"
+
+    # keep the lease alive while Spark works on the job
+    heartbeat = leases.LeaseHeartbeat(table, job_id).start()
     try:
         # Check if already done
         final_key = f"{S3_OUTPUT_PREFIX}transcoded_{os.path.splitext(os.path.basename(input_key))[0]}_{output_resolution}.{output_format}"
         try:
-            boto3.client('s3').head_object(Bucket=S3_BUCKET, Key=final_key)
+            storage.get_s3_client().head_object(Bucket=S3_BUCKET, Key=final_key)
             update_job_status(job_id, "COMPLETED", output_key=final_key)
             logger.info(f"Job {job_id} already complete with final key {final_key}")
             return f"Job {job_id} already complete."
@@ -316,11 +431,12 @@ def process_job(job, spark, output_format, output_resolution, output_codec):
         # Validate input file existence
         logger.info(f"Validating input file s3://{S3_BUCKET}/{input_key}")
         try:
-            boto3.client('s3').head_object(Bucket=S3_BUCKET, Key=input_key)
+            storage.get_s3_client().head_object(Bucket=S3_BUCKET, Key=input_key)
         except ClientError as ce:
             if ce.response['Error']['Code'] == '404':
                 logger.error(f"Input file s3://{S3_BUCKET}/{input_key} does not exist")
                 update_job_status(job_id, "FAILED")
+                status = "FAILED"
                 return f"Job {job_id} failed: Input file {input_key} not found"
             logger.error(f"Error validating input file {input_key}: {ce.response['Error']['Message']} (Code: {ce.response['Error']['Code']})")
             raise
@@ -328,45 +444,88 @@ def process_job(job, spark, output_format, output_resolution, output_codec):
         # Download original
         local_in = os.path.join(temp_dir, os.path.basename(input_key))
         logger.info(f"Downloading input file s3://{S3_BUCKET}/{input_key} to {local_in}")
-        boto3.client('s3').download_file(S3_BUCKET, input_key, local_in)
-
-        # Segment and upload segments
-        logger.info(f"Segmenting video for job {job_id}")
-        segment_keys = segment_video(local_in, temp_dir, job_id)
+        with metrics.stage('download'):
+            source_cache.download_file(storage.get_s3_client(), S3_BUCKET, input_key, local_in)
 
-        # Parallel transcode
-        logger.info(f"Transcoding segments for job {job_id}")
-        rdd = spark.sparkContext.parallelize(segment_keys)
-        transcoded_keys = rdd.map(
-            lambda key: transcode_segment(key, temp_dir, output_format, output_resolution, output_codec)
-        ).collect()
-
-        # Merge and HLS
-        logger.info(f"Merging segments and creating HLS for job {job_id}")
         base_name = os.path.splitext(os.path.basename(input_key))[0]
-        out_file, playlist = merge_segments(temp_dir, output_format, output_resolution, base_name, transcoded_keys)
+        ok, copy_audio, reason = remux.can_remux(
+            remux.source_probe(job, local_in), output_format, output_resolution, output_codec, hls=True
+        )
+        preset, predicted, achieved = None, None, None
+        if ok:
+            # Source already matches the target: remux and package HLS, no decode
+            logger.info(f"Remuxing job {job_id} without re-encoding ({reason})")
+            path = "remux"
+            with metrics.stage('remux'):
+                out_file, playlist = remux_source(local_in, temp_dir, output_format, output_resolution, base_name, copy_audio)
+        else:
+            path = "encode"
+
+            # Segment and upload segments
+            logger.info(f"Segmenting video for job {job_id}")
+            with metrics.stage('segment'):
+                segment_keys = segment_video(local_in, temp_dir, job_id, plan_segment_times(job))
+
+            # Slowest preset that meets the deadline, counting chunks encoded side by side
+            # across the whole cluster (task_slots() is per node) at the executors' thread budget
+            parallelism = max(1, min(len(segment_keys), engine.total_slots()))
+            preset, predicted, why = presets.choose_preset(
+                job, output_codec, output_resolution, engine.task_threads(),
+                parallelism=parallelism, backlog=backlog
+            )
+            logger.info(f"Job {job_id}: preset {preset or 'default'} ({why})")
+
+            # Parallel transcode
+            logger.info(f"Transcoding segments for job {job_id} on the {engine.name} engine")
+            transcode_start = time.time()
+            with metrics.stage('transcode'):
+                chunks = engine.map(
+                    transcode_segment, segment_keys,
+                    temp_dir, output_format, output_resolution, output_codec, engine.task_slots(),
+                    preset, tracing.current_traceparent()
+                )
+            transcoded_keys = [c['key'] for c in chunks]
+            learn_chunk_speeds(output_codec, output_resolution, preset, predicted, parallelism, chunks)
+            frames = presets.job_frames(job)
+            if frames:
+                achieved = frames / (time.time() - transcode_start)
+
+            # Merge and HLS
+            logger.info(f"Merging segments and creating HLS for job {job_id}")
+            with metrics.stage('merge'):
+                out_file, playlist = merge_segments(temp_dir, output_format, output_resolution, base_name, transcoded_keys)
+
+        if heartbeat.lost.is_set():
+            status = "LOST"
+            return f"Job {job_id} was reclaimed by another worker; discarding output."
 
         # Final upload
         logger.info(f"Uploading final outputs for job {job_id}")
-        result = upload_and_update(job_id, out_file, playlist, base_name)
+        with metrics.stage('upload'):
+            result = upload_and_update(job_id, out_file, playlist, base_name)
 
         # record job duration and mode
         job_duration = time.time() - job_start
         logger.info(f"Job {job_id} completed in {job_duration:.2f}s")
-        update_job_status(job_id, "COMPLETED", duration=job_duration, mode="Parallel")
+        update_job_status(job_id, "COMPLETED", duration=job_duration, mode="Parallel", engine=engine.name, path=path,
+                          encode=presets.job_attributes(preset, predicted, achieved))
 
-        # Clean up .ts files from S3
-        logger.info(f"Cleaning up .ts files for job {job_id}")
-        cleanup_s3_segments(job_id, transcoded_keys)
+        # Clean up intermediate segments
+        if path == "encode":
+            logger.info(f"Cleaning up .ts files for job {job_id}")
+            with metrics.stage('cleanup'):
+                cleanup_segments(job_id)
 
         return result
 
     except Exception as e:
         logger.error(f"Processing error for job {job_id}: {str(e)}", exc_info=True)
-        update_job_status(job_id, "FAILED")
-        return f"Job {job_id} failed: {str(e)}"
+        status = leases.release_job(table, job_id, e)
+        return f"Job {job_id} {status.lower()}: {str(e)}"
     finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        heartbeat.stop()
+        scratch.release(job_id)
+        metrics.job_finished(status)
 
 
 def main():
@@ -375,27 +534,41 @@ def main():
         sys.exit(1)
 
     fmt, res, codec = sys.argv[1:]
-    spark = create_spark_session()
+    engine = engines.create_engine(spark_factory=create_spark_session)
+    scratch.reclaim_orphans()
+    metrics.start_metrics_server('multi-node-driver')
     try:
         while True:
             pending = list_pending_jobs()
+            metrics.QUEUE_DEPTH.labels(metrics.WORKER).set(len(pending))
             if not pending:
                 logger.info("No pending jobs. Sleeping...")
+                scratch.reclaim_orphans()
                 time.sleep(60)
                 continue
-
-            locked = [j for j in pending if lock_job(j['JobId'])]
-            if not locked:
+            # Sources already on this node skip the download; take those first
+            pending = source_cache.prefer_cached(pending, S3_BUCKET)
+
+            processed = 0
+            for i, job in enumerate(pending):
+                temp_dir = claim_job(job)
+                if temp_dir is None:
+                    continue
+                # the job's own target; the command line fills in missing attributes
+                j_fmt, j_res, j_codec = presets.job_target(job, fmt, res, codec)
+                with tracing.job_span(job, mode='Parallel', engine=engine.name):
+                    backlog = presets.backlog_seconds(pending[i + 1:], codec, res, engine.total_slots(),
+                                                      engine.task_threads())
+                    logger.info(process_job(job, engine, j_fmt, j_res, j_codec, temp_dir, backlog))
+                processed += 1
+
+            if not processed:
                 logger.info("No jobs locked. Retrying...")
                 time.sleep(10)
-                continue
-
-            for job in locked:
-                logger.info(process_job(job, spark, fmt, res, codec))
     except KeyboardInterrupt:
         logger.info("Shutdown requested")
     finally:
-        spark.stop()
+        engine.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,180 @@
+"""
+Three-stage job pipeline for the single-node workers.
+
+    prefetch thread:  poll -> reserve scratch -> claim -> download   (job N+1)
+    caller's thread:  encode                                         (job N)
+    upload thread:    upload -> mark COMPLETED                       (job N-1)
+
+so the network stays busy while ffmpeg runs and the CPU stays busy while
+files move. At most PIPELINE_DEPTH jobs wait between stages, and the
+prefetcher only claims a job after its scratch reservation succeeds, so
+the number of jobs in flight is bounded by scratch space as well.
+
+Each worker supplies the stage functions; a job's context dict is passed
+from stage to stage. A stage that raises hands the job to `fail` and the
+job leaves the pipeline; `finish` always runs last for every claimed job.
+
+If a stage thread itself dies, the worker stops: every job still in the
+pipeline is failed with PipelineStopped (transient, so it goes back to
+PENDING) and finished, which stops its lease heartbeat, and run() returns
+a non-zero status for the worker script to exit with, so the supervisor
+restarts the worker.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+
+# === CONFIGURATION ===
+PIPELINE_DEPTH = int(os.getenv('TRANSCODE_PIPELINE_DEPTH', '1'))
+IDLE_SLEEP     = 5
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStopped(ConnectionError):
+    """Raised into jobs still in flight when a pipeline thread dies."""
+
+
+class JobPipeline:
+    def __init__(self, poll, claim, download, encode, upload, fail, finish, depth=PIPELINE_DEPTH,
+                 job_ids=lambda ctx: [ctx['job']['JobId']]):
+        """
+        poll()                  -> list of claimable jobs (may sleep when there are none)
+        claim(job, jobs_behind) -> context, or None to skip the job for now
+        download(ctx), encode(ctx), upload(ctx)
+        fail(ctx, error), finish(ctx)
+        job_ids(ctx)            -> JobIds a context holds (several when a claim takes siblings)
+        """
+        self.poll      = poll
+        self.claim     = claim
+        self.download  = download
+        self.encode    = encode
+        self.upload    = upload
+        self.fail      = fail
+        self.finish    = finish
+        self.job_ids   = job_ids
+        self.ready     = queue.Queue(maxsize=max(1, depth))   # downloaded, waiting for the encoder
+        self.encoded   = queue.Queue(maxsize=max(1, depth))   # encoded, waiting for upload
+        self.in_flight = {}                                    # id(ctx) -> ctx for every claimed job
+        self.lock      = threading.Lock()
+        self.stopped   = threading.Event()
+
+    def _retire(self, ctx):
+        """Run `finish` exactly once per claimed job."""
+        with self.lock:
+            if self.in_flight.pop(id(ctx), None) is None:
+                return
+        try:
+            self.finish(ctx)
+        except Exception as e:
+            logger.error(f"Error finishing job: {e}")
+
+    def _fail(self, ctx, error):
+        try:
+            self.fail(ctx, error)
+        except Exception as e:
+            logger.error(f"Error failing job after {error!r}: {e}")
+        self._retire(ctx)
+
+    def _run_stage(self, stage, ctx):
+        """Run one stage; on error fail and retire the job. Returns True if it succeeded."""
+        try:
+            stage(ctx)
+            return True
+        except Exception as e:
+            self._fail(ctx, e)
+            return False
+
+    def _put(self, q, ctx):
+        """Hand a job to the next stage; gives up if the pipeline stops meanwhile."""
+        while not self.stopped.is_set():
+            try:
+                q.put(ctx, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _claimed(self):
+        """JobIds of every job in the pipeline."""
+        with self.lock:
+            return {job_id for ctx in self.in_flight.values() for job_id in self.job_ids(ctx)}
+
+    def _prefetch_loop(self):
+        while not self.stopped.is_set():
+            try:
+                jobs = self.poll()
+            except Exception as e:
+                logger.error(f"Error polling jobs: {e}")
+                time.sleep(IDLE_SLEEP)
+                continue
+            queued = 0
+            taken = set()
+            for i, job in enumerate(jobs):
+                # the poll is stale by now: skip jobs this worker already holds or has
+                # claimed this pass (fan-out siblings) before paying for another claim
+                if job['JobId'] in taken or job['JobId'] in self._claimed():
+                    continue
+                try:
+                    ctx = self.claim(job, jobs[i + 1:])
+                except Exception as e:
+                    logger.error(f"Error claiming job {job.get('JobId')}: {e}")
+                    continue
+                if ctx is None:
+                    continue
+                with self.lock:
+                    self.in_flight[id(ctx)] = ctx
+                taken.update(self.job_ids(ctx))
+                # blocks while the encoder is PIPELINE_DEPTH jobs behind
+                if self._run_stage(self.download, ctx) and self._put(self.ready, ctx):
+                    queued += 1
+            if not queued:
+                # nothing we could take (claimed elsewhere, or no scratch); don't spin
+                time.sleep(IDLE_SLEEP)
+
+    def _upload_loop(self):
+        while not self.stopped.is_set():
+            try:
+                ctx = self.encoded.get(timeout=1)
+            except queue.Empty:
+                continue
+            if self._run_stage(self.upload, ctx):
+                self._retire(ctx)
+
+    def _guarded(self, loop):
+        def run():
+            try:
+                loop()
+            except BaseException as e:
+                logger.critical(f"Pipeline thread {threading.current_thread().name} died: {e!r}", exc_info=True)
+                self.stopped.set()
+        return run
+
+    def shutdown(self):
+        """Stop the stages and release every job still claimed (stopping its heartbeat)."""
+        self.stopped.set()
+        with self.lock:
+            stranded = list(self.in_flight.values())
+        for ctx in stranded:
+            self._fail(ctx, PipelineStopped("worker pipeline stopped"))
+
+    def run(self):
+        """
+        Start the prefetch and upload threads and encode on this thread until
+        a stage thread dies. Returns the exit status for the worker (1).
+        """
+        threading.Thread(target=self._guarded(self._prefetch_loop), name='prefetch', daemon=True).start()
+        threading.Thread(target=self._guarded(self._upload_loop), name='upload', daemon=True).start()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    ctx = self.ready.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if self._run_stage(self.encode, ctx):
+                    self._put(self.encoded, ctx)
+        finally:
+            self.shutdown()
+        return 1
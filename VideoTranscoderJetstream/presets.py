@@ -0,0 +1,266 @@
+"""
+Deadline-aware encoder preset selection.
+
+Each codec has a ladder of presets from slowest (smallest output) to
+fastest. For every job the planner picks the slowest preset whose measured
+encode speed still finishes the job before its deadline while leaving
+time for the backlog queued behind it.
+
+Speeds (frames/s of one encode) are stored per codec, resolution and
+ffmpeg thread budget, so a lone encode on the node's full plan and a
+multi-node chunk on an executor slot's share never share an entry. They
+come from the preset file, seeded with `python presets.py calibrate ...`
+and refined after every encode: the achieved speed is folded into the
+stored value and the achieved/predicted ratio is exported as a metric and
+kept on the job. Multi-node chunks report their speed back to the driver,
+which does the learning, so the file the planner reads is the one updated.
+
+A job's deadline is its Deadline attribute (ISO, UTC) if set, otherwise
+CreatedAt + TRANSCODE_TARGET_TURNAROUND seconds.
+
+Usage:
+    python presets.py calibrate <sample_video> <resolution> <codec> [seconds]
+    python presets.py show
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import logging
+import subprocess
+from decimal import Decimal
+from datetime import datetime, timezone
+
+import metrics
+from resources import plan_resources, _calibration_run
+
+# === CONFIGURATION ===
+PRESET_FILE       = os.getenv(
+    'TRANSCODE_PRESET_FILE',
+    os.path.join(os.path.expanduser('~'), '.transcode_presets.json')
+)
+FIXED_PRESET      = os.getenv('TRANSCODE_PRESET', '')
+TARGET_TURNAROUND = int(os.getenv('TRANSCODE_TARGET_TURNAROUND', '3600'))
+# fraction of the remaining time the encode may use; the rest covers transfers and error
+DEADLINE_SAFETY   = float(os.getenv('TRANSCODE_DEADLINE_SAFETY', '0.7'))
+# weight of a new measurement when updating a stored speed
+SPEED_ALPHA       = 0.2
+
+# slowest -> fastest
+PRESET_LADDERS = {
+    'libx264':   ['veryslow', 'slower', 'slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast'],
+    'libx265':   ['veryslow', 'slower', 'slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast'],
+    'libsvtav1': ['2', '4', '6', '8', '10', '12'],
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _key(codec, resolution, threads):
+    return f"{codec}@{resolution}@{threads}"
+
+
+def _load():
+    try:
+        with open(PRESET_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_speeds(codec, resolution, threads):
+    """{preset: fps} measured for this codec/resolution with `threads` ffmpeg threads."""
+    entries = _load().get(_key(codec, resolution, threads), {})
+    return {p: e['fps'] for p, e in entries.items() if e.get('fps')}
+
+
+def planned_threads(codec, resolution):
+    """Thread budget of a lone encode on this node, the key for its speeds."""
+    return plan_resources(codec=codec, resolution=resolution)['threads']
+
+
+def _update(codec, resolution, threads, preset, fps, replace=False):
+    """Fold a measured speed into the preset file (flock-guarded, shared by workers)."""
+    with open(PRESET_FILE, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            data = json.loads(f.read() or '{}')
+        except ValueError:
+            data = {}
+        entries = data.setdefault(_key(codec, resolution, threads), {})
+        entry = entries.get(preset)
+        if replace or not entry:
+            entry = {'fps': fps, 'samples': 0}
+        else:
+            entry['fps'] = (1 - SPEED_ALPHA) * entry['fps'] + SPEED_ALPHA * fps
+        entry['fps'] = round(entry['fps'], 2)
+        entry['samples'] += 1
+        entry['updated_at'] = int(time.time())
+        entries[preset] = entry
+        f.seek(0)
+        f.truncate()
+        json.dump(data, f, indent=2)
+
+
+def preset_args(codec, preset):
+    """ffmpeg output options selecting the preset (none for ffmpeg's default)."""
+    return ['-preset', preset] if preset else []
+
+
+def job_frames(job):
+    """Frame count of the source from the ingest probe, or None if unknown."""
+    probe = job.get('Probe', {})
+    if probe.get('FrameCount'):
+        return float(probe['FrameCount'])
+    if probe.get('DurationSeconds') and probe.get('FrameRate'):
+        return float(probe['DurationSeconds']) * float(probe['FrameRate'])
+    return None
+
+
+def job_deadline(job):
+    """Epoch seconds by which the job should be done, or None without timestamps."""
+    for attr, offset in (('Deadline', 0), ('CreatedAt', TARGET_TURNAROUND)):
+        try:
+            when = datetime.fromisoformat(job[attr]).replace(tzinfo=timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            continue
+        return when.timestamp() + offset
+    return None
+
+
+def reference_speed(codec, resolution, threads=None):
+    """Speed used to estimate other jobs' encode time: the default preset's, or the median."""
+    if threads is None:
+        threads = planned_threads(codec, resolution)
+    speeds = load_speeds(codec, resolution, threads)
+    if not speeds:
+        return None
+    if 'medium' in speeds:
+        return speeds['medium']
+    return sorted(speeds.values())[len(speeds) // 2]
+
+
+def job_target(job, fmt, resolution, codec):
+    """(format, resolution, codec) the job asks for, defaulting to the worker's own."""
+    return (job.get('OutputFormat') or fmt,
+            job.get('Resolution') or resolution,
+            job.get('VideoCodec') or codec)
+
+
+def backlog_seconds(jobs, codec, resolution, slots=1, threads=None):
+    """
+    Rough encode time of queued jobs, each at its own target's reference
+    speed (codec and resolution are the defaults), spread over `slots`
+    encodes of `threads` threads each (default: a lone encode on this node).
+    """
+    speeds = {}
+    seconds = 0.0
+    for job in jobs:
+        _, j_res, j_codec = job_target(job, None, resolution, codec)
+        if (j_codec, j_res) not in speeds:
+            speeds[j_codec, j_res] = reference_speed(j_codec, j_res, threads)
+        if speeds[j_codec, j_res]:
+            seconds += (job_frames(job) or 0) / speeds[j_codec, j_res]
+    return seconds / max(1, slots)
+
+
+def choose_preset(job, codec, resolution, threads, parallelism=1, backlog=0.0, now=None):
+    """
+    Pick the slowest preset that meets the job's deadline, using speeds
+    measured with `threads` threads per encode and `parallelism` encodes side by side.
+    `backlog` is the encode time still needed by jobs queued behind this one;
+    the chosen preset leaves room for it.
+    Returns (preset or None for ffmpeg's default, predicted fps or None, reason).
+    """
+    ladder = PRESET_LADDERS.get(codec)
+    if not ladder:
+        return None, None, f"no preset ladder for {codec}"
+    speeds = load_speeds(codec, resolution, threads)
+    if FIXED_PRESET:
+        fps = speeds.get(FIXED_PRESET)
+        return FIXED_PRESET, fps * parallelism if fps else None, "TRANSCODE_PRESET"
+
+    measured = [p for p in ladder if p in speeds]
+    if not measured:
+        return None, None, f"no preset speeds for {_key(codec, resolution, threads)}"
+
+    frames = job_frames(job)
+    deadline = job_deadline(job)
+    if not frames or not deadline:
+        return None, None, "job has no frame count or deadline"
+
+    now = time.time() if now is None else now
+    budget = (deadline - now - backlog) * DEADLINE_SAFETY
+    for preset in measured:
+        fps = speeds[preset] * parallelism
+        if frames / fps <= budget:
+            return preset, fps, f"{frames / fps:.0f}s encode fits {budget:.0f}s budget"
+    fastest = measured[-1]
+    return fastest, speeds[fastest] * parallelism, f"deadline unreachable ({budget:.0f}s budget)"
+
+
+def record_speed(codec, resolution, threads, preset, predicted_fps, achieved_fps, parallelism=1, learn=True):
+    """
+    Feed an encode's achieved speed back into the metrics and, with `learn`,
+    the preset file entry for `threads`. `achieved_fps` is for one encode;
+    `predicted_fps` covers `parallelism` of them.
+    """
+    if not preset or not achieved_fps:
+        return
+    if predicted_fps:
+        metrics.PRESET_SPEED_RATIO.labels(metrics.WORKER, codec, preset).observe(
+            achieved_fps * parallelism / predicted_fps
+        )
+    if not learn:
+        return
+    try:
+        _update(codec, resolution, threads, preset, achieved_fps)
+    except OSError as e:
+        logger.warning(f"Could not update {PRESET_FILE}: {e}")
+
+
+def job_attributes(preset, predicted_fps, achieved_fps):
+    """Encode map for the job record (DynamoDB wants Decimal, not float)."""
+    attrs = {'Preset': preset, 'PredictedFps': predicted_fps, 'AchievedFps': achieved_fps}
+    return {k: Decimal(str(round(v, 2))) if isinstance(v, float) else v for k, v in attrs.items() if v}
+
+
+def _sample_fps(sample):
+    out = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=avg_frame_rate',
+         '-of', 'csv=p=0', sample], capture_output=True, text=True, check=True
+    ).stdout.strip()
+    num, _, den = out.partition('/')
+    return float(num) / float(den or 1)
+
+
+def calibrate(sample, resolution, codec, seconds=10):
+    """Measure every preset in the codec's ladder with the node's planned slots/threads."""
+    ladder = PRESET_LADDERS.get(codec)
+    if not ladder:
+        raise ValueError(f"No preset ladder for {codec}; expected one of {sorted(PRESET_LADDERS)}")
+    plan = plan_resources(codec=codec, resolution=resolution)
+    source_fps = _sample_fps(sample)
+    for preset in ladder:
+        speed = _calibration_run(sample, resolution, codec, plan['slots'], plan['threads'], seconds,
+                                 extra_args=preset_args(codec, preset))
+        # _calibration_run reports seconds of video per second across slots; store fps per encode
+        fps = speed / plan['slots'] * source_fps
+        _update(codec, resolution, plan['threads'], preset, round(fps, 2), replace=True)
+        print(f"{preset:<10} {fps:8.1f} fps per encode ({plan['slots']} slots x {plan['threads']} threads)")
+    print(f"Saved to {PRESET_FILE} ({socket.gethostname()})")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'calibrate' and len(sys.argv) in (5, 6):
+        calibrate(*sys.argv[2:5], seconds=int(sys.argv[5]) if len(sys.argv) == 6 else 10)
+    elif command == 'show':
+        print(json.dumps(_load(), indent=2))
+    else:
+        print("Usage: python presets.py calibrate <sample_video> <resolution> <codec> [seconds]\n"
+              "       python presets.py show")
+        sys.exit(1)
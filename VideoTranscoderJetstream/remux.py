@@ -0,0 +1,159 @@
+"""
+Stream-copy fast path for sources that already match the requested output.
+
+If the probed source video is already in the target codec at the target
+resolution, in the pixel format and a profile an encode would produce, and
+carries no rotation, the job only needs a container change (and at most an
+audio re-encode), so the workers remux with `-c copy` instead of decoding
+and re-encoding every frame. Like the encode paths, a remux keeps the first
+audio stream only.
+"""
+import os
+import json
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg encoder / codec names -> codec as reported by ffprobe
+CODEC_ALIASES = {
+    'libx264': 'h264', 'h264': 'h264', 'avc': 'h264',
+    'libx265': 'hevc', 'h265': 'hevc', 'hevc': 'hevc',
+    'libvpx-vp9': 'vp9', 'vp9': 'vp9',
+    'libaom-av1': 'av1', 'libsvtav1': 'av1', 'av1': 'av1',
+    'mpeg4': 'mpeg4',
+}
+
+# codecs each output container can carry without re-encoding
+CONTAINER_VIDEO = {
+    'mp4': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+    'mov': {'h264', 'hevc', 'mpeg4'},
+    'avi': {'h264', 'mpeg4'},
+    'ts':  {'h264', 'hevc'},
+    'mkv': {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'},
+}
+CONTAINER_AUDIO = {
+    'mp4': {'aac', 'mp3', 'ac3', 'eac3', 'opus'},
+    'mov': {'aac', 'mp3', 'ac3'},
+    'avi': {'mp3', 'ac3', 'aac'},
+    'ts':  {'aac', 'mp3', 'ac3', 'eac3'},
+    'mkv': {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'vorbis', 'flac'},
+}
+# HLS segments are MPEG-TS
+HLS_VIDEO = CONTAINER_VIDEO['ts']
+HLS_AUDIO = CONTAINER_AUDIO['ts']
+
+# pixel format every output must have (8-bit 4:2:0 plays everywhere)
+TARGET_PIX_FMT = os.getenv('TRANSCODE_PIX_FMT', 'yuv420p')
+# ffprobe profile names an encode to the codec can produce at TARGET_PIX_FMT
+TARGET_PROFILES = {
+    'h264':  {'Constrained Baseline', 'Baseline', 'Main', 'High'},
+    'hevc':  {'Main'},
+    'vp9':   {'Profile 0'},
+    'av1':   {'Main'},
+    'mpeg4': {'Simple Profile', 'Advanced Simple Profile'},
+}
+
+
+def _rotation(stream):
+    """Rotation in degrees from the stream's rotate tag or display matrix, 0 if none."""
+    rotation = (stream.get('tags') or {}).get('rotate') or 0
+    for side_data in stream.get('side_data_list') or []:
+        rotation = side_data.get('rotation') or rotation
+    try:
+        return int(float(rotation)) % 360
+    except (TypeError, ValueError):
+        return 0
+
+
+def probe_file(path):
+    """Probe a local file with ffprobe into the same shape as the job's Probe map."""
+    out = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path],
+        capture_output=True, text=True, check=True
+    ).stdout
+    data = json.loads(out)
+    info = {'DurationSeconds': float(data.get('format', {}).get('duration', 0) or 0)}
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'video' and 'VideoCodec' not in info:
+            info['VideoCodec'] = stream.get('codec_name')
+            info['Width'], info['Height'] = stream.get('width'), stream.get('height')
+            info['PixFmt'], info['Profile'] = stream.get('pix_fmt'), stream.get('profile')
+            info['Rotation'] = _rotation(stream)
+        elif stream.get('codec_type') == 'audio' and 'AudioCodec' not in info:
+            info['AudioCodec'] = stream.get('codec_name')
+    return info
+
+
+def source_probe(job, local_path=None):
+    """
+    The job's ingest-time Probe, or a local ffprobe of the downloaded source
+    when the Probe lacks the pixel format (the MP4 box parser doesn't read it).
+    """
+    probe = job.get('Probe', {})
+    if probe.get('VideoCodec') and probe.get('PixFmt'):
+        return probe
+    if local_path:
+        try:
+            return probe_file(local_path)
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            logger.warning(f"ffprobe failed on {local_path}: {e}")
+    return probe
+
+
+def parse_resolution(resolution):
+    """'1280x720' or '1280:720' -> (1280, 720); -1/-2 components become None."""
+    w, _, h = resolution.replace(':', 'x').partition('x')
+    to_int = lambda v: int(v) if v.lstrip('-').isdigit() and int(v) > 0 else None
+    return to_int(w), to_int(h)
+
+
+def can_remux(probe, fmt, resolution, codec, hls=False):
+    """
+    Decide whether the source can be stream-copied to the requested output.
+    Returns (ok, copy_audio, reason).
+    """
+    if not probe.get('VideoCodec'):
+        return False, False, "source not probed"
+
+    source_codec = probe['VideoCodec']
+    target_codec = CODEC_ALIASES.get(codec, codec)
+    if source_codec != target_codec:
+        return False, False, f"codec {source_codec} != {target_codec}"
+
+    width, height = parse_resolution(resolution)
+    if (width and int(probe.get('Width') or 0) != width) or (height and int(probe.get('Height') or 0) != height):
+        return False, False, f"resolution {probe.get('Width')}x{probe.get('Height')} != {resolution}"
+
+    pix_fmt = probe.get('PixFmt')
+    if pix_fmt != TARGET_PIX_FMT:
+        return False, False, f"pixel format {pix_fmt or 'unknown'} != {TARGET_PIX_FMT}"
+    profile = probe.get('Profile')
+    if profile not in TARGET_PROFILES.get(source_codec, set()):
+        return False, False, f"{source_codec} profile {profile or 'unknown'} isn't produced by an encode"
+    if int(probe.get('Rotation') or 0):
+        return False, False, f"source is rotated {probe['Rotation']} degrees"
+
+    if source_codec not in CONTAINER_VIDEO.get(fmt, set()) or (hls and source_codec not in HLS_VIDEO):
+        return False, False, f"{source_codec} can't be copied into {fmt}{' / HLS' if hls else ''}"
+
+    audio = probe.get('AudioCodec')
+    copy_audio = audio is None or (
+        audio in CONTAINER_AUDIO.get(fmt, set()) and (not hls or audio in HLS_AUDIO)
+    )
+    return True, copy_audio, "source already matches target"
+
+
+def remux_cmd(local_in, local_out, fmt, copy_audio=True):
+    """ffmpeg command that changes the container without decoding video."""
+    cmd = [
+        'ffmpeg', '-y', '-i', local_in,
+        # first audio stream only: it's the one can_remux checked, and what an encode keeps
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c:v', 'copy',
+        '-c:a', 'copy' if copy_audio else 'aac',
+    ]
+    if fmt in ('mp4', 'mov'):
+        # index up front so players can start before the whole file arrives
+        cmd += ['-movflags', '+faststart']
+    return cmd + [local_out]
@@ -0,0 +1,259 @@
+"""
+Per-node resource planning for the ffmpeg workers.
+
+Works out how many encodes a node should run side by side (slots) and how
+many threads each one gets, so concurrent x264/x265 processes share the
+node's cores instead of each spawning one thread per core.
+
+Settings are resolved in this order:
+  1. TRANSCODE_SLOTS / TRANSCODE_THREADS environment variables
+  2. the calibration file written by `python resources.py calibrate ...`
+  3. cores / concurrent tasks, capped by available memory
+
+Usage:
+    python resources.py calibrate <sample_video> <resolution> <codec> [seconds]
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import logging
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+import psutil
+
+import metrics
+import tracing
+
+# === CONFIGURATION ===
+CALIBRATION_FILE = os.getenv(
+    'TRANSCODE_CALIBRATION_FILE',
+    os.path.join(os.path.expanduser('~'), '.transcode_calibration.json')
+)
+MEM_PER_TASK_GB  = float(os.getenv('TRANSCODE_MEM_PER_TASK_GB', '1.5'))
+PIN_CPUS         = os.getenv('TRANSCODE_PIN_CPUS', '0') == '1'
+SLOT_LOCK_DIR    = os.getenv('TRANSCODE_SLOT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'transcode_slots'))
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores():
+    """Cores this process is allowed to run on (respects cgroup/taskset limits)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_memory_gb():
+    return psutil.virtual_memory().available / (1024 ** 3)
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def load_calibration(codec, resolution):
+    """Return the calibrated {"slots", "threads", "speed"} entry for this node, if any."""
+    try:
+        with open(CALIBRATION_FILE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    entry = data.get(f"{codec}@{resolution}")
+    if entry and entry.get('cores') == len(available_cores()):
+        return entry
+    return None
+
+
+def plan_resources(concurrent_tasks=None, codec=None, resolution=None):
+    """
+    Return a resource plan dict with the number of concurrent encode slots,
+    the ffmpeg thread budget per slot, and the node totals it was based on.
+    """
+    cores = available_cores()
+    calibrated = load_calibration(codec, resolution) if codec and resolution else None
+
+    slots = _env_int('TRANSCODE_SLOTS') or concurrent_tasks \
+        or (calibrated or {}).get('slots') or 1
+    mem_slots = max(1, int(available_memory_gb() // MEM_PER_TASK_GB))
+    if slots > mem_slots:
+        logger.warning(f"Reducing encode slots from {slots} to {mem_slots} to fit in memory")
+        slots = mem_slots
+
+    threads = _env_int('TRANSCODE_THREADS')
+    if threads is None and calibrated and calibrated.get('slots') == slots:
+        threads = calibrated.get('threads')
+    if threads is None:
+        threads = max(1, len(cores) // slots)
+
+    return {
+        'slots':   slots,
+        'threads': threads,
+        'cores':   len(cores),
+        'pin':     PIN_CPUS,
+    }
+
+
+def slot_cpus(plan, slot):
+    """CPU set for the given slot, or None when pinning is disabled (or no slot was free)."""
+    if not plan.get('pin') or slot is None:
+        return None
+    cores = available_cores()
+    n = plan['threads']
+    start = (slot % plan['slots']) * n
+    return [cores[(start + i) % len(cores)] for i in range(n)]
+
+
+@contextmanager
+def acquire_slot(plan):
+    """
+    Hold a slot index no other task on this node is using, for slot_cpus().
+    Slots are flock'd files, so a crashed task's slot frees itself. Yields
+    None when pinning is off or every slot is taken (the encode runs unpinned).
+    """
+    if not plan.get('pin'):
+        yield None
+        return
+    os.makedirs(SLOT_LOCK_DIR, exist_ok=True)
+    for slot in range(plan['slots']):
+        f = open(os.path.join(SLOT_LOCK_DIR, f"slot-{slot}.lock"), 'a+')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        try:
+            yield slot
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+        return
+    logger.warning(f"All {plan['slots']} CPU slots are busy; running unpinned")
+    yield None
+
+
+def decoder_thread_args(threads):
+    """ffmpeg input options limiting the decoder thread pool."""
+    return ['-threads', str(threads)]
+
+
+def encoder_thread_args(codec, threads):
+    """ffmpeg output options limiting encoder and filter graph threads."""
+    args = ['-threads', str(threads), '-filter_threads', str(threads)]
+    if codec in ('libx265', 'h265', 'hevc'):
+        args += ['-x265-params', f'pools={threads}']
+    return args
+
+
+def _progress_frames(output):
+    """Last frame count reported by ffmpeg's -progress output."""
+    frames = 0
+    for line in output.splitlines():
+        if line.startswith('frame='):
+            try:
+                frames = int(line.split('=', 1)[1])
+            except ValueError:
+                pass
+    return frames
+
+
+def run_ffmpeg(cmd, cpus=None):
+    """
+    Run an ffmpeg command, optionally pinned to a set of CPUs, and record
+    its encode fps and CPU/memory use in the worker metrics. Returns the
+    CompletedProcess with `.fps` set (None if ffmpeg reported no frames).
+    """
+    preexec = None
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        preexec = lambda: os.sched_setaffinity(0, cpus)
+
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    codec = cmd[cmd.index('-c:v') + 1] if '-c:v' in cmd else 'copy'
+
+    with tracing.span('ffmpeg', codec=codec, output=os.path.basename(cmd[-1]), cpus=len(cpus or [])) as attrs:
+        before = metrics.children_usage()
+        start = time.perf_counter()
+        result = subprocess.run(cmd, check=True, preexec_fn=preexec, stdout=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+        metrics.record_ffmpeg_usage(before, metrics.children_usage())
+
+        frames = _progress_frames(result.stdout)
+        attrs['frames'] = frames
+        result.fps = None
+        if frames and elapsed > 0:
+            result.fps = attrs['fps'] = round(frames / elapsed, 2)
+            metrics.ENCODE_FPS.labels(metrics.WORKER, codec).observe(frames / elapsed)
+    return result
+
+
+def _calibration_run(sample, resolution, codec, slots, threads, seconds, extra_args=()):
+    """Encode `seconds` of the sample in `slots` parallel processes; return aggregate speed."""
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        *decoder_thread_args(threads),
+        '-t', str(seconds), '-i', sample,
+        '-vf', f'scale={resolution}',
+        '-c:v', codec,
+        *encoder_thread_args(codec, threads),
+        *extra_args,
+        '-an', '-f', 'null', '-'
+    ]
+    plan = {'slots': slots, 'threads': threads, 'pin': PIN_CPUS}
+    start = time.time()
+    procs = []
+    for slot in range(slots):
+        cpus = slot_cpus(plan, slot)
+        preexec = (lambda c=cpus: os.sched_setaffinity(0, c)) if cpus else None
+        procs.append(subprocess.Popen(cmd, preexec_fn=preexec))
+    for p in procs:
+        if p.wait() != 0:
+            raise subprocess.CalledProcessError(p.returncode, cmd)
+    elapsed = time.time() - start
+    # seconds of video encoded per wall-clock second, across all slots
+    return slots * seconds / elapsed
+
+
+def calibrate(sample, resolution, codec, seconds=10):
+    """
+    Try slot/thread splits of this node's cores with a short encode of the
+    sample and store the one with the highest aggregate throughput.
+    """
+    cores = len(available_cores())
+    candidates = sorted({s for s in (1, 2, 3, 4, 6, 8, 12, 16) if s <= cores} | {cores})
+
+    best = None
+    for slots in candidates:
+        threads = max(1, cores // slots)
+        speed = _calibration_run(sample, resolution, codec, slots, threads, seconds)
+        print(f"slots={slots:<3} threads={threads:<3} speed={speed:.2f}x")
+        if best is None or speed > best['speed']:
+            best = {'slots': slots, 'threads': threads, 'speed': round(speed, 3)}
+
+    best['cores'] = cores
+    best['host'] = socket.gethostname()
+    best['calibrated_at'] = int(time.time())
+
+    try:
+        with open(CALIBRATION_FILE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data[f"{codec}@{resolution}"] = best
+    with open(CALIBRATION_FILE, 'w') as f:
+        json.dump(data, f, indent=2)
+
+    print(f"Best: {best['slots']} slots x {best['threads']} threads ({best['speed']}x), "
+          f"saved to {CALIBRATION_FILE}")
+    return best
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (5, 6) or sys.argv[1] != 'calibrate':
+        print("Usage: python resources.py calibrate <sample_video> <resolution> <codec> [seconds]")
+        sys.exit(1)
+    calibrate(*sys.argv[2:5], seconds=int(sys.argv[5]) if len(sys.argv) == 6 else 10)
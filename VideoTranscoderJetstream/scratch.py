@@ -0,0 +1,210 @@
+"""
+Node-wide scratch space manager for transcode jobs.
+
+Every worker process on a node shares one reservation ledger (a JSON file
+guarded by an flock), so a job is only claimed when the disk can actually
+hold its intermediates on top of everything already reserved. Small jobs
+are placed on tmpfs when it has room. Directories left behind by crashed
+workers are reclaimed on startup and between polls.
+"""
+import os
+import json
+import time
+import shutil
+import fcntl
+import socket
+import logging
+import tempfile
+from contextlib import contextmanager
+
+import psutil
+
+# === CONFIGURATION ===
+SCRATCH_ROOT     = os.getenv('TRANSCODE_SCRATCH_DIR', tempfile.gettempdir())
+TMPFS_ROOT       = os.getenv('TRANSCODE_TMPFS_DIR', '/dev/shm')
+TMPFS_MAX_BYTES  = int(os.getenv('TRANSCODE_TMPFS_MAX_MB', '512')) * 1024 ** 2
+HEADROOM_BYTES   = int(os.getenv('TRANSCODE_SCRATCH_HEADROOM_MB', '1024')) * 1024 ** 2
+ORPHAN_GRACE_SEC = int(os.getenv('TRANSCODE_ORPHAN_GRACE_SEC', '3600'))
+
+LEDGER_FILE = os.path.join(SCRATCH_ROOT, '.transcode_scratch.json')
+LOCK_FILE   = LEDGER_FILE + '.lock'
+DIR_PREFIX  = 'transcode_'
+OWNER_FILE  = '.owner'
+
+# Peak scratch usage as a multiple of the input size, per pipeline:
+#   single   - source + encoded output
+#   parallel - source + segments + transcoded segments + merged file + HLS
+FOOTPRINT_FACTOR = {
+    'single':   2.5,
+    'parallel': 5.0,
+}
+
+HOST = socket.gethostname()
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientScratchError(RuntimeError):
+    pass
+
+
+def estimate_footprint(input_bytes, mode='single'):
+    """Estimate peak scratch bytes for a job from its input size."""
+    return int(input_bytes * FOOTPRINT_FACTOR.get(mode, FOOTPRINT_FACTOR['single'])) + 64 * 1024 ** 2
+
+
+@contextmanager
+def _ledger():
+    """Yield the reservation ledger dict under an exclusive node-wide lock."""
+    os.makedirs(SCRATCH_ROOT, exist_ok=True)
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(LEDGER_FILE) as f:
+                    ledger = json.load(f)
+            except (OSError, ValueError):
+                ledger = {}
+            yield ledger
+            tmp = LEDGER_FILE + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(ledger, f)
+            os.replace(tmp, LEDGER_FILE)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _outstanding(ledger, root):
+    """Bytes reserved on `root` but not yet written to disk."""
+    return sum(
+        max(0, r['bytes'] - _dir_size(r['path']))
+        for r in ledger.values() if r['root'] == root
+    )
+
+
+def _free_bytes(path):
+    try:
+        return psutil.disk_usage(path).free
+    except OSError:
+        return 0
+
+
+def _pick_root(ledger, nbytes):
+    """Return the scratch root that can hold `nbytes`, preferring tmpfs for small jobs."""
+    if nbytes <= TMPFS_MAX_BYTES and os.path.isdir(TMPFS_ROOT):
+        # tmpfs is backed by RAM, so leave memory for ffmpeg itself
+        tmpfs_free = min(_free_bytes(TMPFS_ROOT), psutil.virtual_memory().available // 2)
+        if tmpfs_free - _outstanding(ledger, TMPFS_ROOT) >= nbytes:
+            return TMPFS_ROOT
+    shortfall = nbytes - (_free_bytes(SCRATCH_ROOT) - _outstanding(ledger, SCRATCH_ROOT) - HEADROOM_BYTES)
+    if shortfall <= 0:
+        return SCRATCH_ROOT
+    # cached sources give way to jobs (imported here: source_cache imports this module)
+    import source_cache
+    if source_cache.make_room(shortfall, SCRATCH_ROOT) >= shortfall:
+        return SCRATCH_ROOT
+    return None
+
+
+def reserve(job_id, nbytes):
+    """
+    Reserve `nbytes` of scratch for a job and create its directory.
+    Returns the directory path, or None if the node cannot hold the job now.
+    """
+    with _ledger() as ledger:
+        if job_id in ledger:
+            return ledger[job_id]['path']
+        root = _pick_root(ledger, nbytes)
+        if root is None:
+            logger.info(f"Not enough scratch space for job {job_id} ({nbytes / 1024 ** 3:.2f} GB)")
+            return None
+
+        path = tempfile.mkdtemp(prefix=f"{DIR_PREFIX}{job_id}_", dir=root)
+        with open(os.path.join(path, OWNER_FILE), 'w') as f:
+            json.dump({'pid': os.getpid(), 'host': HOST, 'job_id': job_id}, f)
+
+        ledger[job_id] = {
+            'bytes': nbytes,
+            'root':  root,
+            'path':  path,
+            'pid':   os.getpid(),
+            'host':  HOST,
+            'at':    time.time(),
+        }
+    logger.info(f"Reserved {nbytes / 1024 ** 2:.0f} MB scratch for job {job_id} at {path}")
+    return path
+
+
+def release(job_id):
+    """Delete a job's scratch directory and drop its reservation."""
+    with _ledger() as ledger:
+        entry = ledger.pop(job_id, None)
+    if entry:
+        shutil.rmtree(entry['path'], ignore_errors=True)
+
+
+@contextmanager
+def scratch_dir(job_id, nbytes):
+    """Context manager form of reserve()/release(); raises if space is unavailable."""
+    path = reserve(job_id, nbytes)
+    if path is None:
+        raise InsufficientScratchError(f"Insufficient scratch space for job {job_id}")
+    try:
+        yield path
+    finally:
+        release(job_id)
+
+
+def _owner_alive(pid, host):
+    return host != HOST or psutil.pid_exists(pid)
+
+
+def reclaim_orphans():
+    """
+    Remove reservations and scratch directories whose owning process has died,
+    plus unowned transcode_* directories older than the grace period.
+    """
+    reclaimed = 0
+    with _ledger() as ledger:
+        for job_id, entry in list(ledger.items()):
+            if not _owner_alive(entry['pid'], entry['host']):
+                shutil.rmtree(entry['path'], ignore_errors=True)
+                del ledger[job_id]
+                reclaimed += 1
+        live_paths = {entry['path'] for entry in ledger.values()}
+
+    now = time.time()
+    for root in {SCRATCH_ROOT, TMPFS_ROOT}:
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+        for name in names:
+            path = os.path.join(root, name)
+            if not name.startswith(DIR_PREFIX) or path in live_paths or not os.path.isdir(path):
+                continue
+            try:
+                with open(os.path.join(path, OWNER_FILE)) as f:
+                    owner = json.load(f)
+                if _owner_alive(owner['pid'], owner['host']):
+                    continue
+            except (OSError, ValueError, KeyError):
+                if now - os.path.getmtime(path) < ORPHAN_GRACE_SEC:
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            reclaimed += 1
+
+    if reclaimed:
+        logger.info(f"Reclaimed {reclaimed} orphaned scratch directories")
+    return reclaimed
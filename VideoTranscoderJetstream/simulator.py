@@ -0,0 +1,400 @@
+"""
+Discrete-event simulator for the transcode workers, driven by job history.
+
+Replays the jobs table (CreatedAt, SizeBytes / Probe duration, Mode,
+TranscodePath, DurationSeconds) through a model of both worker types:
+
+  single-node  N workers polling the table; each job is download -> encode
+               -> upload, and the pipeline lets the next download start
+               while the current job encodes
+  multi-node   one driver polling the table and running one job at a time:
+               download -> segment -> chunk encodes over nodes x slots
+               -> merge -> upload
+
+Encode rates (seconds of work per second of media) are fitted from the
+history. The fit is validated on the half of the history it was not fitted
+on: DurationSeconds is predicted per job and compared as MAPE per mode.
+Queue waits from a replay under the first configuration are also compared
+with ClaimedAt - CreatedAt where it is recorded. Every knob below can take
+a comma-separated list; all combinations are simulated and compared on
+queue wait, turnaround, utilization and cost.
+
+Usage:
+    python simulator.py [--jobs scan.json] [--single-workers 1,2,4] [--nodes 0,2,4] [--slots 2]
+                        [--chunk-seconds 60,120] [--poll-interval 30] [--route history,shared,size:500]
+                        [--no-pipeline] [--node-cost 0.34] [--json results.json]
+
+Without --jobs the TranscodeJobs table is scanned (needs boto3 and AWS
+credentials); `aws dynamodb scan --table-name TranscodeJobs > scan.json`
+works offline.
+"""
+import os
+import sys
+import json
+import math
+import heapq
+import argparse
+import itertools
+from collections import deque, defaultdict
+from datetime import datetime, timezone
+from statistics import median
+
+# === CONFIGURATION ===
+DYNAMODB_TABLE     = 'TranscodeJobs'
+BANDWIDTH_MB       = 100     # S3 transfer rate per worker, MB/s
+COPY_RATE          = 0.005   # seconds per media second to segment or merge with stream copy
+TASK_OVERHEAD      = 2.0     # scheduling + store round trip per chunk, seconds
+DRIVER_POLL        = 60      # multiNodeTranscoder sleeps this long on an empty table
+DEFAULT_RATE       = 0.5     # encode seconds per media second when the history has none
+DEFAULT_BYTES_RATE = 1e6     # source bytes per media second when no job was probed
+
+_DYNAMO_TYPES = {'S', 'N', 'BOOL', 'NULL', 'M', 'L'}
+
+
+def _plain(value):
+    """Strip DynamoDB type tags ({'N': '12'}) from an `aws dynamodb scan` export."""
+    if isinstance(value, dict):
+        if len(value) == 1 and next(iter(value)) in _DYNAMO_TYPES:
+            tag, v = next(iter(value.items()))
+            if tag == 'N':
+                return float(v)
+            if tag == 'NULL':
+                return None
+            return _plain(v)
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _epoch(iso):
+    try:
+        return datetime.fromisoformat(iso).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_history(path=None):
+    """Job items from a scan export, or straight from the table."""
+    if path:
+        with open(path) as f:
+            data = json.load(f)
+        items = _plain(data['Items'] if isinstance(data, dict) else data)
+    else:
+        import boto3
+        table = boto3.resource('dynamodb').Table(DYNAMODB_TABLE)
+        items, kwargs = [], {}
+        while True:
+            resp = table.scan(**kwargs)
+            items += resp.get('Items', [])
+            if 'LastEvaluatedKey' not in resp:
+                break
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    jobs = []
+    for item in items:
+        created = _epoch(item.get('CreatedAt'))
+        if created is None:
+            continue
+        probe = item.get('Probe') or {}
+        jobs.append({
+            'id':       item['JobId'],
+            'created':  created,
+            'claimed':  _epoch(item.get('ClaimedAt')),
+            'size':     float(item.get('SizeBytes') or 0),
+            'media':    float(probe.get('DurationSeconds') or 0) or None,
+            'mode':     item.get('Mode'),
+            'path':     item.get('TranscodePath') or 'encode',
+            'duration': float(item['DurationSeconds']) if item.get('DurationSeconds') is not None else None,
+        })
+    return sorted(jobs, key=lambda j: j['created'])
+
+
+# ---- service model ----
+
+def _work(job, model):
+    """Seconds of media in the job (estimated from its size if it was never probed)."""
+    return job['media'] or job['size'] / model['bytes_rate'] or 1.0
+
+
+def _transfer(job, model):
+    return job['size'] / model['bandwidth']
+
+
+def _chunks(job, model, cfg):
+    work = _work(job, model)
+    return max(1, math.ceil(work / cfg['chunk_seconds'])), min(cfg['chunk_seconds'], work)
+
+
+def single_times(job, model):
+    """(download, ffmpeg, upload) seconds on a single-node worker; output assumed input-sized."""
+    rate = model['rates'].get(('Single', job['path']), model['rates'][('Single', 'encode')])
+    transfer = _transfer(job, model)
+    return transfer, _work(job, model) * rate, transfer
+
+
+def parallel_times(job, model, cfg):
+    """(wall seconds, executor-slot seconds) for one job on the multi-node driver."""
+    transfers = 2 * _transfer(job, model)
+    work = _work(job, model)
+    if job['path'] == 'remux':
+        # no segments: remux + HLS packaging on the driver
+        return transfers + work * model['rates'][('Parallel', 'remux')], 0.0
+    chunks, chunk = _chunks(job, model, cfg)
+    slots = max(1, cfg['nodes'] * cfg['slots'])
+    chunk_time = chunk * model['chunk_rate'] + TASK_OVERHEAD
+    waves = math.ceil(chunks / slots)
+    return transfers + 2 * work * COPY_RATE + waves * chunk_time, chunks * chunk_time
+
+
+def predicted_duration(job, model, cfg):
+    """What the worker would record as DurationSeconds: ffmpeg time (single) or the whole job (parallel)."""
+    if job['mode'] == 'Parallel':
+        return parallel_times(job, model, cfg)[0]
+    return single_times(job, model)[1]
+
+
+def fit(jobs, cfg, bandwidth=BANDWIDTH_MB * 1e6):
+    """Fit encode rates from jobs with a recorded DurationSeconds."""
+    probed = [j['size'] / j['media'] for j in jobs if j['media'] and j['size']]
+    model = {
+        'bandwidth':  bandwidth,
+        'bytes_rate': median(probed) if probed else DEFAULT_BYTES_RATE,
+        'rates':      {},
+    }
+    samples = defaultdict(list)
+    chunk_rates = []
+    for j in jobs:
+        if not j['duration'] or j['mode'] not in ('Single', 'Parallel'):
+            continue
+        work = _work(j, model)
+        if j['mode'] == 'Single':
+            samples[('Single', j['path'])].append(j['duration'] / work)
+        elif j['path'] == 'remux':
+            samples[('Parallel', 'remux')].append(max(0.0, j['duration'] - 2 * _transfer(j, model)) / work)
+        else:
+            # invert parallel_times under the cluster the history ran on
+            chunks, chunk = _chunks(j, model, cfg)
+            waves = math.ceil(chunks / max(1, cfg['nodes'] * cfg['slots']))
+            chunk_time = (j['duration'] - 2 * _transfer(j, model) - 2 * work * COPY_RATE) / waves
+            if chunk_time > TASK_OVERHEAD:
+                chunk_rates.append((chunk_time - TASK_OVERHEAD) / chunk)
+    for key, values in samples.items():
+        model['rates'][key] = median(values)
+    single = model['rates'].setdefault(('Single', 'encode'), DEFAULT_RATE)
+    model['rates'].setdefault(('Single', 'remux'), single * 0.05)
+    model['rates'].setdefault(('Parallel', 'remux'), model['rates'][('Single', 'remux')])
+    # an executor slot has 1/slots of a node's cores
+    model['chunk_rate'] = median(chunk_rates) if chunk_rates else single * cfg['slots']
+    return model
+
+
+# ---- discrete-event simulation ----
+
+def _route(job, policy):
+    """Queue a job waits in: 'Single', 'Parallel' or the shared 'Any'."""
+    if policy == 'shared':
+        return 'Any'
+    if policy.startswith('size:'):
+        return 'Parallel' if job['size'] > float(policy[5:]) * 1024 ** 2 else 'Single'
+    return 'Parallel' if job['mode'] == 'Parallel' else 'Single'
+
+
+def simulate(jobs, model, cfg):
+    """Replay the arrivals under `cfg`; returns per-job results and pool busy time."""
+    events, seq = [], itertools.count()
+
+    def at(t, kind, who=None, job=None):
+        heapq.heappush(events, (t, next(seq), kind, who, job))
+
+    queues = {'Single': deque(), 'Parallel': deque(), 'Any': deque()}
+    parallel = cfg['nodes'] > 0
+    for j in jobs:
+        if not parallel:
+            route = 'Single'
+        elif not cfg['single_workers']:
+            route = 'Parallel'
+        else:
+            route = _route(j, cfg['route'])
+        at(j['created'], 'arrive', job=dict(j, route=route))
+    arrivals = len(jobs)
+
+    start = jobs[0]['created'] if jobs else 0.0
+    # workers start polling at staggered offsets, like independently started processes
+    for w in range(cfg['single_workers']):
+        at(start + cfg['poll_interval'] * w / max(1, cfg['single_workers']), 'poll', ('single', w))
+    if parallel:
+        at(start, 'poll', ('driver', 0))
+
+    encoder_free = defaultdict(float)
+    upload_free  = defaultdict(float)
+    busy = {'single': 0.0, 'slots': 0.0}
+    results = []
+
+    def take(who):
+        order = ('Single', 'Any') if who[0] == 'single' else ('Parallel', 'Any')
+        candidates = [queues[q][0] for q in order if queues[q]]
+        if not candidates:
+            return None
+        job = min(candidates, key=lambda j: j['created'])
+        queues[job['route']].popleft()
+        return job
+
+    while events:
+        now, _, kind, who, job = heapq.heappop(events)
+        if kind == 'arrive':
+            queues[job['route']].append(job)
+            arrivals -= 1
+            continue
+
+        job = take(who)
+        if job is None:
+            if not arrivals and not any(queues.values()):
+                # history replayed; this worker stops polling
+                continue
+            # empty table: sleep and poll again
+            at(now + (cfg['poll_interval'] if who[0] == 'single' else DRIVER_POLL), 'poll', who)
+            continue
+
+        if who[0] == 'single':
+            download, encode, upload = single_times(job, model)
+            encode_start = max(now + download, encoder_free[who])
+            encode_end = encoder_free[who] = encode_start + encode
+            done = upload_free[who] = max(encode_end, upload_free[who]) + upload
+            busy['single'] += encode
+            # with the pipeline the next claim happens once this job reaches the encoder
+            at(encode_start if cfg['pipeline'] else done, 'poll', who)
+            mode = 'Single'
+        else:
+            wall, slot_seconds = parallel_times(job, model, cfg)
+            done = now + wall
+            busy['slots'] += slot_seconds
+            at(done, 'poll', who)
+            mode = 'Parallel'
+        results.append({'id': job['id'], 'mode': mode, 'created': job['created'],
+                        'wait': now - job['created'], 'turnaround': done - job['created'], 'done': done})
+    return results, busy
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def summarize(results, busy, cfg):
+    if not results:
+        return {}
+    span = max(r['done'] for r in results) - min(r['created'] for r in results) or 1.0
+    waits = [r['wait'] for r in results]
+    turnarounds = [r['turnaround'] for r in results]
+    # one node per single-node worker group of `slots`, plus the cluster and its driver
+    nodes = math.ceil(cfg['single_workers'] / cfg['slots']) + (cfg['nodes'] + 1 if cfg['nodes'] else 0)
+    cost = nodes * span / 3600 * cfg['node_cost']
+    return {
+        'jobs':            len(results),
+        'wait_p50':        _pct(waits, 50),
+        'wait_p95':        _pct(waits, 95),
+        'turnaround_p50':  _pct(turnarounds, 50),
+        'turnaround_p95':  _pct(turnarounds, 95),
+        'single_util':     busy['single'] / (cfg['single_workers'] * span) if cfg['single_workers'] else 0.0,
+        'cluster_util':    busy['slots'] / (cfg['nodes'] * cfg['slots'] * span) if cfg['nodes'] else 0.0,
+        'cost':            cost,
+        'cost_per_job':    cost / len(results),
+    }
+
+
+def validate(jobs, cfg, bandwidth=BANDWIDTH_MB * 1e6):
+    """Fit on even-indexed jobs, score DurationSeconds on the odd ones; replay waits vs ClaimedAt."""
+    model = fit(jobs[::2], cfg, bandwidth)
+    report = {}
+    for mode in ('Single', 'Parallel'):
+        held_out = [j for j in jobs[1::2] if j['mode'] == mode and j['duration']]
+        if held_out:
+            errors = [abs(predicted_duration(j, model, cfg) - j['duration']) / j['duration'] for j in held_out]
+            report[f'{mode.lower()}_mape'] = 100 * sum(errors) / len(errors)
+            report[f'{mode.lower()}_jobs'] = len(held_out)
+
+    claimed = {j['id']: j['claimed'] - j['created'] for j in jobs if j['claimed']}
+    if claimed:
+        results, _ = simulate(jobs, fit(jobs, cfg, bandwidth), dict(cfg, route='history'))
+        errors = [abs(r['wait'] - claimed[r['id']]) for r in results if r['id'] in claimed]
+        if errors:
+            report['wait_mae'] = sum(errors) / len(errors)
+            report['wait_actual_p50'] = _pct(list(claimed.values()), 50)
+    return report
+
+
+def _list(cast):
+    return lambda text: [cast(v) for v in text.split(',')]
+
+
+def run(args):
+    jobs = load_history(args.jobs)
+    if not jobs:
+        print("No jobs with a CreatedAt to replay")
+        sys.exit(1)
+    print(f"Replaying {len(jobs)} jobs from "
+          f"{datetime.fromtimestamp(jobs[0]['created'], timezone.utc):%Y-%m-%d %H:%M} to "
+          f"{datetime.fromtimestamp(jobs[-1]['created'], timezone.utc):%Y-%m-%d %H:%M} UTC")
+
+    configs = [
+        {'single_workers': w, 'nodes': n, 'slots': args.slots, 'chunk_seconds': c, 'poll_interval': p,
+         'route': r, 'pipeline': not args.no_pipeline, 'node_cost': args.node_cost}
+        for w, n, c, p, r in itertools.product(args.single_workers, args.nodes, args.chunk_seconds,
+                                               args.poll_interval, args.route)
+    ]
+    # the first configuration is taken to be the one the history ran on
+    baseline = configs[0]
+    validation = validate(jobs, baseline, args.bandwidth_mb * 1e6)
+    print("\nValidation (fit on half the history, scored on the other half)")
+    for mode in ('single', 'parallel'):
+        if f'{mode}_mape' in validation:
+            print(f"  {mode:<8} DurationSeconds MAPE {validation[f'{mode}_mape']:6.1f}%  "
+                  f"({validation[f'{mode}_jobs']} jobs)")
+    if 'wait_mae' in validation:
+        print(f"  queue wait MAE {validation['wait_mae']:.0f}s  (actual p50 {validation['wait_actual_p50']:.0f}s)")
+    if not validation:
+        print("  no completed jobs with DurationSeconds; using default rates")
+
+    model = fit(jobs, baseline, args.bandwidth_mb * 1e6)
+    rows = []
+    print(f"\n{'workers':>7} {'nodes':>5} {'chunk':>5} {'poll':>4} {'route':<10} "
+          f"{'wait p50':>9} {'wait p95':>9} {'turn p50':>9} {'turn p95':>9} "
+          f"{'single%':>7} {'cluster%':>8} {'cost':>8} {'$/job':>7}")
+    for cfg in configs:
+        if not cfg['single_workers'] and not cfg['nodes']:
+            continue
+        summary = summarize(*simulate(jobs, model, cfg), cfg)
+        rows.append(dict(cfg, **summary))
+        print(f"{cfg['single_workers']:>7} {cfg['nodes']:>5} {cfg['chunk_seconds']:>5g} {cfg['poll_interval']:>4g} "
+              f"{cfg['route']:<10} {summary['wait_p50']:>8.0f}s {summary['wait_p95']:>8.0f}s "
+              f"{summary['turnaround_p50']:>8.0f}s {summary['turnaround_p95']:>8.0f}s "
+              f"{100 * summary['single_util']:>6.1f}% {100 * summary['cluster_util']:>7.1f}% "
+              f"{summary['cost']:>8.2f} {summary['cost_per_job']:>7.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'validation': validation, 'configs': rows, 'args': vars(args),
+                       'model': dict(model, rates={'/'.join(k): v for k, v in model['rates'].items()})},
+                      f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay job history against alternative worker configurations")
+    parser.add_argument('--jobs', help="JSON export of the jobs table (default: scan DynamoDB)")
+    parser.add_argument('--single-workers', type=_list(int), default=[1], help="single-node worker processes")
+    parser.add_argument('--nodes', type=_list(int), default=[2], help="multi-node cluster size (0 = none)")
+    parser.add_argument('--slots', type=int, default=int(os.getenv('TRANSCODE_SLOTS', '2')),
+                        help="executor slots per node / single-node workers per node")
+    parser.add_argument('--chunk-seconds', type=_list(float), default=[120.0], help="multi-node segment length")
+    parser.add_argument('--poll-interval', type=_list(float), default=[30.0], help="single-node idle poll, seconds")
+    parser.add_argument('--route', type=_list(str), default=['history'],
+                        help="history (recorded Mode), shared (first free worker) or size:<MB> threshold")
+    parser.add_argument('--no-pipeline', action='store_true', help="single-node workers without prefetch/upload overlap")
+    parser.add_argument('--bandwidth-mb', type=float, default=BANDWIDTH_MB, help="S3 MB/s per worker")
+    parser.add_argument('--node-cost', type=float, default=0.34, help="$ per node-hour")
+    parser.add_argument('--json', help="write the results here for comparing runs")
+    run(parser.parse_args())
@@ -0,0 +1,242 @@
+"""
+Node-local LRU cache of source videos, shared by every worker on the node.
+
+A job for a source the node has already fetched (another resolution, a
+retry, a re-run) is served from the cache instead of downloading the whole
+original again. Entries are checked against the object's current ETag and
+size before use, so a re-uploaded source is never served stale.
+
+Cached files are hard-linked into the job's scratch directory (copied if
+scratch is on another filesystem), so evicting an entry never pulls a file
+out from under a running encode. The index is a JSON file guarded by an
+flock, like the scratch ledger, and also holds the node's hit/miss stats.
+When a scratch reservation doesn't fit, cached sources are evicted first.
+
+Usage:
+    python source_cache.py stats
+    python source_cache.py clear
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager
+
+import metrics
+from scratch import SCRATCH_ROOT
+
+# === CONFIGURATION ===
+CACHE_ROOT      = os.getenv('TRANSCODE_SOURCE_CACHE_DIR', os.path.join(SCRATCH_ROOT, '.transcode_source_cache'))
+CACHE_MAX_BYTES = int(float(os.getenv('TRANSCODE_SOURCE_CACHE_GB', '20')) * 1024 ** 3)
+
+INDEX_FILE = os.path.join(CACHE_ROOT, 'index.json')
+LOCK_FILE  = INDEX_FILE + '.lock'
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _index():
+    """Yield the cache index under an exclusive node-wide lock."""
+    os.makedirs(CACHE_ROOT, exist_ok=True)
+    with open(LOCK_FILE, 'a+') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(INDEX_FILE) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+            index.setdefault('entries', {})
+            index.setdefault('stats', {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'evictions': 0})
+            yield index
+            tmp = INDEX_FILE + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, INDEX_FILE)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _cache_key(bucket, key):
+    return f"{bucket}/{key}"
+
+
+def _cache_path(cache_key):
+    return os.path.join(CACHE_ROOT, hashlib.sha1(cache_key.encode()).hexdigest() + '.src')
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        # scratch on another filesystem (e.g. tmpfs)
+        shutil.copyfile(src, dest)
+
+
+def _drop(index, cache_key):
+    """Remove one entry; returns the disk bytes that frees (0 while a job still links it)."""
+    entry = index['entries'].pop(cache_key)
+    index['stats']['evictions'] += 1
+    try:
+        links = os.stat(entry['path']).st_nlink
+        os.remove(entry['path'])
+    except FileNotFoundError:
+        return 0
+    return entry['size'] if links == 1 else 0
+
+
+def _evict(index, needed):
+    """Drop least recently used entries until `needed` more bytes fit."""
+    entries = index['entries']
+    total = sum(e['size'] for e in entries.values())
+    for cache_key, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+        if total + needed <= CACHE_MAX_BYTES:
+            break
+        _drop(index, cache_key)
+        total -= entry['size']
+
+
+def make_room(nbytes, root):
+    """
+    Evict least recently used sources until `nbytes` of disk are freed on
+    `root`'s filesystem (scratch takes priority over the cache). Returns the bytes freed.
+    """
+    try:
+        if os.stat(CACHE_ROOT).st_dev != os.stat(root).st_dev:
+            return 0
+    except OSError:
+        return 0
+    freed = 0
+    with _index() as index:
+        for cache_key, entry in sorted(index['entries'].items(), key=lambda item: item[1]['last_used']):
+            if freed >= nbytes:
+                break
+            freed += _drop(index, cache_key)
+    if freed:
+        logger.info(f"Evicted {freed / 1024 ** 2:.0f} MB of cached sources for scratch space")
+    return freed
+
+
+def _lookup(bucket, key, etag, size):
+    """Path of a valid cached copy (marking it used), or None. Drops stale entries."""
+    with _index() as index:
+        cache_key = _cache_key(bucket, key)
+        entry = index['entries'].get(cache_key)
+        if entry and entry['etag'] == etag and entry['size'] == size \
+                and os.path.exists(entry['path']) and os.path.getsize(entry['path']) == size:
+            entry['last_used'] = time.time()
+            index['stats']['hits'] += 1
+            index['stats']['bytes_saved'] += size
+            return entry['path']
+        if entry:
+            # source changed in S3, or the file went missing
+            try:
+                os.remove(entry['path'])
+            except FileNotFoundError:
+                pass
+            del index['entries'][cache_key]
+        index['stats']['misses'] += 1
+    return None
+
+
+def _insert(bucket, key, etag, size, local_path):
+    """Add a freshly downloaded source to the cache, evicting as needed."""
+    cache_key = _cache_key(bucket, key)
+    path = _cache_path(cache_key)
+    tmp = f"{path}.{os.getpid()}.part"
+    _link_or_copy(local_path, tmp)
+    with _index() as index:
+        _evict(index, size)
+        os.replace(tmp, path)
+        index['entries'][cache_key] = {'path': path, 'etag': etag, 'size': size, 'last_used': time.time()}
+
+
+def download_file(client, bucket, key, local_path):
+    """
+    Drop-in for metrics.download_file that serves repeat sources from the
+    node cache. The cached copy is used only if its ETag and size still
+    match the object in S3.
+    """
+    if CACHE_MAX_BYTES <= 0:
+        return metrics.download_file(client, bucket, key, local_path)
+
+    head = client.head_object(Bucket=bucket, Key=key)
+    etag, size = head['ETag'], head['ContentLength']
+
+    cached = _lookup(bucket, key, etag, size)
+    if cached:
+        try:
+            _link_or_copy(cached, local_path)
+            metrics.SOURCE_CACHE.labels(metrics.WORKER, 'hit').inc()
+            metrics.SOURCE_CACHE_BYTES_SAVED.labels(metrics.WORKER).inc(size)
+            logger.info(f"Source cache hit for s3://{bucket}/{key}")
+            return
+        except OSError:
+            # evicted between lookup and link
+            pass
+
+    metrics.SOURCE_CACHE.labels(metrics.WORKER, 'miss').inc()
+    metrics.download_file(client, bucket, key, local_path)
+    if size <= CACHE_MAX_BYTES:
+        try:
+            _insert(bucket, key, etag, size, local_path)
+        except OSError as e:
+            logger.warning(f"Could not cache s3://{bucket}/{key}: {e}")
+
+
+def is_cached(bucket, key):
+    """Whether the node holds a copy of this source (not verified against S3)."""
+    try:
+        with open(INDEX_FILE) as f:
+            return _cache_key(bucket, key) in json.load(f).get('entries', {})
+    except (OSError, ValueError):
+        return False
+
+
+def prefer_cached(jobs, bucket):
+    """Order claimable jobs so sources already cached on this node are taken first."""
+    try:
+        with open(INDEX_FILE) as f:
+            cached = json.load(f).get('entries', {})
+    except (OSError, ValueError):
+        return jobs
+    # stable sort keeps the table's order within each group
+    return sorted(jobs, key=lambda job: _cache_key(bucket, job['InputKey']) not in cached)
+
+
+def stats():
+    with _index() as index:
+        entries = index['entries']
+        return dict(index['stats'], entries=len(entries), bytes=sum(e['size'] for e in entries.values()),
+                    max_bytes=CACHE_MAX_BYTES)
+
+
+def clear():
+    with _index() as index:
+        for entry in index['entries'].values():
+            try:
+                os.remove(entry['path'])
+            except FileNotFoundError:
+                pass
+        index['entries'] = {}
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'stats':
+        s = stats()
+        lookups = s['hits'] + s['misses']
+        print(f"{s['entries']} sources, {s['bytes'] / 1024 ** 3:.2f} / {s['max_bytes'] / 1024 ** 3:.2f} GB")
+        print(f"hits {s['hits']}  misses {s['misses']}  hit rate {100 * s['hits'] / lookups if lookups else 0:.1f}%")
+        print(f"saved {s['bytes_saved'] / 1024 ** 3:.2f} GB of downloads, {s['evictions']} evictions")
+    elif command == 'clear':
+        clear()
+        print(f"Cleared {CACHE_ROOT}")
+    else:
+        print("Usage: python source_cache.py stats|clear")
+        sys.exit(1)
@@ -0,0 +1,172 @@
+"""
+Storage for intermediate chunks handed between the driver and the workers.
+
+Backends (picked with INTERMEDIATE_STORE):
+  s3     - objects under S3_BUCKET (default; works anywhere)
+  shared - a POSIX filesystem mounted on every node (NFS, Lustre, CephFS...)
+  local  - a directory under the node's scratch root; only for engines that run on one node
+
+On a shared filesystem, fetch() hands back the stored file's path rather
+than copying it, so chunks move between nodes without touching S3.
+
+S3 clients are cached per process and re-created after a fork, so Spark
+tasks and pool workers reuse connections instead of building a new
+client (or boto3.Session) per call.
+"""
+import os
+import shutil
+import logging
+import threading
+
+import boto3
+from botocore.config import Config
+
+import metrics
+import scratch
+
+# === CONFIGURATION ===
+# the workers' bucket too (multiNodeTranscoder reads it from here)
+S3_BUCKET         = os.getenv('S3_BUCKET', 'video-transcoder-input1')
+STORE_KIND        = os.getenv('INTERMEDIATE_STORE', 's3')
+STORE_ROOT        = os.getenv('INTERMEDIATE_ROOT', '/mnt/shared/transcode')
+S3_MAX_POOL       = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32'))
+
+logger = logging.getLogger(__name__)
+
+_lock    = threading.Lock()
+_clients = {}
+_stores  = {}
+
+
+def get_s3_client():
+    """Return this process's shared S3 client."""
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _lock:
+            client = _clients.get(pid)
+            if client is None:
+                # drop clients inherited from a parent process; their sockets are not ours
+                _clients.clear()
+                client = boto3.session.Session().client('s3', config=Config(
+                    max_pool_connections=S3_MAX_POOL,
+                    retries={'max_attempts': 5, 'mode': 'adaptive'}
+                ))
+                _clients[pid] = client
+    return client
+
+
+class S3Store:
+    """Intermediates as S3 objects."""
+
+    kind = 's3'
+
+    def __init__(self, bucket=S3_BUCKET):
+        self.bucket = bucket
+
+    def put(self, local_path, key):
+        metrics.upload_file(get_s3_client(), local_path, self.bucket, key)
+        return key
+
+    def fetch(self, key, local_path):
+        """Make `key` available locally; returns the path to read it from."""
+        metrics.download_file(get_s3_client(), self.bucket, key, local_path)
+        return local_path
+
+    def delete(self, keys):
+        s3 = get_s3_client()
+        keys = list(keys)
+        # delete_objects takes at most 1000 keys per call
+        for i in range(0, len(keys), 1000):
+            s3.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': k} for k in keys[i:i + 1000]]
+            })
+        return len(keys)
+
+    def delete_prefix(self, prefix):
+        s3 = get_s3_client()
+        paginator = s3.get_paginator('list_objects_v2')
+        keys = [
+            obj['Key']
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
+        return self.delete(keys) if keys else 0
+
+
+class SharedFSStore:
+    """Intermediates as files under a directory every node mounts."""
+
+    kind = 'shared'
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+
+    def path(self, key):
+        path = os.path.realpath(os.path.join(self.root, key))
+        root = os.path.realpath(self.root)
+        if os.path.commonpath([path, root]) != root:
+            raise ValueError(f"Key {key!r} escapes {self.root}")
+        return path
+
+    def put(self, local_path, key):
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.part"
+        try:
+            # same filesystem: a rename moves no data
+            os.replace(local_path, dest)
+        except OSError:
+            shutil.copyfile(local_path, tmp)
+            os.replace(tmp, dest)
+        return key
+
+    def fetch(self, key, local_path):
+        """Read straight from the shared mount; nothing is copied."""
+        return self.path(key)
+
+    def delete(self, keys):
+        count = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+                count += 1
+            except FileNotFoundError:
+                pass
+        return count
+
+    def delete_prefix(self, prefix):
+        target = self.path(prefix)
+        if os.path.isdir(target):
+            count = sum(len(files) for _, _, files in os.walk(target))
+            shutil.rmtree(target, ignore_errors=True)
+            return count
+        return 0
+
+
+class LocalStore(SharedFSStore):
+    """Intermediates on this node's disk; valid only when every task runs here."""
+
+    kind = 'local'
+
+    def __init__(self, root=None):
+        super().__init__(root or os.path.join(scratch.SCRATCH_ROOT, 'intermediates'))
+
+
+BACKENDS = {
+    's3':     S3Store,
+    'shared': SharedFSStore,
+    'local':  LocalStore,
+}
+
+
+def get_store(kind=None):
+    """Return the (per-process cached) intermediate store for `kind` or INTERMEDIATE_STORE."""
+    kind = kind or STORE_KIND
+    store = _stores.get(kind)
+    if store is None:
+        if kind not in BACKENDS:
+            raise ValueError(f"Unknown INTERMEDIATE_STORE {kind!r}; expected one of {sorted(BACKENDS)}")
+        store = _stores[kind] = BACKENDS[kind]()
+        logger.info(f"Using {kind} intermediate store")
+    return store
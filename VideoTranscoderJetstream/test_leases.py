@@ -0,0 +1,132 @@
+import subprocess
+import unittest
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+import leases
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'UpdateItem')
+
+
+class FakeTable:
+    """Records update_item/scan calls; `errors` are raised by successive update_item calls."""
+
+    def __init__(self, items=(), errors=()):
+        self.items = list(items)
+        self.errors = list(errors)
+        self.updates = []
+        self.scans = []
+
+    def scan(self, **kwargs):
+        self.scans.append(kwargs)
+        return {'Items': self.items}
+
+    def update_item(self, **kwargs):
+        self.updates.append(kwargs)
+        if self.errors:
+            error = self.errors.pop(0)
+            if error:
+                raise error
+        return {}
+
+
+class IsTransientTest(unittest.TestCase):
+    def test_throttling_and_connection_errors_are_transient(self):
+        self.assertTrue(leases.is_transient(client_error('ThrottlingException')))
+        self.assertTrue(leases.is_transient(EndpointConnectionError(endpoint_url='https://dynamodb')))
+        self.assertTrue(leases.is_transient(leases.InsufficientScratchError('full')))
+
+    def test_bad_input_is_not_transient(self):
+        self.assertFalse(leases.is_transient(client_error('ValidationException')))
+        self.assertFalse(leases.is_transient(ValueError('bad')))
+        # ffmpeg exiting non-zero on its own is a bad source, not a crash
+        self.assertFalse(leases.is_transient(subprocess.CalledProcessError(1, 'ffmpeg')))
+        self.assertTrue(leases.is_transient(subprocess.CalledProcessError(-9, 'ffmpeg')))
+
+
+class ClaimTest(unittest.TestCase):
+    def test_claim_sets_lease_and_owner(self):
+        table = FakeTable()
+        self.assertTrue(leases.claim_job(table, 'job-1', owner='me'))
+        update = table.updates[0]
+        values = update['ExpressionAttributeValues']
+        self.assertEqual(update['Key'], {'JobId': 'job-1'})
+        self.assertEqual(values[':owner'], 'me')
+        self.assertEqual(values[':exp'] - values[':now'], leases.LEASE_SECONDS)
+        self.assertIn('ADD Attempts :one', update['UpdateExpression'])
+
+    def test_claim_accepts_expired_and_legacy_leases(self):
+        table = FakeTable()
+        leases.claim_job(table, 'job-1')
+        condition = table.updates[0]['ConditionExpression']
+        self.assertIn('LeaseExpiresAt < :now', condition)
+        # PROCESSING jobs from before leases: no LeaseExpiresAt, old ClaimedAt/CreatedAt
+        self.assertIn('attribute_not_exists(LeaseExpiresAt)', condition)
+        self.assertIn('CreatedAt < :stale', condition)
+        self.assertIn('Attempts < :max', condition)
+
+    def test_claim_lost_to_another_worker(self):
+        table = FakeTable(errors=[client_error('ConditionalCheckFailedException')])
+        self.assertFalse(leases.claim_job(table, 'job-1'))
+
+    def test_claim_error_is_not_a_claim(self):
+        table = FakeTable(errors=[client_error('ProvisionedThroughputExceededException')])
+        self.assertFalse(leases.claim_job(table, 'job-1'))
+
+
+class ListClaimableTest(unittest.TestCase):
+    def test_filter_matches_expired_and_legacy_processing_jobs(self):
+        table = FakeTable()
+        leases.list_claimable_jobs(table)
+        scan = table.scans[0]
+        self.assertIn('#s = :pending', scan['FilterExpression'])
+        self.assertIn('attribute_not_exists(LeaseExpiresAt)', scan['FilterExpression'])
+        self.assertIn(':stale', scan['ExpressionAttributeValues'])
+
+    def test_exhausted_jobs_are_failed_not_returned(self):
+        pending = {'JobId': 'a', 'Status': 'PENDING'}
+        exhausted = {'JobId': 'b', 'Status': 'PROCESSING', 'Attempts': leases.MAX_ATTEMPTS}
+        retry = {'JobId': 'c', 'Status': 'PROCESSING', 'Attempts': leases.MAX_ATTEMPTS - 1}
+        table = FakeTable(items=[pending, exhausted, retry])
+        self.assertEqual(leases.list_claimable_jobs(table), [pending, retry])
+        self.assertEqual([u['Key']['JobId'] for u in table.updates], ['b'])
+        self.assertEqual(table.updates[0]['ExpressionAttributeValues'][':failed'], 'FAILED')
+
+    def test_scan_error_lists_nothing(self):
+        class BrokenTable(FakeTable):
+            def scan(self, **kwargs):
+                raise client_error('InternalServerError')
+        self.assertEqual(leases.list_claimable_jobs(BrokenTable()), [])
+
+
+class ReleaseTest(unittest.TestCase):
+    def test_transient_error_returns_job_to_pending(self):
+        table = FakeTable()
+        status = leases.release_job(table, 'job-1', client_error('ThrottlingException'), owner='me')
+        self.assertEqual(status, 'PENDING')
+        update = table.updates[0]
+        self.assertIn('LeaseOwner = :owner', update['ConditionExpression'])
+        self.assertIn('Attempts < :max', update['ConditionExpression'])
+        self.assertEqual(len(table.updates), 1)
+
+    def test_exhausted_transient_error_fails_the_job(self):
+        table = FakeTable(errors=[client_error('ConditionalCheckFailedException'), None])
+        status = leases.release_job(table, 'job-1', ConnectionError('reset'), owner='me')
+        self.assertEqual(status, 'FAILED')
+        self.assertEqual(table.updates[1]['ExpressionAttributeValues'][':failed'], 'FAILED')
+
+    def test_permanent_error_fails_without_retry(self):
+        table = FakeTable()
+        self.assertEqual(leases.release_job(table, 'job-1', ValueError('bad input')), 'FAILED')
+        self.assertEqual(len(table.updates), 1)
+        self.assertEqual(table.updates[0]['ConditionExpression'], 'LeaseOwner = :owner')
+
+    def test_job_taken_over_is_lost(self):
+        table = FakeTable(errors=[client_error('ConditionalCheckFailedException')])
+        self.assertEqual(leases.release_job(table, 'job-1', ValueError('bad input')), 'LOST')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import multiNodeTranscoder
+import scratch
+
+TRACEPARENT = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+
+
+class CheckSegmentTaskTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        for name, value in (('SCRATCH_ROOT', self.root), ('TMPFS_ROOT', os.path.join(self.root, 'no-tmpfs'))):
+            patcher = mock.patch.object(scratch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.args = {
+            'segment_key': 'transcoded/segments/job-1/segment_000.mp4',
+            'output_dir': os.path.join(self.root, 'transcode_job-1_abc'),
+            'output_format': 'mp4',
+            'output_resolution': '1280x720',
+            'output_codec': 'libx264',
+            'task_slots': 4,
+            'preset': 'medium',
+            'traceparent': TRACEPARENT,
+        }
+
+    def check(self, **changes):
+        multiNodeTranscoder.check_segment_task(**dict(self.args, **changes))
+
+    def test_driver_arguments_pass(self):
+        self.check()
+        self.check(output_resolution='1280:-2', preset=None, traceparent=None)
+
+    def test_segment_key_must_stay_under_the_segment_prefix(self):
+        for key in ('input/movie.mp4', 'transcoded/segments/../../input/movie.mp4',
+                    'transcoded/segments//job-1/segment_000.mp4', None):
+            with self.assertRaises(ValueError, msg=key):
+                self.check(segment_key=key)
+
+    def test_output_dir_must_be_in_scratch(self):
+        for output_dir in ('/etc', os.path.join(self.root, '..', 'elsewhere'), 42):
+            with self.assertRaises(ValueError, msg=output_dir):
+                self.check(output_dir=output_dir)
+        # a symlink out of scratch doesn't count as inside it
+        link = os.path.join(self.root, 'link')
+        os.symlink('/etc', link)
+        with self.assertRaises(ValueError):
+            self.check(output_dir=link)
+
+    def test_ffmpeg_arguments_are_plain_values(self):
+        for changes in ({'output_resolution': 'scale=1280:720,drawtext'}, {'output_codec': 'libx264 -f'},
+                        {'output_format': '../mp4'}, {'preset': 'x' * 33}):
+            with self.assertRaises(ValueError, msg=changes):
+                self.check(**changes)
+
+    def test_task_slots_must_be_a_sane_int(self):
+        for task_slots in (0, 1025, '4', 2.0):
+            with self.assertRaises(ValueError, msg=task_slots):
+                self.check(task_slots=task_slots)
+
+    def test_traceparent_must_parse(self):
+        with self.assertRaises(ValueError):
+            self.check(traceparent='not-a-traceparent')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import threading
+import unittest
+from unittest import mock
+
+import pipeline
+
+
+class Stages:
+    """Stage functions for a JobPipeline over hand-built jobs, recording what happened."""
+
+    def __init__(self, polls, encode_error=None, upload_error=None):
+        self.polls = list(polls)
+        self.encode_error = encode_error
+        self.upload_error = upload_error
+        self.claimed = []
+        self.uploaded = []
+        self.failed = []
+        self.finished = []
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def poll(self):
+        if not self.polls:
+            # nothing left: wait for the jobs in flight, then stop the pipeline
+            self.done.wait(5)
+            raise SystemExit("test over")
+        return self.polls.pop(0)
+
+    def claim(self, job, jobs_behind):
+        self.claimed.append(job['JobId'])
+        # claim queued jobs for the same source along with this one
+        ids = [job['JobId']] + [j['JobId'] for j in jobs_behind if j['InputKey'] == job['InputKey']]
+        return {'job': job, 'ids': ids}
+
+    def download(self, ctx):
+        pass
+
+    def encode(self, ctx):
+        if self.encode_error:
+            raise self.encode_error
+
+    def upload(self, ctx):
+        if self.upload_error:
+            raise self.upload_error
+        self.uploaded.append(ctx['job']['JobId'])
+
+    def fail(self, ctx, error):
+        self.failed.append((ctx['job']['JobId'], error))
+
+    def finish(self, ctx):
+        with self.lock:
+            self.finished.append(ctx['job']['JobId'])
+            if len(self.finished) == len(self.claimed):
+                self.done.set()
+
+    def run(self):
+        return pipeline.JobPipeline(
+            self.poll, self.claim, self.download, self.encode, self.upload, self.fail, self.finish,
+            job_ids=lambda ctx: ctx['ids'],
+        ).run()
+
+
+@mock.patch.object(pipeline, 'IDLE_SLEEP', 0.01)
+class JobPipelineTest(unittest.TestCase):
+    def test_jobs_flow_through_every_stage(self):
+        stages = Stages([[{'JobId': 'a', 'InputKey': 'x'}, {'JobId': 'b', 'InputKey': 'y'}]])
+        # the test ends by killing the prefetch thread, which stops the worker
+        self.assertEqual(stages.run(), 1)
+        self.assertEqual(stages.uploaded, ['a', 'b'])
+        self.assertEqual(sorted(stages.finished), ['a', 'b'])
+        self.assertEqual(stages.failed, [])
+
+    def test_fanned_out_and_held_jobs_are_not_claimed_again(self):
+        jobs = [{'JobId': 'a', 'InputKey': 'x'}, {'JobId': 'b', 'InputKey': 'x'}]
+        stages = Stages([jobs])
+        stages.run()
+        # b went out with a's claim
+        self.assertEqual(stages.claimed, ['a'])
+
+    def test_failed_stage_fails_and_finishes_the_job(self):
+        error = RuntimeError("ffmpeg exploded")
+        stages = Stages([[{'JobId': 'a', 'InputKey': 'x'}]], encode_error=error)
+        stages.run()
+        self.assertEqual(stages.failed, [('a', error)])
+        self.assertEqual(stages.finished, ['a'])
+        self.assertEqual(stages.uploaded, [])
+
+    def test_error_in_fail_still_finishes(self):
+        stages = Stages([[{'JobId': 'a', 'InputKey': 'x'}]], upload_error=RuntimeError("S3 down"))
+        stages.fail = mock.Mock(side_effect=RuntimeError("DynamoDB down too"))
+        stages.run()
+        self.assertEqual(stages.finished, ['a'])
+
+    def test_dead_thread_releases_jobs_in_flight(self):
+        stages = Stages([])
+        p = pipeline.JobPipeline(
+            stages.poll, stages.claim, stages.download, stages.encode, stages.upload, stages.fail, stages.finish,
+            job_ids=lambda ctx: ctx['ids'],
+        )
+        ctx = {'job': {'JobId': 'a', 'InputKey': 'x'}, 'ids': ['a']}
+        p.in_flight[id(ctx)] = ctx
+        p.shutdown()
+        [(job_id, error)] = stages.failed
+        self.assertEqual(job_id, 'a')
+        # transient, so the lease code puts the job back to PENDING
+        self.assertIsInstance(error, pipeline.PipelineStopped)
+        self.assertIsInstance(error, ConnectionError)
+        self.assertEqual(stages.finished, ['a'])
+        # finish runs once even if the job is retired again
+        p._retire(ctx)
+        self.assertEqual(stages.finished, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
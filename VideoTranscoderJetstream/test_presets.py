@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import presets
+
+# 2024-01-01T00:00:00 UTC
+NOW = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def job(frames, deadline=None, **attrs):
+    attrs['Probe'] = {'FrameCount': frames}
+    if deadline:
+        attrs['Deadline'] = deadline
+    return attrs
+
+
+class PresetFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        for name, value in (('PRESET_FILE', os.path.join(tmp, 'presets.json')), ('FIXED_PRESET', ''),
+                            ('DEADLINE_SAFETY', 1.0)):
+            patcher = mock.patch.object(presets, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # 8-thread speeds for 720p x264, as a lone encode on this node would measure
+        for preset, fps in (('slow', 10.0), ('medium', 20.0), ('fast', 40.0)):
+            presets._update('libx264', '1280x720', 8, preset, fps)
+
+
+class ChoosePresetTest(PresetFileTest):
+    def test_slowest_preset_that_fits(self):
+        # 1 hour left for 36000 frames: 10 fps is just enough
+        preset, fps, _ = presets.choose_preset(job(36000, '2024-01-01T01:00:00'), 'libx264', '1280x720', 8, now=NOW)
+        self.assertEqual((preset, fps), ('slow', 10.0))
+        preset, fps, _ = presets.choose_preset(job(72000, '2024-01-01T01:00:00'), 'libx264', '1280x720', 8, now=NOW)
+        self.assertEqual((preset, fps), ('medium', 20.0))
+
+    def test_backlog_and_parallelism(self):
+        deadline_job = job(36000, '2024-01-01T01:00:00')
+        # half the hour belongs to the queue behind: needs 20 fps
+        self.assertEqual(presets.choose_preset(deadline_job, 'libx264', '1280x720', 8, backlog=1800, now=NOW)[0],
+                         'medium')
+        # two chunks side by side double the throughput
+        self.assertEqual(presets.choose_preset(deadline_job, 'libx264', '1280x720', 8, parallelism=2,
+                                               backlog=1800, now=NOW)[:2], ('slow', 20.0))
+
+    def test_deadline_from_created_at(self):
+        created = job(36000 * 2, CreatedAt='2024-01-01T00:00:00')
+        with mock.patch.object(presets, 'TARGET_TURNAROUND', 7200):
+            self.assertEqual(presets.choose_preset(created, 'libx264', '1280x720', 8, now=NOW)[0], 'slow')
+
+    def test_unreachable_deadline_takes_fastest(self):
+        preset, fps, reason = presets.choose_preset(job(10 ** 6, '2024-01-01T01:00:00'), 'libx264', '1280x720', 8,
+                                                    now=NOW)
+        self.assertEqual((preset, fps), ('fast', 40.0))
+        self.assertTrue(reason.startswith("deadline unreachable"))
+
+    def test_speeds_are_per_thread_budget(self):
+        preset, fps, reason = presets.choose_preset(job(36000, '2024-01-01T01:00:00'), 'libx264', '1280x720', 2,
+                                                    now=NOW)
+        self.assertEqual((preset, fps), (None, None))
+        self.assertEqual(reason, "no preset speeds for libx264@1280x720@2")
+
+    def test_no_ladder_or_no_deadline(self):
+        self.assertIsNone(presets.choose_preset(job(36000, '2024-01-01T01:00:00'), 'mpeg4', '1280x720', 8)[0])
+        self.assertIsNone(presets.choose_preset(job(36000), 'libx264', '1280x720', 8, now=NOW)[0])
+
+    def test_fixed_preset(self):
+        with mock.patch.object(presets, 'FIXED_PRESET', 'fast'):
+            self.assertEqual(presets.choose_preset(job(36000), 'libx264', '1280x720', 8, parallelism=3)[:2],
+                             ('fast', 120.0))
+
+
+class RecordSpeedTest(PresetFileTest):
+    def test_achieved_speed_is_folded_in(self):
+        presets.record_speed('libx264', '1280x720', 8, 'medium', 20.0, 30.0)
+        self.assertEqual(presets.load_speeds('libx264', '1280x720', 8)['medium'], 22.0)
+
+    def test_shared_encodes_are_not_learnt(self):
+        presets.record_speed('libx264', '1280x720', 8, 'medium', 20.0, 5.0, learn=False)
+        self.assertEqual(presets.load_speeds('libx264', '1280x720', 8)['medium'], 20.0)
+
+
+class BacklogTest(PresetFileTest):
+    def test_each_job_at_its_own_target(self):
+        presets._update('libx264', '1920x1080', 8, 'medium', 5.0)
+        queued = [job(2000), job(1000, Resolution='1920x1080'), job(500, VideoCodec='libsvtav1')]
+        # 2000/20 + 1000/5; no speeds for AV1, so that job adds nothing
+        self.assertEqual(presets.backlog_seconds(queued, 'libx264', '1280x720', threads=8), 300.0)
+        self.assertEqual(presets.backlog_seconds(queued, 'libx264', '1280x720', slots=3, threads=8), 100.0)
+
+    def test_defaults_to_a_lone_encodes_threads(self):
+        with mock.patch.object(presets, 'planned_threads', return_value=8) as planned:
+            self.assertEqual(presets.backlog_seconds([job(2000)], 'libx264', '1280x720'), 100.0)
+        planned.assert_called_once_with('libx264', '1280x720')
+
+    def test_reference_speed_without_medium_is_the_median(self):
+        presets._update('libx265', '1280x720', 8, 'slow', 3.0)
+        presets._update('libx265', '1280x720', 8, 'fast', 9.0)
+        presets._update('libx265', '1280x720', 8, 'veryfast', 12.0)
+        self.assertEqual(presets.reference_speed('libx265', '1280x720', 8), 9.0)
+
+
+class JobTargetTest(unittest.TestCase):
+    def test_job_attributes_override_defaults(self):
+        self.assertEqual(presets.job_target({'OutputFormat': 'mkv', 'VideoCodec': 'libx265'}, 'mp4', '1280x720',
+                                            'libx264'), ('mkv', '1280x720', 'libx265'))
+        self.assertEqual(presets.job_target({}, 'mp4', '1280x720', 'libx264'), ('mp4', '1280x720', 'libx264'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+import remux
+
+# ffprobe of a plain 720p H.264 MP4 as it would come back from probe_file
+H264_720P = {
+    'VideoCodec': 'h264', 'Width': 1280, 'Height': 720,
+    'PixFmt': 'yuv420p', 'Profile': 'High', 'Rotation': 0, 'AudioCodec': 'aac',
+}
+
+
+def probe(**changes):
+    return dict(H264_720P, **changes)
+
+
+class CanRemuxTest(unittest.TestCase):
+    def test_matching_source_is_copied(self):
+        self.assertEqual(remux.can_remux(probe(), 'mp4', '1280x720', 'libx264'),
+                         (True, True, "source already matches target"))
+        # -1 / -2 leave that side to the aspect ratio
+        self.assertTrue(remux.can_remux(probe(), 'mkv', '1280:-2', 'h264')[0])
+
+    def test_unprobed_source_is_encoded(self):
+        self.assertEqual(remux.can_remux({}, 'mp4', '1280x720', 'libx264'), (False, False, "source not probed"))
+
+    def test_codec_and_resolution_must_match(self):
+        ok, _, reason = remux.can_remux(probe(VideoCodec='hevc'), 'mp4', '1280x720', 'libx264')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "codec hevc != h264")
+        ok, _, reason = remux.can_remux(probe(), 'mp4', '1920x1080', 'libx264')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "resolution 1280x720 != 1920x1080")
+
+    def test_pixel_format_must_be_the_encode_output(self):
+        ok, _, reason = remux.can_remux(probe(PixFmt='yuv420p10le'), 'mp4', '1280x720', 'libx264')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "pixel format yuv420p10le != yuv420p")
+        self.assertFalse(remux.can_remux(probe(PixFmt=None), 'mp4', '1280x720', 'libx264')[0])
+
+    def test_profile_must_be_one_an_encode_produces(self):
+        ok, _, reason = remux.can_remux(probe(Profile='High 10'), 'mp4', '1280x720', 'libx264')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "h264 profile High 10 isn't produced by an encode")
+        hevc = probe(VideoCodec='hevc', Profile='Main 10')
+        self.assertFalse(remux.can_remux(hevc, 'mp4', '1280x720', 'libx265')[0])
+        self.assertTrue(remux.can_remux(dict(hevc, Profile='Main'), 'mp4', '1280x720', 'libx265')[0])
+
+    def test_rotated_source_is_encoded(self):
+        ok, _, reason = remux.can_remux(probe(Rotation=90), 'mp4', '1280x720', 'libx264')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "source is rotated 90 degrees")
+
+    def test_container_must_carry_the_codec(self):
+        vp9 = probe(VideoCodec='vp9', Profile='Profile 0', AudioCodec='opus')
+        ok, _, reason = remux.can_remux(vp9, 'mov', '1280x720', 'libvpx-vp9')
+        self.assertFalse(ok)
+        self.assertEqual(reason, "vp9 can't be copied into mov")
+        self.assertTrue(remux.can_remux(vp9, 'mkv', '1280x720', 'libvpx-vp9')[0])
+        self.assertFalse(remux.can_remux(vp9, 'mkv', '1280x720', 'libvpx-vp9', hls=True)[0])
+
+    def test_audio_is_reencoded_when_the_container_cant_carry_it(self):
+        self.assertEqual(remux.can_remux(probe(AudioCodec='opus'), 'mov', '1280x720', 'libx264')[:2], (True, False))
+        self.assertEqual(remux.can_remux(probe(AudioCodec='opus'), 'mp4', '1280x720', 'libx264')[:2], (True, True))
+        # HLS segments are MPEG-TS, which has no opus
+        self.assertEqual(remux.can_remux(probe(AudioCodec='opus'), 'mp4', '1280x720', 'libx264', hls=True)[:2],
+                         (True, False))
+        self.assertEqual(remux.can_remux(probe(AudioCodec=None), 'mov', '1280x720', 'libx264')[:2], (True, True))
+
+
+class RotationTest(unittest.TestCase):
+    def test_rotate_tag(self):
+        self.assertEqual(remux._rotation({'tags': {'rotate': '90'}}), 90)
+
+    def test_display_matrix_wins_over_tag(self):
+        stream = {'tags': {'rotate': '90'}, 'side_data_list': [{'side_data_type': 'Display Matrix', 'rotation': -90}]}
+        self.assertEqual(remux._rotation(stream), 270)
+
+    def test_no_or_bad_rotation_is_zero(self):
+        self.assertEqual(remux._rotation({}), 0)
+        self.assertEqual(remux._rotation({'side_data_list': [{'side_data_type': 'CPB properties'}]}), 0)
+        self.assertEqual(remux._rotation({'tags': {'rotate': 'upside down'}}), 0)
+
+
+class RemuxCmdTest(unittest.TestCase):
+    def test_maps_video_and_first_audio_stream(self):
+        cmd = remux.remux_cmd('in.mkv', 'out.mp4', 'mp4')
+        self.assertEqual(cmd[cmd.index('-map') + 1], '0:v:0')
+        self.assertIn('0:a:0?', cmd)
+        self.assertEqual(cmd[cmd.index('-c:a') + 1], 'copy')
+        self.assertEqual(cmd[cmd.index('-movflags') + 1], '+faststart')
+        self.assertEqual(cmd[-1], 'out.mp4')
+
+    def test_reencoded_audio_without_faststart(self):
+        cmd = remux.remux_cmd('in.mp4', 'out.mkv', 'mkv', copy_audio=False)
+        self.assertEqual(cmd[cmd.index('-c:a') + 1], 'aac')
+        self.assertNotIn('-movflags', cmd)
+
+
+if __name__ == '__main__':
+    unittest.main()
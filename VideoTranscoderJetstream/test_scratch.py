@@ -0,0 +1,131 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import scratch
+import source_cache
+
+MB = 1024 ** 2
+
+
+class ScratchTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        ledger = os.path.join(self.root, '.transcode_scratch.json')
+        for name, value in (('SCRATCH_ROOT', self.root), ('TMPFS_ROOT', os.path.join(self.root, 'no-tmpfs')),
+                            ('LEDGER_FILE', ledger), ('LOCK_FILE', ledger + '.lock'), ('HEADROOM_BYTES', 0)):
+            patcher = mock.patch.object(scratch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def free(self, nbytes):
+        patcher = mock.patch.object(scratch, '_free_bytes', return_value=nbytes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ledger(self):
+        with open(scratch.LEDGER_FILE) as f:
+            return json.load(f)
+
+    def test_reserve_and_release(self):
+        self.free(100 * MB)
+        path = scratch.reserve('job-1', 10 * MB)
+        self.assertTrue(os.path.isdir(path))
+        self.assertTrue(os.path.basename(path).startswith('transcode_job-1_'))
+        self.assertEqual(self.ledger()['job-1']['bytes'], 10 * MB)
+        # a second reservation for the same job reuses it
+        self.assertEqual(scratch.reserve('job-1', 10 * MB), path)
+
+        scratch.release('job-1')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.ledger(), {})
+
+    def test_outstanding_reservations_count_against_free_space(self):
+        self.free(100 * MB)
+        self.assertIsNotNone(scratch.reserve('job-1', 60 * MB))
+        with mock.patch.object(source_cache, 'make_room', return_value=0) as make_room:
+            self.assertIsNone(scratch.reserve('job-2', 60 * MB))
+        # 60 MB reserved but (almost) nothing written yet: 20 MB short
+        shortfall, root = make_room.call_args[0]
+        self.assertAlmostEqual(shortfall, 20 * MB, delta=4096)
+        self.assertEqual(root, self.root)
+        self.assertNotIn('job-2', self.ledger())
+
+    def test_shortfall_evicts_cached_sources(self):
+        self.free(10 * MB)
+        with mock.patch.object(source_cache, 'make_room', return_value=30 * MB) as make_room:
+            self.assertIsNotNone(scratch.reserve('job-1', 40 * MB))
+        make_room.assert_called_once_with(30 * MB, self.root)
+
+    def test_scratch_dir_raises_when_full(self):
+        self.free(0)
+        with mock.patch.object(source_cache, 'make_room', return_value=0):
+            with self.assertRaises(scratch.InsufficientScratchError):
+                with scratch.scratch_dir('job-1', MB):
+                    pass
+
+    def test_reclaim_orphans_of_dead_workers(self):
+        self.free(100 * MB)
+        live = scratch.reserve('live', MB)
+        dead = scratch.reserve('dead', MB)
+        # hand the "dead" reservation to a process that no longer exists
+        ledger = self.ledger()
+        ledger['dead']['pid'] = -1
+        with open(scratch.LEDGER_FILE, 'w') as f:
+            json.dump(ledger, f)
+        with open(os.path.join(dead, scratch.OWNER_FILE), 'w') as f:
+            json.dump({'pid': -1, 'host': scratch.HOST, 'job_id': 'dead'}, f)
+
+        with mock.patch.object(scratch.psutil, 'pid_exists', side_effect=lambda pid: pid > 0):
+            self.assertEqual(scratch.reclaim_orphans(), 1)
+        self.assertTrue(os.path.isdir(live))
+        self.assertFalse(os.path.exists(dead))
+        self.assertEqual(set(self.ledger()), {'live'})
+
+    def test_reclaim_leaves_other_directories(self):
+        keep = os.path.join(self.root, 'not_ours')
+        os.mkdir(keep)
+        self.assertEqual(scratch.reclaim_orphans(), 0)
+        self.assertTrue(os.path.isdir(keep))
+
+
+class SourceCacheEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        cache = os.path.join(self.root, '.transcode_source_cache')
+        index = os.path.join(cache, 'index.json')
+        for name, value in (('CACHE_ROOT', cache), ('INDEX_FILE', index), ('LOCK_FILE', index + '.lock')):
+            patcher = mock.patch.object(source_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.makedirs(cache)
+        self.paths = {}
+        with source_cache._index() as index:
+            for n, key in enumerate(['old', 'newer', 'newest']):
+                path = os.path.join(cache, key + '.src')
+                with open(path, 'wb') as f:
+                    f.write(b'x' * 1000)
+                self.paths[key] = path
+                index['entries'][f"bucket/{key}"] = {'path': path, 'etag': '"e"', 'size': 1000, 'last_used': n}
+
+    def test_make_room_evicts_least_recently_used_first(self):
+        self.assertEqual(source_cache.make_room(1500, self.root), 2000)
+        self.assertFalse(os.path.exists(self.paths['old']))
+        self.assertFalse(os.path.exists(self.paths['newer']))
+        self.assertTrue(os.path.exists(self.paths['newest']))
+
+    def test_linked_sources_free_nothing(self):
+        # a running job still holds a hard link, so evicting it frees no disk
+        os.link(self.paths['old'], os.path.join(self.root, 'job_input'))
+        self.assertEqual(source_cache.make_room(1000, self.root), 1000)
+        self.assertFalse(os.path.exists(self.paths['newer']))
+        self.assertTrue(os.path.exists(self.paths['newest']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,273 @@
+"""
+Lightweight distributed tracing for transcode jobs.
+
+The ingest Lambda starts a trace per job and stores its W3C `traceparent`
+on the job record (TraceParent). Workers continue that trace for every
+stage, S3 transfer and ffmpeg run, and pass the context on to the
+executor-side transcode_segment calls, so one trace covers the job from
+upload to HLS.
+
+When TRACE_FILE is set (off by default, like METRICS_PORT), finished spans
+are appended to it as JSON lines on whichever node ran them. The file is
+never rotated, so point it somewhere logrotate or a collector drains.
+Collect the files and render a job:
+
+    python tracing.py show <job_id|trace_id> <trace file> [<trace file> ...]
+
+The Lambda logs its ingest span as JSON to CloudWatch; exported log lines
+can be passed in as another file.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+# === CONFIGURATION ===
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+SERVICE    = os.getenv('TRANSCODE_WORKER_NAME') or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+
+logger = logging.getLogger(__name__)
+
+# (trace_id, span_id) of the innermost open span in this thread/task
+_current = contextvars.ContextVar('transcode_trace', default=None)
+_write_lock = threading.Lock()
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+def parse_traceparent(value):
+    """'00-<trace_id>-<span_id>-<flags>' -> (trace_id, span_id), or None if malformed."""
+    parts = (value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def format_traceparent(trace_id, span_id):
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def current_traceparent():
+    """traceparent of the open span, for handing to another process."""
+    ctx = _current.get()
+    return format_traceparent(*ctx) if ctx else None
+
+
+def _export(trace_id, span_id, parent_id, name, start, end, status, attrs):
+    if not TRACE_FILE:
+        return
+    record = {
+        'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id,
+        'name': name, 'start': start, 'end': end, 'duration': end - start,
+        'service': SERVICE, 'host': socket.gethostname(), 'pid': os.getpid(),
+        'status': status, 'attrs': attrs,
+    }
+    line = json.dumps(record, default=str) + '\n'
+    try:
+        with _write_lock, open(TRACE_FILE, 'a') as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning(f"Could not write span to {TRACE_FILE}: {e}")
+
+
+def record_span(name, start, end, parent=None, status='ok', **attrs):
+    """Export a span whose timing is already known (e.g. queue wait)."""
+    trace_id, parent_id = parent or _current.get() or (_new_id(16), None)
+    _export(trace_id, _new_id(8), parent_id, name, start, end, status, attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block as a child of the current span (or a new trace).
+    Yields the attrs dict so the block can add results to it.
+    """
+    parent = _current.get()
+    trace_id, parent_id = parent if parent else (_new_id(16), None)
+    span_id = _new_id(8)
+    token = _current.set((trace_id, span_id))
+    start = time.time()
+    status = 'ok'
+    try:
+        yield attrs
+    except BaseException as e:
+        status = 'error'
+        attrs['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _export(trace_id, span_id, parent_id, name, start, time.time(), status, attrs)
+
+
+@contextmanager
+def continue_trace(traceparent):
+    """Make spans opened in this block children of a span from another process."""
+    ctx = parse_traceparent(traceparent)
+    token = _current.set(ctx) if ctx else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _current.reset(token)
+
+
+def _created_at(job):
+    """Job CreatedAt (naive UTC ISO, set by the Lambda) as epoch seconds."""
+    try:
+        return datetime.fromisoformat(job['CreatedAt']).replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def open_job(job, **attrs):
+    """
+    Start the 'job' span for one processing attempt, continuing the job's
+    ingest trace and recording how long it sat in the queue. For jobs handed
+    between threads: run each stage under continue_trace(handle['traceparent'])
+    and end the span with close_job().
+    """
+    ctx = parse_traceparent(job.get('TraceParent'))
+    trace_id, parent_id = ctx if ctx else (_new_id(16), None)
+    created = _created_at(job)
+    now = time.time()
+    if ctx and created:
+        record_span('queue_wait', created, now, parent=ctx, job_id=job['JobId'])
+    span_id = _new_id(8)
+    return {
+        'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id, 'start': now,
+        'traceparent': format_traceparent(trace_id, span_id),
+        'attrs': dict(job_id=job['JobId'], input_key=job.get('InputKey'), **attrs),
+    }
+
+
+def close_job(handle, status='ok'):
+    _export(handle['trace_id'], handle['span_id'], handle['parent_id'], 'job',
+            handle['start'], time.time(), status, handle['attrs'])
+
+
+@contextmanager
+def job_span(job, **attrs):
+    """Continue the job's ingest trace in a 'job' span around the block."""
+    handle = open_job(job, **attrs)
+    status = 'ok'
+    try:
+        with continue_trace(handle['traceparent']):
+            yield handle['attrs']
+    except BaseException as e:
+        status = 'error'
+        handle['attrs']['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        close_job(handle, status)
+
+
+# --- rendering ---------------------------------------------------------------
+
+def load_spans(paths):
+    """Read span records from JSON-lines files; tolerates log prefixes before the JSON."""
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                brace = line.find('{')
+                if brace < 0:
+                    continue
+                try:
+                    record = json.loads(line[brace:])
+                except ValueError:
+                    continue
+                if 'trace_id' in record and 'span_id' in record:
+                    spans.append(record)
+    return spans
+
+
+def find_trace(spans, ident):
+    """Spans of the trace whose id is `ident`, or that contains job `ident`."""
+    trace_ids = {s['trace_id'] for s in spans if s['trace_id'] == ident or s['attrs'].get('job_id') == ident}
+    return [s for s in spans if s['trace_id'] in trace_ids]
+
+
+def _extent(span, children):
+    """
+    End of `span` including its descendants. A child can start after its
+    parent ended (the ingest Lambda's span is the parent of every worker
+    span), so the parent's effective end is its latest descendant's.
+    """
+    return max([span['end']] + [_extent(c, children) for c in children.get(span['span_id'], [])])
+
+
+def critical_path(root, children):
+    """
+    Walk back from the (effective) end of `root`, always following the child
+    that finished last; returns [(span, seconds on the critical path not
+    covered by a child)].
+    """
+    path = []
+    end = _extent(root, children)
+    cursor = end
+    own = 0.0
+    extents = [(child, _extent(child, children)) for child in children.get(root['span_id'], [])]
+    for child, child_end in sorted(extents, key=lambda item: item[1], reverse=True):
+        # skip siblings that overlap the part of the path already chosen
+        if child['start'] >= cursor or (child_end > cursor and cursor < end):
+            continue
+        own += max(0.0, cursor - min(child_end, cursor))
+        path = critical_path(child, children) + path
+        cursor = child['start']
+    own += max(0.0, cursor - root['start'])
+    return [(root, own)] + path
+
+
+def render(spans, out=sys.stdout):
+    """Print the span tree with offsets, then the critical path."""
+    ids = {s['span_id'] for s in spans}
+    children = {}
+    for s in spans:
+        children.setdefault(s['parent_id'] if s['parent_id'] in ids else None, []).append(s)
+    roots = children.pop(None, [])
+    start = min(s['start'] for s in spans)
+    root = {
+        'span_id': None, 'name': 'trace', 'start': start, 'end': max(s['end'] for s in spans),
+        'service': '', 'status': 'ok', 'attrs': {},
+    }
+    children[None] = roots
+
+    crit = critical_path(root, children)
+    on_path = {s['span_id'] for s, _ in crit}
+
+    def walk(span_, depth):
+        for child in sorted(children.get(span_['span_id'], []), key=lambda s: s['start']):
+            mark = '*' if child['span_id'] in on_path else ' '
+            err = ' ERROR' if child['status'] != 'ok' else ''
+            label = child['attrs'].get('key') or child['attrs'].get('job_id') or ''
+            out.write(f"{mark} {child['start'] - start:9.3f}s {child['end'] - child['start']:9.3f}s "
+                      f"{'  ' * depth}{child['name']} [{child['service']}] {label}{err}\n")
+            walk(child, depth + 1)
+
+    out.write(f"  {'offset':>10} {'duration':>10} span\n")
+    walk(root, 0)
+
+    total = root['end'] - root['start']
+    out.write(f"\nCritical path ({total:.3f}s):\n")
+    for span_, own in crit[1:]:
+        if own >= 0.001:
+            out.write(f"  {span_['name']:<20} {own:9.3f}s {100 * own / total if total else 0:5.1f}%\n")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] != 'show':
+        print("Usage: python tracing.py show <job_id|trace_id> <trace file> [<trace file> ...]")
+        sys.exit(1)
+    trace = find_trace(load_spans(sys.argv[3:]), sys.argv[2])
+    if not trace:
+        print(f"No spans found for {sys.argv[2]}")
+        sys.exit(1)
+    render(trace)
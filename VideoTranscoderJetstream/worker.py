@@ -0,0 +1,283 @@
+"""
+Job stages shared by the single-node worker and the Backend worker.
+
+Both run whole jobs on one node through a JobPipeline. TranscodeWorker holds
+the claim / download / encode / upload / fail / finish stages once, and each
+script supplies its own table, bucket and command-line targets.
+
+Every job is encoded to its own OutputFormat / Resolution / VideoCodec; the
+command-line targets only fill in attributes a job record doesn't carry. The
+resource plan and the backlog estimate use the same per-job targets, and the
+output key is always `<prefix><source name>_<JobId>_transcoded.<format>`,
+whether or not the job was fanned out with others.
+"""
+import os
+import time
+import logging
+import subprocess
+from decimal import Decimal
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import fanout
+import leases
+import metrics
+import presets
+import remux
+import scratch
+import source_cache
+import tracing
+from pipeline import JobPipeline
+from resources import plan_resources, slot_cpus, decoder_thread_args, encoder_thread_args, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+
+class TranscodeWorker:
+    def __init__(self, table, s3, bucket, output_prefix, fmt, resolution, codec,
+                 slot=0, poll_interval=30, mode='Single'):
+        self.table = table
+        self.s3 = s3
+        self.bucket = bucket
+        self.output_prefix = output_prefix
+        # defaults for jobs without their own target
+        self.fmt, self.resolution, self.codec = fmt, resolution, codec
+        self.slot = slot
+        self.poll_interval = poll_interval
+        self.mode = mode
+        self.plans = {}
+
+    def plan(self, codec, resolution):
+        """Resource plan for one target (calibrations are per codec and resolution)."""
+        if (codec, resolution) not in self.plans:
+            self.plans[codec, resolution] = plan_resources(codec=codec, resolution=resolution)
+        return self.plans[codec, resolution]
+
+    def run(self, name):
+        """
+        Run the pipeline: job N+1 downloads and job N-1 uploads while job N
+        encodes. Returns the worker's exit status once the pipeline stops.
+        """
+        plan = self.plan(self.codec, self.resolution)
+        logger.info(f"Starting transcoder loop ({plan['threads']} ffmpeg threads, slot {self.slot})")
+        scratch.reclaim_orphans()
+        metrics.start_metrics_server(name)
+        return JobPipeline(
+            poll=self.poll,
+            claim=self.claim,
+            download=self.download,
+            encode=self.encode,
+            upload=self.upload,
+            fail=self.fail,
+            finish=self.finish,
+            job_ids=lambda ctx: [m['job']['JobId'] for m in ctx['members']],
+        ).run()
+
+    def poll(self):
+        # PENDING jobs plus jobs abandoned by a dead worker (expired lease)
+        jobs = leases.list_claimable_jobs(self.table)
+        metrics.QUEUE_DEPTH.labels(metrics.WORKER).set(len(jobs))
+        if not jobs:
+            logger.info(f"No pending jobs; sleeping {self.poll_interval}s")
+            scratch.reclaim_orphans()
+            time.sleep(self.poll_interval)
+        # Sources already on this node skip the download; take those first
+        return source_cache.prefer_cached(jobs, self.bucket)
+
+    def input_size(self, job):
+        """Size of the job's source object in bytes, or None if it can't be read."""
+        if job.get('SizeBytes'):
+            return int(job['SizeBytes'])
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=job['InputKey'])['ContentLength']
+        except (BotoCoreError, ClientError) as e:
+            logger.error(f"Error reading size of {job['InputKey']}: {e}")
+            return None
+
+    def claim(self, job, jobs_behind):
+        """
+        Reserve scratch and claim the job, plus queued jobs for the same source
+        (fanned out from one decode); returns the pipeline context, or None to skip it.
+        """
+        job_id = job['JobId']
+        size = self.input_size(job)
+        if size is None:
+            return None
+
+        group = [job] + fanout.siblings(job, jobs_behind)
+        # reserve scratch before claiming so we never take a job we can't hold
+        tmp = scratch.reserve(job_id, fanout.footprint(size, len(group)))
+        if tmp is None:
+            logger.info(f"Not enough scratch space for job {job_id}; skipping for now")
+            return None
+        if not leases.claim_job(self.table, job_id):
+            scratch.release(job_id)
+            return None
+        # siblings another worker got to first are simply left out
+        group = [job] + [j for j in group[1:] if leases.claim_job(self.table, j['JobId'])]
+
+        input_key = job['InputKey']
+        base      = os.path.splitext(os.path.basename(input_key))[0]
+        members   = []
+        for j in group:
+            metrics.job_claimed(j)
+            fmt, res, codec = presets.job_target(j, self.fmt, self.resolution, self.codec)
+            members.append({
+                'job':        j,
+                'fmt':        fmt,
+                'resolution': res,
+                'codec':      codec,
+                'local_out':  os.path.join(tmp, f"{base}_{j['JobId']}_transcoded.{fmt}"),
+                'heartbeat':  leases.LeaseHeartbeat(self.table, j['JobId']).start(),
+                'trace':      tracing.open_job(j, mode=self.mode, fanout=len(group)),
+                'status':     None,
+            })
+        if len(group) > 1:
+            logger.info(f"Job {job_id}: fanning out {input_key} to {len(group)} jobs")
+
+        lead = members[0]
+        plan = self.plan(lead['codec'], lead['resolution'])
+        claimed = {j['JobId'] for j in group}
+        return {
+            'job':      job,
+            'plan':     plan,
+            'local_in': os.path.join(tmp, os.path.basename(input_key)),
+            # Encode time the rest of the queue needs; the preset must leave room for it
+            'backlog':  presets.backlog_seconds([j for j in jobs_behind if j['JobId'] not in claimed],
+                                                self.codec, self.resolution, plan['slots']),
+            'members':  members,
+        }
+
+    def download(self, ctx):
+        lead = ctx['members'][0]
+        with tracing.continue_trace(lead['trace']['traceparent']), metrics.stage('download'):
+            source_cache.download_file(self.s3, self.bucket, ctx['job']['InputKey'], ctx['local_in'])
+
+    def _timed_ffmpeg(self, path, cmd, plan):
+        start = time.time()
+        with metrics.stage(path):
+            result = run_ffmpeg(cmd, cpus=slot_cpus(plan, self.slot))
+        return result, time.time() - start
+
+    def encode(self, ctx):
+        plan, local_in = ctx['plan'], ctx['local_in']
+
+        encodes = []
+        for m in ctx['members']:
+            job = m['job']
+            with tracing.continue_trace(m['trace']['traceparent']):
+                ok, copy_audio, reason = remux.can_remux(
+                    remux.source_probe(job, local_in), m['fmt'], m['resolution'], m['codec']
+                )
+                logger.info(f"Job {job['JobId']}: {'remux' if ok else 'encode'} ({reason})")
+                if not ok:
+                    encodes.append(m)
+                    continue
+                # source already matches the target: change container only
+                cmd = remux.remux_cmd(local_in, m['local_out'], m['fmt'], copy_audio)
+                result, duration = self._timed_ffmpeg('remux', cmd, plan)
+            m.update(path="remux", duration=duration, encode=presets.job_attributes(None, None, result.fps))
+        if not encodes:
+            return
+
+        lead = encodes[0]
+        with tracing.continue_trace(lead['trace']['traceparent']):
+            if len(encodes) == 1:
+                threads = plan['threads']
+                # slowest preset that still meets the job's deadline
+                lead['preset'], lead['predicted'], why = presets.choose_preset(
+                    lead['job'], lead['codec'], lead['resolution'], threads, backlog=ctx['backlog']
+                )
+                logger.info(f"Job {lead['job']['JobId']}: preset {lead['preset'] or 'default'} ({why})")
+                cmd = [
+                    "ffmpeg", "-y",
+                    "-analyzeduration", "10M", "-probesize", "20M",
+                    *decoder_thread_args(threads),
+                    "-i", local_in,
+                    "-vf", f"scale={lead['resolution']}",
+                    "-c:v", lead['codec'],
+                    *encoder_thread_args(lead['codec'], threads),
+                    *presets.preset_args(lead['codec'], lead['preset']),
+                    lead['local_out']
+                ]
+            else:
+                # one decode split across every job's encoder
+                for m, why in zip(encodes, fanout.choose_presets(encodes, plan['threads'], backlog=ctx['backlog'])):
+                    logger.info(f"Job {m['job']['JobId']}: preset {m['preset'] or 'default'} ({why})")
+                cmd = fanout.split_cmd(local_in, encodes, plan['threads'])
+            result, duration = self._timed_ffmpeg("encode", cmd, plan)
+        logger.info(f"Job {ctx['job']['JobId']} transcoded {len(encodes)} output(s) in {duration:.2f}s")
+
+        for m in encodes:
+            # speeds measured while sharing the cores with other encoders aren't learnt
+            presets.record_speed(m['codec'], m['resolution'], plan['threads'], m['preset'], m['predicted'], result.fps,
+                                 learn=len(encodes) == 1)
+            m.update(path="encode", duration=duration,
+                     encode=presets.job_attributes(m['preset'], m['predicted'], result.fps))
+
+    def upload(self, ctx):
+        for m in ctx['members']:
+            job_id = m['job']['JobId']
+            if m['heartbeat'].lost.is_set():
+                logger.warning(f"Job {job_id} was reclaimed by another worker; discarding output")
+                m['status'] = "LOST"
+                continue
+
+            output_key = f"{self.output_prefix}{os.path.basename(m['local_out'])}"
+            with tracing.continue_trace(m['trace']['traceparent']), metrics.stage('upload'):
+                metrics.upload_file(self.s3, m['local_out'], self.bucket, output_key)
+            m['status'] = self.complete(job_id, output_key, m['duration'], m['path'], m['encode'])
+            logger.info(f"Job {job_id} {m['status']}: s3://{self.bucket}/{output_key}")
+
+    def complete(self, job_id, output_key, duration, path, encode):
+        """
+        Mark a job COMPLETED with its OutputKey, DurationSeconds, Mode,
+        TranscodePath and Encode map, provided this worker still holds its
+        lease. Returns "COMPLETED", or "LOST" if the job was released or taken over.
+        """
+        try:
+            self.table.update_item(
+                Key={'JobId': job_id},
+                ConditionExpression="LeaseOwner = :me",
+                UpdateExpression="SET #s = :s, OutputKey = :o, DurationSeconds = :d, #mo = :m, "
+                                 "TranscodePath = :p, Encode = :e",
+                # Status and Mode are reserved words
+                ExpressionAttributeNames={"#s": "Status", "#mo": "Mode"},
+                ExpressionAttributeValues={
+                    ":me": leases.WORKER_ID,
+                    ":s": "COMPLETED",
+                    ":o": output_key,
+                    ":d": Decimal(str(duration)),
+                    ":m": self.mode,
+                    ":p": path,
+                    ":e": encode,
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.warning(f"Job {job_id} is no longer leased to this worker; not completing it")
+                return "LOST"
+            raise
+        return "COMPLETED"
+
+    def fail(self, ctx, error):
+        if isinstance(error, subprocess.CalledProcessError):
+            kind = "ffmpeg error"
+        elif isinstance(error, (BotoCoreError, ClientError)):
+            kind = "AWS error"
+        else:
+            kind = "Unexpected error"
+        for m in ctx['members']:
+            if m['status']:
+                # already completed (or lost) before the error
+                continue
+            job_id = m['job']['JobId']
+            m['status'] = leases.release_job(self.table, job_id, error)
+            logger.error(f"[{kind}] Job {job_id} {m['status']}: {error}")
+
+    def finish(self, ctx):
+        for m in ctx['members']:
+            m['heartbeat'].stop()
+            tracing.close_job(m['trace'], 'ok' if m['status'] == "COMPLETED" else 'error')
+            metrics.job_finished(m['status'])
+        scratch.release(ctx['job']['JobId'])